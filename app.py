@@ -3,6 +3,8 @@ from __future__ import annotations
 import os
 import sys
 import json
+import time
+import uuid
 from pathlib import Path
 from datetime import datetime, timezone
 
@@ -20,8 +22,18 @@ from schemas import (
     ClarificationAnswer,
     ClarifyingQuestion,
 )
-from pipeline import run_mvp
-from llm import OpenAILLM
+from pipeline import OUTPUT_SCHEMAS
+from llm import shared_llm
+from clients import default_client_registry
+from cache import ResponseCache, cached_llm
+from checkpoint import CheckpointStore, run_id_for
+from coalesce import default_coalescer
+from briefcache import BriefCache
+from ratelimit import default_rate_limiter, rate_context
+from background import default_background_runner
+
+# how often the page refreshes while a run is in progress
+_POLL_INTERVAL_S = 0.5
 
 
 def _load_secrets_into_env() -> None:
@@ -39,8 +51,31 @@ def _load_secrets_into_env() -> None:
 
 
 @st.cache_resource
-def _get_llm(model: str | None):
-    return OpenAILLM(model=model)
+def _get_response_cache() -> ResponseCache:
+    return ResponseCache()
+
+
+@st.cache_resource
+def _get_checkpoints() -> CheckpointStore:
+    return CheckpointStore()
+
+
+@st.cache_resource
+def _get_brief_cache() -> BriefCache:
+    return BriefCache()
+
+
+@st.cache_resource
+def _prewarm(model: str | None) -> None:
+    # once per model and process: connection + compiled schemas ready before the first Run
+    default_client_registry().prewarm(model=model, schemas=OUTPUT_SCHEMAS)
+
+
+@st.cache_resource
+def _get_llm(model: str | None, use_cache: bool = False):
+    _prewarm(model)
+    llm = shared_llm(model=model)
+    return cached_llm(llm, cache=_get_response_cache()) if use_cache else llm
 
 
 def _inject_css() -> None:
@@ -170,71 +205,208 @@ def _build_clarification_answers(questions: list[ClarifyingQuestion]) -> Clarifi
     return ClarificationAnswers(answers=answers)
 
 
-def _run_mvp_with_progress(
+def _render_live_event(slots: dict, ev, streamed: dict | None = None) -> None:
+    """
+    Render a partial result as soon as its stage event arrives (brief first, then each agent).
+    Item events (stream_items=True) grow the drafts item by item; `streamed` keeps them per slot.
+    """
+    if ev.type == "brief":
+        with slots["brief"].container():
+            st.markdown("**Brief (preview)**")
+            st.write(ev.brief.summary)
+            if ev.brief.hard_constraints:
+                st.caption("Hard constraints: " + "; ".join(ev.brief.hard_constraints))
+    elif ev.type == "agent_output":
+        with slots[ev.agent].container():
+            st.markdown(f"**{ev.agent.capitalize()} (draft, before critic)**")
+            for it in ev.items:
+                st.markdown(f"- {it.text}")
+    elif ev.type == "item" and streamed is not None:
+        # generator items fill their own bucket; critic/synthesizer items only show progress
+        slot = ev.bucket if ev.stage in ("alternatives", "preferences", "uncertainties", "generators") else "critic"
+        items = streamed.setdefault(slot, [])
+        items.append(ev.item)
+        with slots[slot].container():
+            if slot == "critic":
+                st.caption(f"Critic/synthesis: {len(items)} items reviewed so far...")
+            else:
+                st.markdown(f"**{slot.capitalize()} (streaming...)**")
+                for it in items:
+                    st.markdown(f"- {it.text}")
+    elif ev.type == "critic":
+        with slots["critic"].container():
+            st.caption(
+                f"Critic kept {len(ev.critic.alternatives)} alternatives, "
+                f"{len(ev.critic.preferences)} preferences, {len(ev.critic.uncertainties)} uncertainties."
+            )
+
+
+def _start_run(
     header_label: str,
+    kind: str,
+    info: dict,
     *,
     req: DecisionRequest,
     llm,
     use_questioner: bool,
     clarification_answers: ClarificationAnswers | None = None,
-):
+    parallel: bool = False,
+    synthesis: str = "llm",
+    generation: str = "split",
+    dedup: bool = False,
+    compact_prompts: bool = False,
+    trace: bool = True,
+    speculate: bool = False,
+    brief_cache: BriefCache | None = None,
+) -> None:
     """
-    Run pipeline with a stage-based progress bar + dynamic status text.
-
-    IMPORTANT:
-    This requires run_mvp(..., progress=cb) and the pipeline to invoke cb(stage, pct).
+    Submit the pipeline to the shared background runner and keep its handle in the session;
+    _poll_run() renders progress and partial results on each rerun, so the page stays
+    responsive (and cancellable) while the run is going.
+
+    Stage outputs are checkpointed per session and request: if a late stage fails or the run
+    is cancelled, clicking Run again resumes from the last completed stage instead of
+    regenerating everything. Identical runs started by other sessions while this one is in
+    flight share its execution (see coalesce.Coalescer).
     """
-    progress_bar = st.progress(0)
-    status_fn = getattr(st, "status", None)
-
-    status_box = status_fn(header_label, expanded=True) if status_fn is not None else None
-    fallback = st.empty() if status_box is None else None
-
-    last_stage = {"text": ""}
-
-    def cb(stage: str, pct: int) -> None:
-        pct_int = max(0, min(100, int(pct)))
-        progress_bar.progress(pct_int)
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
-        if status_box is not None:
-            status_box.update(label=stage, state="running", expanded=True)
-            if stage != last_stage["text"]:
-                status_box.write(stage)
-                last_stage["text"] = stage
-        else:
-            fallback.info(stage)
+    # a new run replaces the one still going in this session
+    prev = st.session_state.get("run_job")
+    if prev is not None:
+        prev["handle"].cancel("superseded")
 
-    try:
-        out = run_mvp(
+    # interactive priority + per-session fair share in the shared rate limiter (carried to the worker)
+    with rate_context(priority="interactive", session=st.session_state.session_id):
+        handle = default_background_runner().submit(
             req,
+            runner=default_coalescer().run,
             llm=llm,
             use_questioner=use_questioner,
             clarification_answers=clarification_answers,
-            progress=cb,
+            parallel=parallel,
+            synthesis=synthesis,
+            generation=generation,
+            dedup=dedup,
+            compact_prompts=compact_prompts,
+            trace=trace,
+            stream_items=True,
+            speculate=speculate,
+            checkpoint=_get_checkpoints(),
+            run_id=f"ui:{st.session_state.session_id}:{run_id_for(req, clarification_answers)}",
+            brief_cache=brief_cache,
         )
+    st.session_state.run_job = {"handle": handle, "label": header_label, "kind": kind, **info}
 
-        if getattr(out, "meta", None) is not None and out.meta.pending_clarification:
-            if status_box is not None:
-                status_box.update(
-                    label="Clarification needed — please answer the questions below.",
-                    state="complete",
-                    expanded=True,
-                )
+
+def _finish_run(job: dict, out) -> None:
+    """
+    Store a finished run's output (and clarification state) in the session.
+    """
+    if job["kind"] == "clarified":
+        # Ensure Q/A visible even if final output doesn't include them
+        out.meta.used_questioner = True
+        out.meta.clarifying_questions = job["questions"]
+        out.meta.clarification_answers = job["answers"]
+
+    st.session_state.last_output = out
+    st.session_state.last_run_meta = {
+        "model": job["model"],
+        "time": _fmt_time_utc(),
+        "n_alts": len(out.alternatives),
+        "n_prefs": len(out.preferences),
+        "n_uncs": len(out.uncertainties),
+        "use_questioner": job["use_questioner"],
+    }
+
+    if job["kind"] == "clarified":
+        st.session_state.last_clar_questions = job["questions"]
+        st.session_state.last_clar_answers = job["answers"]
+    # If pending clarification, store questions for panel/tab
+    elif out.meta.pending_clarification and out.meta.clarifying_questions:
+        st.session_state.pending_sig = job["sig"]
+        st.session_state.pending_questions = out.meta.clarifying_questions
+        st.session_state.last_clar_questions = out.meta.clarifying_questions
+        st.session_state.last_clar_answers = []
+        st.session_state.show_clar_panel = True  # auto open when pending
+
+
+def _poll_run() -> None:
+    """
+    Show the session's background run. While it is going, _run_panel() renders it as a
+    fragment that refreshes itself every _POLL_INTERVAL_S, so only the panel reruns, not the
+    whole page. Once it has finished, its output is stored and the page continues rendering it.
+    """
+    job = st.session_state.get("run_job")
+    if job is None:
+        return
+    handle = job["handle"]
+    _, status = handle.poll()
+
+    if handle.done:
+        st.session_state.run_job = None
+        if status == "cancelled":
+            st.warning("Run cancelled. Completed stages were saved; click **Run** again to resume.")
+        elif status == "failed":
+            st.error(f"Error: {handle.error}")
+            st.caption("Completed stages were saved. Click **Run** again to resume from where it stopped.")
         else:
-            if status_box is not None:
-                status_box.update(label="Done", state="complete", expanded=False)
-
-        return out
-
-    except Exception as e:
-        if status_box is not None:
-            status_box.update(label=f"Error: {e}", state="error", expanded=True)
-        raise
-    finally:
-        # Keep progress bar visible after completion (looks nicer).
-        # If you prefer to hide it, uncomment:
-        # progress_bar.empty()
-        pass
+            # Keep progress bar visible after completion (looks nicer).
+            st.progress(100)
+            _finish_run(job, handle.final)
+            if handle.final.meta.pending_clarification:
+                st.info("Clarification needed — please answer the questions below.")
+            else:
+                st.success("Done!")
+        return
+
+    if _live_run_panel is not None:
+        _live_run_panel()
+    else:
+        # Streamlit without fragments: refresh the whole page instead
+        _run_panel()
+        time.sleep(_POLL_INTERVAL_S)
+        st.rerun()
+
+
+def _run_panel() -> None:
+    """
+    A stage-based progress bar + dynamic status text, a Cancel button and the partial results
+    so far (brief, per-agent drafts). Polling is also what keeps the run alive: a run nobody
+    polls any more (tab closed) is stopped by the runner's idle timeout.
+    """
+    job = st.session_state.get("run_job")
+    if job is None:
+        return
+    handle = job["handle"]
+    events, _ = handle.poll()
+    if handle.done:
+        # full rerun: _poll_run() stores the result and the page renders it
+        st.rerun()
+
+    st.progress(max(0, min(100, int(handle.pct))))
+    status_fn = getattr(st, "status", None)
+    if status_fn is not None:
+        with status_fn(job["label"], expanded=True, state="running"):
+            st.write(handle.label)
+    else:
+        st.info(handle.label)
+
+    if st.button("Cancel", key="cancel_run"):
+        handle.cancel()
+        st.rerun()
+
+    streamed: dict = {}
+    live = st.container()
+    with live:
+        slots = {k: st.empty() for k in ("brief", "alternatives", "preferences", "uncertainties", "critic")}
+    for ev in events:
+        _render_live_event(slots, ev, streamed)
+
+
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+_live_run_panel = _fragment(run_every=_POLL_INTERVAL_S)(_run_panel) if _fragment is not None else None
 
 
 def main() -> None:
@@ -274,6 +446,50 @@ def main() -> None:
             value=False,
             help="When enabled, the system may ask clarifying questions before generating outputs.",
         )
+        speculate = st.checkbox(
+            "Draft while I answer",
+            value=False,
+            disabled=not use_questioner,
+            help="Start generating alternatives/preferences/uncertainties in the background while you "
+            "answer the clarifying questions; reused or revised once answers arrive.",
+        )
+
+        parallel = st.checkbox(
+            "Parallel generators",
+            value=False,
+            help="Run the alternatives, preferences and uncertainties agents concurrently.",
+        )
+        synthesis_labels = {
+            "LLM Synthesizer (full call)": "llm",
+            "Local + summary (1 small call)": "summary",
+            "Critic writes summary (no extra call)": "fused",
+            "Local only (no LLM call)": "local",
+        }
+        synthesis = synthesis_labels[
+            st.selectbox(
+                "Final synthesis",
+                options=list(synthesis_labels.keys()),
+                index=0,
+                help="Local modes assemble the final output from the critic's lists instead of re-generating it.",
+            )
+        ]
+        fused = st.checkbox(
+            "Single generator call",
+            value=False,
+            help="One call returns alternatives, preferences and uncertainties together: fewer requests and "
+            "input tokens, slightly less specialized prompts.",
+        )
+        generation = "fused" if fused else "split"
+        dedup = st.checkbox(
+            "Local de-duplication",
+            value=False,
+            help="Drop near-duplicate items before the critic (smaller, faster critic call).",
+        )
+        compact_prompts = st.checkbox(
+            "Compact prompts",
+            value=False,
+            help="Short item IDs, no provenance/null fields, per-stage input-token budgets.",
+        )
 
         st.markdown("---")
         st.markdown("### Quick start")
@@ -282,6 +498,54 @@ def main() -> None:
         with st.expander("Advanced", expanded=False):
             show_raw = st.checkbox("Show raw JSON tab", value=True)
             exclude_none = st.checkbox("Hide null fields in JSON", value=True)
+            use_cache = st.checkbox(
+                "Cache LLM responses",
+                value=False,
+                help="Reuse results for identical prompts (memory + on-disk SQLite).",
+            )
+            if use_cache:
+                cs = _get_response_cache().stats()
+                st.caption(
+                    f"Cache: {cs['memory_hits'] + cs['disk_hits']} hits • {cs['misses']} misses "
+                    f"• hit rate {cs['hit_rate']:.0%}"
+                )
+            use_brief_cache = st.checkbox(
+                "Reuse near-identical decisions",
+                value=False,
+                help="Reuse the results of an earlier decision with the same content (ignoring whitespace, "
+                "punctuation and sentence order); a similar one seeds the critic with its drafts.",
+            )
+            if use_brief_cache:
+                bs = _get_brief_cache().stats()
+                st.caption(
+                    f"Similar decisions: {bs['reuse_hits']} reused • {bs['seed_hits']} seeded • "
+                    f"{bs['misses']} new • hit rate {bs['hit_rate']:.0%} • lookup {bs['avg_lookup_ms']:.2f} ms"
+                )
+            rl = default_rate_limiter().stats()
+            inter = rl["by_priority"]["interactive"]
+            st.caption(
+                f"Rate limiter: queue {rl['queue_depth']} (max {rl['max_queue_depth']}) "
+                f"• avg wait {inter['avg_wait_s']:.2f}s • max wait {inter['max_wait_s']:.2f}s"
+            )
+            cr = default_client_registry().stats()
+            if cr["clients"]:
+                warm = f"{cr['last_prewarm_ms']:.0f} ms" if cr["last_prewarm_ms"] is not None else "pending"
+                st.caption(
+                    f"API clients: {cr['clients']} shared • pre-warm {warm} • "
+                    f"{cr['schemas_cached']} schemas compiled"
+                )
+            br = default_background_runner().stats()
+            if br["submitted"]:
+                st.caption(
+                    f"Background runs: {br['running']} running • {br['queued']} queued • "
+                    f"{br['cancelled']} cancelled • {br['abandoned']} abandoned"
+                )
+            co = default_coalescer().stats()
+            if co["joined"]:
+                st.caption(
+                    f"Shared runs: {co['joined']} joined an identical run in progress "
+                    f"• {co['llm_calls_saved']} LLM calls saved"
+                )
 
         st.markdown("---")
         st.caption("Deployment tip: keep your API key in Streamlit Secrets, not in code.")
@@ -385,37 +649,30 @@ def main() -> None:
                 del st.session_state[k]
 
         try:
-            llm = _get_llm(model.strip() or None)
+            llm = _get_llm(model.strip() or None, use_cache)
             req = DecisionRequest(title=title.strip(), narrative=narrative.strip())
 
-            out = _run_mvp_with_progress(
+            _start_run(
                 "Running pipeline...",
+                "run",
+                {
+                    "model": model.strip() or default_model,
+                    "use_questioner": use_questioner,
+                    "sig": _req_signature(req.title, req.narrative),
+                },
                 req=req,
                 llm=llm,
                 use_questioner=use_questioner,
                 clarification_answers=None,
+                parallel=parallel,
+                synthesis=synthesis,
+                generation=generation,
+                dedup=dedup,
+                compact_prompts=compact_prompts,
+                speculate=use_questioner and speculate,
+                brief_cache=_get_brief_cache() if use_brief_cache else None,
             )
 
-            st.session_state.last_output = out
-            st.session_state.last_run_meta = {
-                "model": model.strip() or default_model,
-                "time": _fmt_time_utc(),
-                "n_alts": len(out.alternatives),
-                "n_prefs": len(out.preferences),
-                "n_uncs": len(out.uncertainties),
-                "use_questioner": use_questioner,
-            }
-
-            # If pending clarification, store questions for panel/tab
-            if out.meta.pending_clarification and out.meta.clarifying_questions:
-                st.session_state.pending_sig = _req_signature(req.title, req.narrative)
-                st.session_state.pending_questions = out.meta.clarifying_questions
-                st.session_state.last_clar_questions = out.meta.clarifying_questions
-                st.session_state.last_clar_answers = []
-                st.session_state.show_clar_panel = True  # auto open when pending
-
-            st.success("Done!")
-
         except Exception as e:
             st.error(f"Error: {e}")
 
@@ -423,44 +680,40 @@ def main() -> None:
     if st.session_state.clar_run_requested and st.session_state.clar_run_payload:
         payload = st.session_state.clar_run_payload
 
-        llm = _get_llm((payload.get("model") or os.getenv("OPENAI_MODEL", "gpt-5-mini")).strip() or None)
+        llm = _get_llm((payload.get("model") or os.getenv("OPENAI_MODEL", "gpt-5-mini")).strip() or None, use_cache)
         req2 = DecisionRequest(title=payload["title"], narrative=payload["narrative"])
 
         clar = ClarificationAnswers.model_validate(payload["answers"])
         qs = [ClarifyingQuestion.model_validate(x) for x in payload["questions"]]
 
-        out2 = _run_mvp_with_progress(
+        # Cleanup first: the run continues in the background across reruns
+        st.session_state.clar_run_requested = False
+        st.session_state.clar_run_payload = None
+        st.session_state.show_clar_panel = False
+
+        _start_run(
             "Running pipeline with clarification answers...",
+            "clarified",
+            {
+                "model": payload.get("model") or os.getenv("OPENAI_MODEL", "gpt-5-mini"),
+                "use_questioner": True,
+                "questions": qs,
+                "answers": clar.answers,
+            },
             req=req2,
             llm=llm,
             use_questioner=True,
             clarification_answers=clar,
+            parallel=parallel,
+            synthesis=synthesis,
+            generation=generation,
+            dedup=dedup,
+            compact_prompts=compact_prompts,
+            speculate=speculate,
+            brief_cache=_get_brief_cache() if use_brief_cache else None,
         )
 
-        # Ensure Q/A visible even if final output doesn't include them
-        out2.meta.used_questioner = True
-        out2.meta.clarifying_questions = qs
-        out2.meta.clarification_answers = clar.answers
-
-        st.session_state.last_output = out2
-        st.session_state.last_run_meta = {
-            "model": payload.get("model") or os.getenv("OPENAI_MODEL", "gpt-5-mini"),
-            "time": _fmt_time_utc(),
-            "n_alts": len(out2.alternatives),
-            "n_prefs": len(out2.preferences),
-            "n_uncs": len(out2.uncertainties),
-            "use_questioner": True,
-        }
-
-        st.session_state.last_clar_questions = qs
-        st.session_state.last_clar_answers = clar.answers
-
-        # Cleanup
-        st.session_state.clar_run_requested = False
-        st.session_state.clar_run_payload = None
-        st.session_state.show_clar_panel = False
-
-        st.success("Done!")
+    _poll_run()
 
     out = st.session_state.last_output
     meta = st.session_state.last_run_meta
@@ -549,6 +802,11 @@ def main() -> None:
 
     if meta:
         st.caption(f"Last run: {meta['time']} • Questioner: {'ON' if meta.get('use_questioner') else 'OFF'}")
+    if out.meta.speculation:
+        st.caption(
+            "Alternatives/preferences/uncertainties were drafted while you answered "
+            + ("and reused as-is." if out.meta.speculation == "reused" else "and revised by the critic.")
+        )
 
     # Tabs
     base_tabs = [
@@ -560,6 +818,8 @@ def main() -> None:
         "Uncertainties",
         "Critic",
     ]
+    if out.meta.trace:
+        base_tabs.append("Timing")
     if show_raw:
         base_tabs.append("Raw JSON")
     tabs = st.tabs(base_tabs)
@@ -659,6 +919,63 @@ def main() -> None:
         else:
             st.markdown('<span class="adq-muted">No critic notes.</span>', unsafe_allow_html=True)
 
+        if out.meta.dedup_removed:
+            st.markdown("**Removed as near-duplicates (before critic)**")
+            for d in out.meta.dedup_removed:
+                st.markdown(f"- ~~{d.removed_text}~~ ≈ {d.kept_text} ({d.similarity:.0%})")
+
+    if out.meta.prompt_stats:
+        with tabs[6]:
+            st.markdown("**Prompt size (estimated input tokens)**")
+            st.table(
+                [
+                    {
+                        "stage": p.stage,
+                        "before": p.tokens_before,
+                        "after": p.tokens_after,
+                        "budget": p.budget,
+                        "truncated": p.truncated,
+                    }
+                    for p in out.meta.prompt_stats
+                ]
+            )
+
+    # Timing
+    if out.meta.trace:
+        with tabs[base_tabs.index("Timing")]:
+            st.subheader("Timing")
+            run = out.meta.trace[0]
+            t1, t2, t3, t4 = st.columns(4)
+            t1.metric("Wall time", f"{run.wall_s:.2f}s")
+            t2.metric("Rate-limit queue", f"{run.queue_s:.2f}s")
+            t3.metric("Tokens in / out", f"{run.input_tokens} / {run.output_tokens}")
+            t4.metric("Retries", run.retries)
+
+            stages = [s for s in out.meta.trace if s.kind == "stage"]
+            if stages:
+                st.markdown("**Stages**")
+                st.bar_chart({s.name: s.wall_s for s in stages})
+
+            st.markdown("**Spans**")
+            names = {s.id: s.name for s in out.meta.trace}
+            st.table(
+                [
+                    {
+                        "span": s.name,
+                        "parent": names.get(s.parent_id, "") if s.parent_id is not None else "",
+                        "start_s": round(s.start_s, 3),
+                        "wall_s": round(s.wall_s, 3),
+                        "queue_s": round(s.queue_s, 3),
+                        "in_tok": s.input_tokens,
+                        "out_tok": s.output_tokens,
+                        "cached": s.cached_tokens,
+                        "retries": s.retries,
+                        "error": s.error or "",
+                    }
+                    for s in out.meta.trace[1:]
+                ]
+            )
+
     # Raw JSON
     if show_raw:
         with tabs[-1]:
@@ -0,0 +1,310 @@
+"""
+Offline pipeline benchmarks driven by the latency-simulating stub LLM (src/stub_llm.py).
+
+  python bench/run_bench.py                                   # all modes, default latency
+  python bench/run_bench.py --modes parallel async --requests 200 --concurrency 32
+  python bench/run_bench.py --latency lognormal:0.8,0.5 --model_latency CriticOutput=lognormal:3,0.4
+  python bench/run_bench.py --out bench.json                  # save results
+  python bench/run_bench.py --baseline bench.json             # exit 1 on regression
+  python bench/run_bench.py --cassette run.jsonl --latency_scale 1   # replay recorded responses
+
+Reports, per execution mode, p50/p95/p99 end-to-end latency and throughput at the given
+concurrency, then the local (non-model) overhead of run_mvp / complete_and_validate /
+Pydantic validation measured with a zero-latency stub.
+"""
+from __future__ import annotations
+
+import json
+import time
+import random
+import asyncio
+import argparse
+import sys
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC = ROOT / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from schemas import DecisionRequest
+from pipeline import run_mvp, arun_mvp
+from utils import complete_and_validate
+from repair import default_repair_stats
+from cassette import Cassette, replay_llm
+from stub_llm import DEFAULT_ROUTES, StubLLM, StubJSONLLM, AsyncStubLLM, AsyncStubJSONLLM, sample_payload
+
+MODES = ("sequential", "parallel", "async")
+_NARRATIVE = (
+    "I have two job offers and need to decide by Friday. One pays more but has a long commute; "
+    "the other is remote with a smaller team. My partner may relocate next year."
+)
+
+
+def _percentile(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    s = sorted(xs)
+    k = min(len(s) - 1, max(0, int(round(q / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+def _latency_summary(xs: List[float]) -> Dict[str, float]:
+    return {
+        "p50_s": round(_percentile(xs, 50), 4),
+        "p95_s": round(_percentile(xs, 95), 4),
+        "p99_s": round(_percentile(xs, 99), 4),
+        "mean_s": round(sum(xs) / len(xs), 4) if xs else 0.0,
+    }
+
+
+def _requests(n: int) -> List[DecisionRequest]:
+    # distinct titles so caching/coalescing layers (if any) don't short-circuit the run
+    return [DecisionRequest(title=f"Decision {i}", narrative=_NARRATIVE) for i in range(n)]
+
+
+def _stub_kwargs(args) -> Dict[str, Any]:
+    return {
+        "latency": args.latency,
+        "per_model_latency": dict(x.split("=", 1) for x in args.model_latency),
+        "failure_rate": args.failure_rate,
+        "invalid_json_rate": args.invalid_json_rate,
+        "invalid_item_rate": args.invalid_item_rate,
+        "n_items": args.n_items,
+        "seed": args.seed,
+    }
+
+
+def _pipeline_kwargs(args) -> Dict[str, Any]:
+    return {
+        "synthesis": args.synthesis,
+        "generation": args.generation,
+        "dedup": args.dedup,
+        "compact_prompts": args.compact_prompts,
+    }
+
+
+def _make_llm(args, asynchronous: bool) -> Any:
+    if args.cassette:
+        # match on schema only: the benchmark's requests differ from the recorded ones
+        cassette = Cassette(args.cassette, match="schema")
+        return replay_llm(cassette, latency_scale=args.latency_scale, asynchronous=asynchronous)
+    if asynchronous:
+        return (AsyncStubJSONLLM if args.json_mode else AsyncStubLLM)(**_stub_kwargs(args))
+    return (StubJSONLLM if args.json_mode else StubLLM)(**_stub_kwargs(args))
+
+
+def bench_mode(mode: str, args) -> Dict[str, Any]:
+    """
+    Run args.requests pipelines at args.concurrency in one execution mode; returns latency
+    percentiles, throughput, stub call stats and validation-repair counters.
+    """
+    reqs = _requests(args.requests)
+    default_repair_stats().reset()
+    latencies: List[float] = []
+    errors = 0
+
+    if mode == "async":
+        stub = _make_llm(args, asynchronous=True)
+
+        async def main() -> None:
+            nonlocal errors
+            sem = asyncio.Semaphore(args.concurrency)
+
+            async def one(req: DecisionRequest) -> None:
+                nonlocal errors
+                async with sem:
+                    t0 = time.perf_counter()
+                    try:
+                        await arun_mvp(req, llm=stub, **_pipeline_kwargs(args))
+                        latencies.append(time.perf_counter() - t0)
+                    except Exception:
+                        errors += 1
+
+            await asyncio.gather(*(one(r) for r in reqs))
+
+        t_start = time.perf_counter()
+        asyncio.run(main())
+    else:
+        stub = _make_llm(args, asynchronous=False)
+        opts = dict(_pipeline_kwargs(args), parallel=(mode == "parallel"))
+
+        def one(req: DecisionRequest) -> None:
+            nonlocal errors
+            t0 = time.perf_counter()
+            try:
+                run_mvp(req, llm=stub, **opts)
+                latencies.append(time.perf_counter() - t0)
+            except Exception:
+                errors += 1
+
+        t_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(one, reqs))
+
+    wall = time.perf_counter() - t_start
+    return {
+        "mode": mode,
+        "requests": len(reqs),
+        "concurrency": args.concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_per_min": round(60.0 * len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "latency": _latency_summary(latencies),
+        "stub": stub.cassette.stats() if args.cassette else stub.stats(),
+        "repair": default_repair_stats().stats(),
+    }
+
+
+def _time_per_call(fn: Callable[[], Any], n: int) -> Dict[str, float]:
+    xs = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        xs.append(time.perf_counter() - t0)
+    return {"p50_ms": round(1000 * _percentile(xs, 50), 4), "p95_ms": round(1000 * _percentile(xs, 95), 4)}
+
+
+def bench_local_overhead(args) -> Dict[str, Any]:
+    """
+    Local CPU cost with model time removed (zero-latency stub): whole run_mvp, one
+    complete_and_validate call per path, and Pydantic validation alone per schema. stub_payload
+    is the stub's own fixture generation, included in the other numbers and listed so it can
+    be subtracted.
+    """
+    n = args.overhead_iters
+    req = _requests(1)[0]
+    kw = dict(n_items=args.n_items, seed=args.seed, latency=0.0)
+    structured, json_only = StubLLM(**kw), StubJSONLLM(**kw)
+    rng = random.Random(args.seed)
+
+    out: Dict[str, Any] = {
+        "run_mvp": _time_per_call(lambda: run_mvp(req, llm=structured, **_pipeline_kwargs(args)), n),
+        "complete_and_validate": {},
+        "model_validate": {},
+        "model_validate_json": {},
+        "stub_payload": {},
+    }
+    for needle, cls in DEFAULT_ROUTES:
+        name = cls.__name__
+        system = f"{needle}\nReturn JSON ONLY."
+        payload = sample_payload(cls, rng, args.n_items)
+        raw = json.dumps(payload)
+        out["complete_and_validate"][name] = {
+            "structured": _time_per_call(lambda: complete_and_validate(structured, system, "{}", cls), n),
+            "json": _time_per_call(lambda: complete_and_validate(json_only, system, "{}", cls), n),
+        }
+        out["model_validate"][name] = _time_per_call(lambda: cls.model_validate(payload), n)
+        out["model_validate_json"][name] = _time_per_call(lambda: cls.model_validate_json(raw), n)
+        out["stub_payload"][name] = _time_per_call(lambda: sample_payload(cls, rng, args.n_items), n)
+    return out
+
+
+def _print_report(results: Dict[str, Any]) -> None:
+    print(f"{'mode':<11} {'ok':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'thru/min':>9}")
+    for r in results["modes"]:
+        lat = r["latency"]
+        print(
+            f"{r['mode']:<11} {r['ok']:>5} {r['errors']:>4} {lat['p50_s']:>7.3f}s {lat['p95_s']:>7.3f}s "
+            f"{lat['p99_s']:>7.3f}s {r['throughput_per_min']:>9.1f}"
+        )
+    for r in results["modes"]:
+        rp = r["repair"]
+        if rp["failed"]:
+            print(
+                f"{r['mode']:<11} repair: {rp['failed']} invalid outputs, {rp['repair_calls']} repair calls, "
+                f"{rp['full_retries']} full retries, {rp['exhausted']} exhausted, "
+                f"{rp['items_kept']} items / ~{rp['kept_tokens']} tokens kept"
+            )
+    ov = results.get("overhead")
+    if ov:
+        print(f"\nlocal overhead (zero-latency stub, p50): run_mvp {ov['run_mvp']['p50_ms']:.2f} ms/run")
+        print(f"{'schema':<20} {'c&v struct':>11} {'c&v json':>9} {'validate':>9} {'val_json':>9} {'stub':>7}  (ms)")
+        for name, cv in ov["complete_and_validate"].items():
+            print(
+                f"{name:<20} {cv['structured']['p50_ms']:>11.3f} {cv['json']['p50_ms']:>9.3f} "
+                f"{ov['model_validate'][name]['p50_ms']:>9.3f} {ov['model_validate_json'][name]['p50_ms']:>9.3f} "
+                f"{ov['stub_payload'][name]['p50_ms']:>7.3f}"
+            )
+
+
+def _regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compare p50/p95 latency, throughput and run_mvp overhead against a saved run.
+    """
+    msgs = []
+    base_modes = {r["mode"]: r for r in baseline.get("modes", [])}
+    for r in results["modes"]:
+        b = base_modes.get(r["mode"])
+        if not b:
+            continue
+        for key in ("p50_s", "p95_s"):
+            if b["latency"][key] > 0 and r["latency"][key] > b["latency"][key] * (1 + tolerance):
+                msgs.append(f"{r['mode']} {key}: {b['latency'][key]} -> {r['latency'][key]}")
+        if r["throughput_per_min"] < b["throughput_per_min"] * (1 - tolerance):
+            msgs.append(f"{r['mode']} throughput_per_min: {b['throughput_per_min']} -> {r['throughput_per_min']}")
+    if "overhead" in results and "overhead" in baseline:
+        b, c = baseline["overhead"]["run_mvp"]["p50_ms"], results["overhead"]["run_mvp"]["p50_ms"]
+        if b > 0 and c > b * (1 + tolerance):
+            msgs.append(f"run_mvp overhead p50_ms: {b} -> {c}")
+    return msgs
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the decision pipeline against a stub LLM.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=str, default="lognormal:0.3,0.5", help="Default per-call latency distribution")
+    parser.add_argument(
+        "--model_latency",
+        action="append",
+        default=[],
+        metavar="SCHEMA=SPEC",
+        help="Per-schema latency override, e.g. CriticOutput=lognormal:1.2,0.4 (repeatable)",
+    )
+    parser.add_argument("--cassette", type=str, default=None, help="Replay a recorded cassette instead of the stub")
+    parser.add_argument("--latency_scale", type=float, default=1.0, help="Scale for recorded latencies with --cassette")
+    parser.add_argument("--failure_rate", type=float, default=0.0)
+    parser.add_argument("--invalid_json_rate", type=float, default=0.0)
+    parser.add_argument("--invalid_item_rate", type=float, default=0.0, help="Share of JSON responses with one invalid item")
+    parser.add_argument("--json_mode", action="store_true", help="Stub implements complete() only (parse/retry path)")
+    parser.add_argument("--n_items", type=int, default=5, help="Items per list in stub responses")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--synthesis", choices=["llm", "local", "summary", "fused"], default="llm")
+    parser.add_argument("--generation", choices=["split", "fused"], default="split")
+    parser.add_argument("--dedup", action="store_true")
+    parser.add_argument("--compact_prompts", action="store_true")
+    parser.add_argument("--overhead_iters", type=int, default=200)
+    parser.add_argument("--skip_overhead", action="store_true")
+    parser.add_argument("--out", type=str, default=None, help="Write results as JSON")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare against a saved --out file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs baseline")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Any] = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "modes": [bench_mode(m, args) for m in args.modes],
+    }
+    if not args.skip_overhead:
+        results["overhead"] = bench_local_overhead(args)
+
+    _print_report(results)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        msgs = _regressions(results, baseline, args.tolerance)
+        if msgs:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(msgs), file=sys.stderr)
+            return 1
+        print("\nNo regressions vs baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
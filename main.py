@@ -9,45 +9,318 @@ if SRC.exists() and str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
 from schemas import DecisionRequest, ClarificationAnswers, ClarificationAnswer
-from pipeline import run_mvp
+from pipeline import OUTPUT_SCHEMAS, run_mvp, run_mvp_stream
+from llm import shared_llm
+from clients import default_client_registry
+from cache import ResponseCache, DEFAULT_CACHE_PATH, cached_llm
+from batch import completed_ids, read_records, run_batch
+from checkpoint import CheckpointStore, DEFAULT_CHECKPOINT_PATH
+from coalesce import Coalescer
+from briefcache import BriefCache, DEFAULT_BRIEF_CACHE_PATH
+from service import JobManager, serve
+from stub_llm import StubLLM
+from tracing import export_jsonl
+from cassette import Cassette, record_llm, replay_llm
 
 
-def _ask_answers_interactively(questions) -> ClarificationAnswers:
-    print("\n=== Clarifying Questions ===")
+def _ask_answers_interactively(questions, out=sys.stdout) -> ClarificationAnswers:
+    print("\n=== Clarifying Questions ===", file=out)
     answers = []
     for q in questions:
-        print(f"\n[{q.id}] ({q.category}) {q.question}")
+        print(f"\n[{q.id}] ({q.category}) {q.question}", file=out)
         if q.options:
-            print("Options:", " | ".join(q.options))
-        ans = input("Your answer: ").strip()
+            print("Options:", " | ".join(q.options), file=out)
+        print("Your answer: ", end="", file=out, flush=True)
+        ans = input().strip()
         if ans:
             answers.append(ClarificationAnswer(question_id=q.id, answer=ans))
     return ClarificationAnswers(answers=answers)
 
 
+def _run_ndjson(req: DecisionRequest, **kwargs):
+    """
+    Stream pipeline events to stdout as NDJSON (one event per line) and return the final output.
+    """
+    final = None
+    for ev in run_mvp_stream(req, **kwargs):
+        print(ev.model_dump_json(), flush=True)
+        if ev.type == "final":
+            final = ev.final
+    return final
+
+
+def _add_pipeline_args(parser: argparse.ArgumentParser, suppress: bool = False) -> None:
+    """
+    Pipeline options shared by the single-run mode and the subcommands. Subcommands register
+    them with suppress=True (no defaults), so options given before the subcommand name are
+    kept unless repeated after it.
+    """
+
+    def add(*flags, **kw) -> None:
+        if suppress:
+            kw["default"] = argparse.SUPPRESS
+        parser.add_argument(*flags, **kw)
+
+    add("--parallel", action="store_true", help="Run the three generator agents concurrently")
+    add("--max_workers", type=int, default=3, help="Worker pool width for --parallel")
+    add(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_CACHE_PATH,
+        default=None,
+        help="Cache LLM responses in a SQLite file (default path if no value given)",
+    )
+    add(
+        "--synthesis",
+        choices=["llm", "local", "summary", "fused"],
+        default="llm",
+        help="How to build the final output: LLM Synthesizer, local assembly, local + summary call, "
+        "or local assembly with the summary written by the critic call",
+    )
+    add(
+        "--generation",
+        choices=["split", "fused"],
+        default="split",
+        help="Three specialized generator calls, or one fused call returning all three lists",
+    )
+    add("--dedup", action="store_true", help="Drop near-duplicate items locally before the critic")
+    add(
+        "--compact_prompts",
+        action="store_true",
+        help="Use compact prompt encodings with per-stage input-token budgets",
+    )
+    add(
+        "--trace",
+        type=str,
+        default=None,
+        help="Record per-stage/per-LLM-call spans and append them to this JSONL file",
+    )
+    add(
+        "--stream_items",
+        action="store_true",
+        help="Stream LLM responses and emit each item as it arrives (item events with --ndjson)",
+    )
+    add(
+        "--speculate",
+        action="store_true",
+        help="With --use_questioner, draft generator outputs in the background while answers are typed",
+    )
+    add(
+        "--prewarm",
+        action="store_true",
+        help="Open the API connection and compile output schemas in the background at startup",
+    )
+    add(
+        "--brief_cache",
+        nargs="?",
+        const=DEFAULT_BRIEF_CACHE_PATH,
+        default=None,
+        help="Reuse briefs and stage outputs of earlier decisions with the same words in the same order "
+        "(up to whitespace, punctuation, casing and the order of whole sentences) from this SQLite file "
+        "(default path if no value given)",
+    )
+    add(
+        "--brief_seed_threshold",
+        type=float,
+        default=0.7,
+        help="Similarity at which --brief_cache offers generator outputs of a similar decision as drafts",
+    )
+    add("--record", type=str, default=None, help="Append every LLM request/response to this cassette")
+    add("--replay", type=str, default=None, help="Serve LLM calls from this cassette (no network)")
+    add(
+        "--replay_match",
+        choices=["exact", "normalized", "schema"],
+        default="exact",
+        help="How --replay matches requests to recordings",
+    )
+    add(
+        "--replay_latency",
+        type=float,
+        default=0.0,
+        help="Replay recorded latencies scaled by this factor (0 = instant, 1 = original)",
+    )
+
+
+def _pipeline_opts(args) -> dict:
+    return {
+        "parallel": args.parallel,
+        "max_workers": args.max_workers,
+        "synthesis": args.synthesis,
+        "generation": args.generation,
+        "dedup": args.dedup,
+        "compact_prompts": args.compact_prompts,
+        "trace": bool(args.trace),
+        "stream_items": args.stream_items,
+        "speculate": args.speculate,
+        "brief_cache": _brief_cache(args),
+    }
+
+
+def _brief_cache(args):
+    if not args.brief_cache:
+        return None
+    return BriefCache(
+        path=args.brief_cache,
+        seed_threshold=args.brief_seed_threshold,
+    )
+
+
+def _export_trace(args, out) -> None:
+    if args.trace and out is not None and out.meta.trace:
+        with open(args.trace, "a", encoding="utf-8") as f:
+            export_jsonl(out.meta.trace, f, decision_title=out.decision_title)
+
+
+def _make_llm(args, shared: bool = False):
+    if args.replay:
+        return replay_llm(Cassette(args.replay, match=args.replay_match), latency_scale=args.replay_latency)
+    llm = None
+    if args.cache:
+        llm = cached_llm(shared_llm(), cache=ResponseCache(path=args.cache))
+    if args.record:
+        llm = record_llm(llm or shared_llm(), Cassette(args.record))
+    if llm is None and shared:
+        llm = shared_llm()
+    return llm
+
+
+def _run_batch(args) -> None:
+    skip = set() if args.no_resume else completed_ids(args.output)
+    if skip:
+        print(f"Resuming: {len(skip)} completed IDs in {args.output} will be skipped.", file=sys.stderr)
+
+    llm = _make_llm(args, shared=True)
+    checkpoint = None if args.no_checkpoints else CheckpointStore(path=args.checkpoints)
+    coalescer = None if args.no_coalesce else Coalescer()
+    opts = _pipeline_opts(args)
+    src = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    trace_out = open(args.trace, "a", encoding="utf-8") if args.trace else None
+    items_out = open(args.items_out, "a", encoding="utf-8") if args.items_out else None
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            summary = run_batch(
+                read_records(src),
+                out,
+                llm=llm,
+                concurrency=args.concurrency,
+                skip_ids=skip,
+                trace_out=trace_out,
+                items_out=items_out,
+                checkpoint=checkpoint,
+                coalescer=coalescer,
+                **opts,
+            )
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if trace_out is not None:
+            trace_out.close()
+        if items_out is not None:
+            items_out.close()
+
+    report = summary.as_dict()
+    if coalescer is not None:
+        report["coalesced"] = coalescer.stats()
+    if opts["brief_cache"] is not None:
+        report["brief_cache"] = opts["brief_cache"].stats()
+    if checkpoint is not None:
+        report["checkpoints"] = checkpoint.stats()
+        checkpoint.close()
+    print(json.dumps(report, indent=2), file=sys.stderr)
+
+
+def _serve(args) -> None:
+    llm = StubLLM(latency=args.stub_latency) if args.stub else _make_llm(args, shared=True)
+    defaults = {k: v for k, v in _pipeline_opts(args).items() if k != "max_workers"}
+    manager = JobManager(llm=llm, workers=args.workers, max_queue=args.max_queue, max_workers=args.max_workers, **defaults)
+    print(f"Serving on http://{args.host}:{args.port} ({args.workers} workers)", file=sys.stderr)
+    serve(manager, host=args.host, port=args.port)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--title", type=str, default="")
     parser.add_argument("--narrative", type=str, default="")
     parser.add_argument("--use_questioner", action="store_true", help="Enable Questioner clarification stage")
+    parser.add_argument("--ndjson", action="store_true", help="Stream stage events to stdout as NDJSON")
+    _add_pipeline_args(parser)
+
+    sub = parser.add_subparsers(dest="command")
+    bp = sub.add_parser("batch", help="Run DecisionRequest records from a JSONL file (or stdin) in bulk")
+    bp.add_argument("--input", type=str, default="-", help="Input JSONL of {id?, title, narrative} ('-' = stdin)")
+    bp.add_argument("--output", type=str, required=True, help="Output JSONL; one result line per input record")
+    bp.add_argument("--concurrency", type=int, default=4, help="Decisions in flight at once")
+    bp.add_argument("--no_resume", action="store_true", help="Do not skip IDs already completed in --output")
+    bp.add_argument(
+        "--items_out",
+        type=str,
+        default=None,
+        help="Append every item to this JSONL as soon as it is streamed (implies --stream_items)",
+    )
+    bp.add_argument(
+        "--checkpoints",
+        type=str,
+        default=DEFAULT_CHECKPOINT_PATH,
+        help="SQLite file for per-stage checkpoints; failed records resume from their last completed stage",
+    )
+    bp.add_argument("--no_checkpoints", action="store_true", help="Do not checkpoint stage outputs")
+    bp.add_argument(
+        "--no_coalesce",
+        action="store_true",
+        help="Run duplicate records independently instead of sharing one in-flight run",
+    )
+    _add_pipeline_args(bp, suppress=True)
+
+    sp = sub.add_parser("serve", help="Run an HTTP job service around the pipeline")
+    sp.add_argument("--host", type=str, default="127.0.0.1")
+    sp.add_argument("--port", type=int, default=8080)
+    sp.add_argument("--workers", type=int, default=4, help="Jobs run concurrently")
+    sp.add_argument("--max_queue", type=int, default=1000, help="Queued jobs before new ones get 503")
+    sp.add_argument("--stub", action="store_true", help="Serve with the offline stub LLM (no API key needed)")
+    sp.add_argument("--stub_latency", type=str, default="lognormal:0.3,0.5", help="Stub per-call latency distribution")
+    _add_pipeline_args(sp, suppress=True)
+
     args = parser.parse_args()
+    if args.prewarm and not args.replay:
+        # overlaps with reading the input / typing the title
+        default_client_registry().prewarm(schemas=OUTPUT_SCHEMAS)
+
+    if args.command == "batch":
+        _run_batch(args)
+        return
+    if args.command == "serve":
+        _serve(args)
+        return
 
     title = args.title.strip() or input("Decision title: ").strip()
     narrative = args.narrative.strip() or input("Decision narrative: ").strip()
 
     req = DecisionRequest(title=title, narrative=narrative)
+    opts = {"llm": _make_llm(args), **_pipeline_opts(args)}
+
+    if args.ndjson:
+        # questions/prompts go to stderr so stdout stays pure NDJSON
+        out1 = _run_ndjson(req, use_questioner=args.use_questioner, **opts)
+        _export_trace(args, out1)
+        if out1 is not None and out1.meta.pending_clarification and out1.meta.clarifying_questions:
+            clar = _ask_answers_interactively(out1.meta.clarifying_questions, out=sys.stderr)
+            _export_trace(args, _run_ndjson(req, use_questioner=True, clarification_answers=clar, **opts))
+        return
 
     if not args.use_questioner:
-        out = run_mvp(req)
+        out = run_mvp(req, **opts)
+        _export_trace(args, out)
         print(json.dumps(out.model_dump(), ensure_ascii=False, indent=2))
         return
 
     # Phase 1: get questions
-    out1 = run_mvp(req, use_questioner=True)
+    out1 = run_mvp(req, use_questioner=True, **opts)
+    _export_trace(args, out1)
 
     if out1.meta.pending_clarification and out1.meta.clarifying_questions:
         clar = _ask_answers_interactively(out1.meta.clarifying_questions)
-        out2 = run_mvp(req, use_questioner=True, clarification_answers=clar)
+        out2 = run_mvp(req, use_questioner=True, clarification_answers=clar, **opts)
+        _export_trace(args, out2)
         print(json.dumps(out2.model_dump(), ensure_ascii=False, indent=2))
     else:
         # If no clarification needed, out1 is already a full result (or at least not pending)
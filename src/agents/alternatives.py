@@ -1,15 +1,20 @@
 from __future__ import annotations
 
-from llm import LLM
-from schemas import DecisionBrief, AlternativesOutput
-from utils import complete_and_validate
+from typing import List
+from llm import LLM, AsyncLLM
+from schemas import DecisionBrief, AlternativesOutput, PromptStats
+from utils import complete_and_validate, acomplete_and_validate, estimate_tokens
+from compact import brief_prompt, prompt_stats
 
 
 class AlternativesAgent:
-    def __init__(self, llm: LLM):
+    def __init__(self, llm: LLM | AsyncLLM, compact: bool = False, budget: int | None = None):
         self.llm = llm
+        self.compact = compact
+        self.budget = budget
+        self.prompt_stats: List[PromptStats] = []
 
-    def run(self, brief: DecisionBrief, iteration: int = 0) -> AlternativesOutput:
+    def _prompt(self, brief: DecisionBrief) -> tuple[str, str]:
         system = (
             "You are the Alternatives Agent.\n"
             "Generate actionable, mutually distinguishable alternatives.\n"
@@ -27,15 +32,15 @@ class AlternativesAgent:
             f"SOFT_PREFERENCES: {brief.soft_preferences}\n"
             "Return 5-8 alternatives.\n"
         )
+        if not self.compact:
+            return system, user
 
-        out = complete_and_validate(
-            llm=self.llm,
-            system=system,
-            user_json=user,
-            model_cls=AlternativesOutput,
-            retries=2,
-        )
+        room = self.budget - estimate_tokens(system) if self.budget is not None else None
+        compact_user, truncated = brief_prompt(brief, "Return 5-8 alternatives.\n", room)
+        self.prompt_stats.append(prompt_stats("alternatives", system, user, compact_user, self.budget, truncated))
+        return system, compact_user
 
+    def _harden(self, out: AlternativesOutput, iteration: int) -> AlternativesOutput:
         # harden provenance/type
         for item in out.alternatives:
             item.type = "alternative"
@@ -43,3 +48,25 @@ class AlternativesAgent:
             item.provenance.iteration = iteration
 
         return out
+
+    def run(self, brief: DecisionBrief, iteration: int = 0) -> AlternativesOutput:
+        system, user = self._prompt(brief)
+        out = complete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=AlternativesOutput,
+            retries=2,
+        )
+        return self._harden(out, iteration)
+
+    async def arun(self, brief: DecisionBrief, iteration: int = 0) -> AlternativesOutput:
+        system, user = self._prompt(brief)
+        out = await acomplete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=AlternativesOutput,
+            retries=2,
+        )
+        return self._harden(out, iteration)
@@ -2,23 +2,29 @@ from __future__ import annotations
 
 import json
 from typing import List
-from llm import LLM
-from schemas import DecisionBrief, Item, CriticOutput
-from utils import complete_and_validate
+from llm import LLM, AsyncLLM
+from schemas import DecisionBrief, Item, CriticOutput, CriticSynthesisOutput, PromptStats
+from utils import complete_and_validate, acomplete_and_validate, estimate_tokens
+from compact import render_brief, render_items, prompt_stats, restore_provenance
 
 
 class CriticAgent:
-    def __init__(self, llm: LLM):
+    def __init__(self, llm: LLM | AsyncLLM, compact: bool = False, budget: int | None = None):
         self.llm = llm
+        self.compact = compact
+        self.budget = budget
+        self.prompt_stats: List[PromptStats] = []
 
-    def review(
+    def _prompt(
         self,
         brief: DecisionBrief,
         alternatives: List[Item],
         preferences: List[Item],
         uncertainties: List[Item],
-        iteration: int = 0,
-    ) -> CriticOutput:
+        iteration: int,
+        seeded: bool = False,
+        summarize: bool = False,
+    ) -> tuple[str, str]:
         system = (
             "You are the Critic.\n"
             "You will clean and correct the outputs.\n"
@@ -32,8 +38,24 @@ class CriticAgent:
             "Constraints:\n"
             "- Keep 4-8 alternatives, 5-10 preferences, 5-10 uncertainties (if possible).\n"
             "- Do NOT invent user facts. You may rewrite for clarity.\n"
-            "OUTPUT_SCHEMA: CriticOutput\n"
         )
+        if summarize:
+            # the cleaned lists are final: no separate Synthesizer pass follows
+            system += (
+                "Your lists are the final output shown to the user.\n"
+                "- notes: short critic notes on what you changed and why.\n"
+                "- synthesis_summary: 1-3 sentences summarizing the decision analysis, using only the brief "
+                "and your final items.\n"
+                "OUTPUT_SCHEMA: CriticSynthesisOutput\n"
+            )
+        else:
+            system += "OUTPUT_SCHEMA: CriticOutput\n"
+        if seeded:
+            system += (
+                "NOTE: the items were drafted against an earlier version of the brief (before the user's "
+                "clarification answers). Drop or rewrite items that conflict with the brief given here, "
+                "and add clearly missing ones.\n"
+            )
 
         payload = {
             "brief": brief.model_dump(),
@@ -43,9 +65,42 @@ class CriticAgent:
             "iteration": iteration,
         }
         user = json.dumps(payload, ensure_ascii=False)
+        if not self.compact:
+            return system, user
 
-        out = complete_and_validate(self.llm, system=system, user_json=user, model_cls=CriticOutput, retries=2)
+        system += (
+            "INPUT_FORMAT: items are listed as 'ID. text | why: rationale' under [ALTERNATIVES], "
+            "[PREFERENCES], [UNCERTAINTIES]. Return full items per the schema.\n"
+        )
+        head = render_brief(brief)
+        tail = f"ITERATION: {iteration}\n"
+        room = None
+        if self.budget is not None:
+            room = self.budget - estimate_tokens(system) - estimate_tokens(head) - estimate_tokens(tail)
+        items, truncated = render_items(
+            {"alternatives": alternatives, "preferences": preferences, "uncertainties": uncertainties},
+            budget_tokens=room,
+        )
+        compact_user = f"{head}{items}\n{tail}"
+        self.prompt_stats.append(prompt_stats("critic", system, user, compact_user, self.budget, truncated))
+        return system, compact_user
+
+    def _restore(
+        self,
+        out: CriticOutput,
+        alternatives: List[Item],
+        preferences: List[Item],
+        uncertainties: List[Item],
+        iteration: int,
+    ) -> CriticOutput:
+        # compact prompts carry no provenance; re-attach it from the matching input items
+        if self.compact:
+            inputs = alternatives + preferences + uncertainties
+            for bucket in (out.alternatives, out.preferences, out.uncertainties):
+                restore_provenance(bucket, inputs, default_agent="critic", iteration=iteration)
+        return out
 
+    def _harden(self, out: CriticOutput) -> CriticOutput:
         # Optional hardening: force types to match buckets (avoid model mistakes)
         for it in out.alternatives:
             it.type = "alternative"
@@ -54,4 +109,66 @@ class CriticAgent:
         for it in out.uncertainties:
             it.type = "uncertainty"
 
-        return out
\ No newline at end of file
+        return out
+
+    def review(
+        self,
+        brief: DecisionBrief,
+        alternatives: List[Item],
+        preferences: List[Item],
+        uncertainties: List[Item],
+        iteration: int = 0,
+        seeded: bool = False,
+    ) -> CriticOutput:
+        system, user = self._prompt(brief, alternatives, preferences, uncertainties, iteration, seeded)
+        out = complete_and_validate(self.llm, system=system, user_json=user, model_cls=CriticOutput, retries=2)
+        out = self._restore(out, alternatives, preferences, uncertainties, iteration)
+        return self._harden(out)
+
+    async def areview(
+        self,
+        brief: DecisionBrief,
+        alternatives: List[Item],
+        preferences: List[Item],
+        uncertainties: List[Item],
+        iteration: int = 0,
+        seeded: bool = False,
+    ) -> CriticOutput:
+        system, user = self._prompt(brief, alternatives, preferences, uncertainties, iteration, seeded)
+        out = await acomplete_and_validate(self.llm, system=system, user_json=user, model_cls=CriticOutput, retries=2)
+        out = self._restore(out, alternatives, preferences, uncertainties, iteration)
+        return self._harden(out)
+
+    def review_and_summarize(
+        self,
+        brief: DecisionBrief,
+        alternatives: List[Item],
+        preferences: List[Item],
+        uncertainties: List[Item],
+        iteration: int = 0,
+        seeded: bool = False,
+    ) -> CriticSynthesisOutput:
+        """
+        review() that also writes the synthesis_summary, so FinalOutput can be assembled locally
+        (Synthesizer.assemble) without a second call.
+        """
+        system, user = self._prompt(brief, alternatives, preferences, uncertainties, iteration, seeded, summarize=True)
+        out = complete_and_validate(self.llm, system=system, user_json=user, model_cls=CriticSynthesisOutput, retries=2)
+        out = self._restore(out, alternatives, preferences, uncertainties, iteration)
+        return self._harden(out)
+
+    async def areview_and_summarize(
+        self,
+        brief: DecisionBrief,
+        alternatives: List[Item],
+        preferences: List[Item],
+        uncertainties: List[Item],
+        iteration: int = 0,
+        seeded: bool = False,
+    ) -> CriticSynthesisOutput:
+        system, user = self._prompt(brief, alternatives, preferences, uncertainties, iteration, seeded, summarize=True)
+        out = await acomplete_and_validate(
+            self.llm, system=system, user_json=user, model_cls=CriticSynthesisOutput, retries=2
+        )
+        out = self._restore(out, alternatives, preferences, uncertainties, iteration)
+        return self._harden(out)
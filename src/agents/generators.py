@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import List
+from llm import LLM, AsyncLLM
+from schemas import DecisionBrief, GeneratorsOutput, PromptStats
+from utils import complete_and_validate, acomplete_and_validate, estimate_tokens
+from compact import brief_prompt, prompt_stats
+
+_TASK = "Return 5-8 alternatives, 5-10 preferences/criteria and 5-10 uncertainties.\n"
+
+
+class GeneratorsAgent:
+    """
+    Fused Alternatives + Preferences + Uncertainties agent: one call over the brief instead of
+    three. Items get the same type/provenance as if the individual agents had produced them.
+    """
+
+    def __init__(self, llm: LLM | AsyncLLM, compact: bool = False, budget: int | None = None):
+        self.llm = llm
+        self.compact = compact
+        self.budget = budget
+        self.prompt_stats: List[PromptStats] = []
+
+    def _prompt(self, brief: DecisionBrief) -> tuple[str, str]:
+        system = (
+            "You are the Generators Agent.\n"
+            "Produce three separate lists for the decision.\n"
+            "alternatives:\n"
+            "- Actionable, mutually distinguishable options the user can choose.\n"
+            "- Not criteria, not uncertainties.\n"
+            "preferences:\n"
+            "- Evaluation criteria to compare alternatives, comparable/measurable when possible.\n"
+            "- Not actions, not questions.\n"
+            "uncertainties:\n"
+            "- Key unknowns that could change which alternative is best (cost, performance, timing, constraints).\n"
+            "- Not preferences, not alternatives.\n"
+            "Return JSON only.\n"
+            "OUTPUT_SCHEMA: GeneratorsOutput\n"
+        )
+
+        user = (
+            f"TITLE: {brief.title}\n"
+            f"BRIEF: {brief.summary}\n"
+            f"HARD_CONSTRAINTS: {brief.hard_constraints}\n"
+            f"SOFT_PREFERENCES: {brief.soft_preferences}\n"
+            f"{_TASK}"
+        )
+        if not self.compact:
+            return system, user
+
+        room = self.budget - estimate_tokens(system) if self.budget is not None else None
+        compact_user, truncated = brief_prompt(brief, _TASK, room)
+        self.prompt_stats.append(prompt_stats("generators", system, user, compact_user, self.budget, truncated))
+        return system, compact_user
+
+    def _harden(self, out: GeneratorsOutput, iteration: int) -> GeneratorsOutput:
+        # same provenance/type as the split agents, so downstream stages can't tell the difference
+        for bucket, kind, agent in (
+            (out.alternatives, "alternative", "alternatives"),
+            (out.preferences, "preference", "preferences"),
+            (out.uncertainties, "uncertainty", "uncertainties"),
+        ):
+            for item in bucket:
+                item.type = kind
+                item.provenance.agent = agent
+                item.provenance.iteration = iteration
+
+        return out
+
+    def run(self, brief: DecisionBrief, iteration: int = 0) -> GeneratorsOutput:
+        system, user = self._prompt(brief)
+        out = complete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=GeneratorsOutput,
+            retries=2,
+        )
+        return self._harden(out, iteration)
+
+    async def arun(self, brief: DecisionBrief, iteration: int = 0) -> GeneratorsOutput:
+        system, user = self._prompt(brief)
+        out = await acomplete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=GeneratorsOutput,
+            retries=2,
+        )
+        return self._harden(out, iteration)
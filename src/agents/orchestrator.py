@@ -1,16 +1,42 @@
 from __future__ import annotations
 
 import json
-from schemas import DecisionRequest, DecisionBrief, ClarificationAnswers
-from llm import LLM
-from utils import complete_and_validate
+from typing import List
+from schemas import DecisionRequest, DecisionBrief, ClarificationAnswers, PromptStats
+from llm import LLM, AsyncLLM
+from utils import complete_and_validate, acomplete_and_validate, estimate_tokens
+from compact import prompt_stats, truncate_text
 
 
 class Orchestrator:
-    def __init__(self, llm: LLM):
+    def __init__(self, llm: LLM | AsyncLLM, compact: bool = False, budget: int | None = None):
         self.llm = llm
+        self.compact = compact
+        self.budget = budget
+        self.prompt_stats: List[PromptStats] = []
 
-    def build_brief(self, req: DecisionRequest) -> DecisionBrief:
+    def _fit(self, system: str, payload: dict) -> str:
+        """
+        Serialize the payload; in compact mode drop JSON whitespace and, if the stage budget is
+        exceeded, shorten the narrative (the only unbounded field) at a sentence boundary.
+        """
+        user = json.dumps(payload, ensure_ascii=False)
+        if not self.compact:
+            return user
+
+        compact_user = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        truncated = False
+        if self.budget is not None:
+            over = estimate_tokens(system) + estimate_tokens(compact_user) - self.budget
+            if over > 0:
+                narrative, truncated = truncate_text(
+                    payload["narrative"], max(50, estimate_tokens(payload["narrative"]) - over)
+                )
+                compact_user = json.dumps({**payload, "narrative": narrative}, ensure_ascii=False, separators=(",", ":"))
+        self.prompt_stats.append(prompt_stats("orchestrator", system, user, compact_user, self.budget, truncated))
+        return compact_user
+
+    def _brief_prompt(self, req: DecisionRequest) -> tuple[str, str]:
         system = (
             "You are the Orchestrator.\n"
             "Task: Convert (title, narrative) into a structured DecisionBrief.\n"
@@ -25,17 +51,9 @@ class Orchestrator:
         )
 
         payload = {"title": req.title, "narrative": req.narrative}
-        user = json.dumps(payload, ensure_ascii=False)
-
-        return complete_and_validate(
-            llm=self.llm,
-            system=system,
-            user_json=user,
-            model_cls=DecisionBrief,
-            retries=2,
-        )
+        return system, self._fit(system, payload)
 
-    def build_brief_with_clarification(self, req: DecisionRequest, clar: ClarificationAnswers) -> DecisionBrief:
+    def _clarified_brief_prompt(self, req: DecisionRequest, clar: ClarificationAnswers) -> tuple[str, str]:
         system = (
             "You are the Orchestrator.\n"
             "Task: Convert (title, narrative, clarification answers) into a structured DecisionBrief.\n"
@@ -54,12 +72,44 @@ class Orchestrator:
             "narrative": req.narrative,
             "clarification_answers": [a.model_dump() for a in clar.answers],
         }
-        user = json.dumps(payload, ensure_ascii=False)
+        return system, self._fit(system, payload)
+
+    def build_brief(self, req: DecisionRequest) -> DecisionBrief:
+        system, user = self._brief_prompt(req)
+        return complete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=DecisionBrief,
+            retries=2,
+        )
 
+    def build_brief_with_clarification(self, req: DecisionRequest, clar: ClarificationAnswers) -> DecisionBrief:
+        system, user = self._clarified_brief_prompt(req, clar)
         return complete_and_validate(
             llm=self.llm,
             system=system,
             user_json=user,
             model_cls=DecisionBrief,
             retries=2,
-        )
\ No newline at end of file
+        )
+
+    async def abuild_brief(self, req: DecisionRequest) -> DecisionBrief:
+        system, user = self._brief_prompt(req)
+        return await acomplete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=DecisionBrief,
+            retries=2,
+        )
+
+    async def abuild_brief_with_clarification(self, req: DecisionRequest, clar: ClarificationAnswers) -> DecisionBrief:
+        system, user = self._clarified_brief_prompt(req, clar)
+        return await acomplete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=DecisionBrief,
+            retries=2,
+        )
@@ -1,16 +1,16 @@
 from __future__ import annotations
 
 import json
-from llm import LLM
+from llm import LLM, AsyncLLM
 from schemas import DecisionRequest, QuestionerOutput
-from utils import complete_and_validate
+from utils import complete_and_validate, acomplete_and_validate
 
 
 class QuestionerAgent:
-    def __init__(self, llm: LLM):
+    def __init__(self, llm: LLM | AsyncLLM):
         self.llm = llm
 
-    def run(self, req: DecisionRequest, iteration: int = 0) -> QuestionerOutput:
+    def _prompt(self, req: DecisionRequest) -> tuple[str, str]:
         system = (
             "You are the Questioner Agent.\n"
             "Goal: Ask 3-8 clarifying questions that reduce ambiguity for downstream decision analysis.\n"
@@ -25,10 +25,20 @@ class QuestionerAgent:
 
         payload = {"title": req.title, "narrative": req.narrative}
         user = json.dumps(payload, ensure_ascii=False)
+        return system, user
 
-        out = complete_and_validate(self.llm, system=system, user_json=user, model_cls=QuestionerOutput, retries=2)
-
+    def _harden(self, out: QuestionerOutput) -> QuestionerOutput:
         if out.ask and len(out.questions) > 8:
             out.questions = out.questions[:8]
 
-        return out
\ No newline at end of file
+        return out
+
+    def run(self, req: DecisionRequest, iteration: int = 0) -> QuestionerOutput:
+        system, user = self._prompt(req)
+        out = complete_and_validate(self.llm, system=system, user_json=user, model_cls=QuestionerOutput, retries=2)
+        return self._harden(out)
+
+    async def arun(self, req: DecisionRequest, iteration: int = 0) -> QuestionerOutput:
+        system, user = self._prompt(req)
+        out = await acomplete_and_validate(self.llm, system=system, user_json=user, model_cls=QuestionerOutput, retries=2)
+        return self._harden(out)
@@ -1,16 +1,21 @@
 from __future__ import annotations
 
 import json
-from llm import LLM
-from schemas import DecisionBrief, CriticOutput, FinalOutput
-from utils import complete_and_validate
+from typing import List
+from llm import LLM, AsyncLLM
+from schemas import DecisionBrief, CriticOutput, FinalOutput, Meta, SynthesisSummary, SynthesizerOutput, PromptStats
+from utils import complete_and_validate, acomplete_and_validate, estimate_tokens
+from compact import render_brief, render_items, prompt_stats, restore_provenance
 
 
 class Synthesizer:
-    def __init__(self, llm: LLM):
+    def __init__(self, llm: LLM | AsyncLLM, compact: bool = False, budget: int | None = None):
         self.llm = llm
+        self.compact = compact
+        self.budget = budget
+        self.prompt_stats: List[PromptStats] = []
 
-    def synthesize(self, brief: DecisionBrief, critic_out: CriticOutput) -> FinalOutput:
+    def _prompt(self, brief: DecisionBrief, critic_out: CriticOutput) -> tuple[str, str]:
         system = (
             "You are the Synthesizer.\n"
             "Task: Produce the final structured output for downstream UI.\n"
@@ -27,6 +32,100 @@ class Synthesizer:
             "critic_out": critic_out.model_dump(),
         }
         user = json.dumps(payload, ensure_ascii=False)
+        if not self.compact:
+            return system, user
+
+        system += (
+            "INPUT_FORMAT: cleaned items are listed as 'ID. text | why: rationale' per section; "
+            "CRITIC_NOTES follow. Return full items per the schema.\n"
+        )
+        head = render_brief(brief)
+        notes = "CRITIC_NOTES: " + ("; ".join(critic_out.notes) or "none") + "\n"
+        room = None
+        if self.budget is not None:
+            room = self.budget - estimate_tokens(system) - estimate_tokens(head) - estimate_tokens(notes)
+        items, truncated = render_items(
+            {
+                "alternatives": critic_out.alternatives,
+                "preferences": critic_out.preferences,
+                "uncertainties": critic_out.uncertainties,
+            },
+            budget_tokens=room,
+        )
+        compact_user = f"{head}{items}\n{notes}"
+        self.prompt_stats.append(prompt_stats("synthesizer", system, user, compact_user, self.budget, truncated))
+        return system, compact_user
 
-        final = complete_and_validate(self.llm, system=system, user_json=user, model_cls=FinalOutput, retries=2)
+    def _restore(self, out: SynthesizerOutput, critic_out: CriticOutput) -> FinalOutput:
+        final = FinalOutput(
+            decision_title=out.decision_title,
+            brief=out.brief,
+            alternatives=out.alternatives,
+            preferences=out.preferences,
+            uncertainties=out.uncertainties,
+            meta=Meta.model_validate(out.meta.model_dump()),
+        )
+        if self.compact:
+            inputs = critic_out.alternatives + critic_out.preferences + critic_out.uncertainties
+            for bucket in (final.alternatives, final.preferences, final.uncertainties):
+                restore_provenance(bucket, inputs, default_agent="synthesizer")
         return final
+
+    def _summary_prompt(self, brief: DecisionBrief, critic_out: CriticOutput) -> tuple[str, str]:
+        system = (
+            "You are the Synthesizer.\n"
+            "Task: Write a 1-3 sentence synthesis_summary of the decision analysis.\n"
+            "Return JSON ONLY.\n"
+            "Rules:\n"
+            "- Use only the given brief and item texts.\n"
+            "- Do NOT invent facts.\n"
+            "OUTPUT_SCHEMA: SynthesisSummary\n"
+        )
+
+        payload = {
+            "title": brief.title,
+            "summary": brief.summary,
+            "alternatives": [x.text for x in critic_out.alternatives],
+            "preferences": [x.text for x in critic_out.preferences],
+            "uncertainties": [x.text for x in critic_out.uncertainties],
+        }
+        user = json.dumps(payload, ensure_ascii=False)
+        return system, user
+
+    def assemble(
+        self,
+        brief: DecisionBrief,
+        critic_out: CriticOutput,
+        synthesis_summary: str | None = None,
+    ) -> FinalOutput:
+        """
+        Build FinalOutput locally from the brief and the critic's cleaned lists (no LLM call).
+        """
+        return FinalOutput(
+            decision_title=brief.title,
+            brief=brief,
+            alternatives=critic_out.alternatives,
+            preferences=critic_out.preferences,
+            uncertainties=critic_out.uncertainties,
+            meta=Meta(synthesis_summary=synthesis_summary, critic_notes=list(critic_out.notes)),
+        )
+
+    def summarize(self, brief: DecisionBrief, critic_out: CriticOutput) -> str:
+        system, user = self._summary_prompt(brief, critic_out)
+        out = complete_and_validate(self.llm, system=system, user_json=user, model_cls=SynthesisSummary, retries=2)
+        return out.synthesis_summary
+
+    async def asummarize(self, brief: DecisionBrief, critic_out: CriticOutput) -> str:
+        system, user = self._summary_prompt(brief, critic_out)
+        out = await acomplete_and_validate(self.llm, system=system, user_json=user, model_cls=SynthesisSummary, retries=2)
+        return out.synthesis_summary
+
+    def synthesize(self, brief: DecisionBrief, critic_out: CriticOutput) -> FinalOutput:
+        system, user = self._prompt(brief, critic_out)
+        out = complete_and_validate(self.llm, system=system, user_json=user, model_cls=SynthesizerOutput, retries=2)
+        return self._restore(out, critic_out)
+
+    async def asynthesize(self, brief: DecisionBrief, critic_out: CriticOutput) -> FinalOutput:
+        system, user = self._prompt(brief, critic_out)
+        out = await acomplete_and_validate(self.llm, system=system, user_json=user, model_cls=SynthesizerOutput, retries=2)
+        return self._restore(out, critic_out)
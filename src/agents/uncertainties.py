@@ -1,15 +1,20 @@
 from __future__ import annotations
 
-from llm import LLM
-from schemas import DecisionBrief, UncertaintiesOutput
-from utils import complete_and_validate
+from typing import List
+from llm import LLM, AsyncLLM
+from schemas import DecisionBrief, UncertaintiesOutput, PromptStats
+from utils import complete_and_validate, acomplete_and_validate, estimate_tokens
+from compact import brief_prompt, prompt_stats
 
 
 class UncertaintiesAgent:
-    def __init__(self, llm: LLM):
+    def __init__(self, llm: LLM | AsyncLLM, compact: bool = False, budget: int | None = None):
         self.llm = llm
+        self.compact = compact
+        self.budget = budget
+        self.prompt_stats: List[PromptStats] = []
 
-    def run(self, brief: DecisionBrief, iteration: int = 0) -> UncertaintiesOutput:
+    def _prompt(self, brief: DecisionBrief) -> tuple[str, str]:
         system = (
             "You are the Uncertainties Agent.\n"
             "Identify key unknowns that could change which alternative is best.\n"
@@ -27,7 +32,24 @@ class UncertaintiesAgent:
             f"SOFT_PREFERENCES: {brief.soft_preferences}\n"
             "Return 5-10 uncertainties.\n"
         )
+        if not self.compact:
+            return system, user
+
+        room = self.budget - estimate_tokens(system) if self.budget is not None else None
+        compact_user, truncated = brief_prompt(brief, "Return 5-10 uncertainties.\n", room)
+        self.prompt_stats.append(prompt_stats("uncertainties", system, user, compact_user, self.budget, truncated))
+        return system, compact_user
 
+    def _harden(self, out: UncertaintiesOutput, iteration: int) -> UncertaintiesOutput:
+        for item in out.uncertainties:
+            item.type = "uncertainty"
+            item.provenance.agent = "uncertainties"
+            item.provenance.iteration = iteration
+
+        return out
+
+    def run(self, brief: DecisionBrief, iteration: int = 0) -> UncertaintiesOutput:
+        system, user = self._prompt(brief)
         out = complete_and_validate(
             llm=self.llm,
             system=system,
@@ -35,10 +57,15 @@ class UncertaintiesAgent:
             model_cls=UncertaintiesOutput,
             retries=2,
         )
+        return self._harden(out, iteration)
 
-        for item in out.uncertainties:
-            item.type = "uncertainty"
-            item.provenance.agent = "uncertainties"
-            item.provenance.iteration = iteration
-
-        return out
+    async def arun(self, brief: DecisionBrief, iteration: int = 0) -> UncertaintiesOutput:
+        system, user = self._prompt(brief)
+        out = await acomplete_and_validate(
+            llm=self.llm,
+            system=system,
+            user_json=user,
+            model_cls=UncertaintiesOutput,
+            retries=2,
+        )
+        return self._harden(out, iteration)
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import time
+import uuid
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from schemas import DecisionRequest, FinalOutput, PipelineEvent
+from pipeline import run_mvp
+from cancel import Cancelled, CancelToken
+
+# a run whose handle has not been polled for this long is treated as abandoned and stopped
+DEFAULT_IDLE_TIMEOUT_S = 30.0
+
+_TERMINAL = ("done", "failed", "cancelled")
+
+
+class RunHandle:
+    """
+    One pipeline run submitted to a BackgroundRunner. The UI keeps the handle (e.g. in its
+    session state) and polls it: poll() returns the events received since the last call and
+    keeps the run alive; cancel() stops it before its next LLM call.
+
+    status: queued -> running -> done | failed | cancelled. label/pct are the latest progress
+    tick, final the result (status done) and error the exception (status failed).
+    """
+
+    def __init__(self, idle_timeout_s: float | None = DEFAULT_IDLE_TIMEOUT_S):
+        self.id = uuid.uuid4().hex
+        self.token = CancelToken(idle_timeout_s=idle_timeout_s)
+        self.status = "queued"
+        self.label = "Queued..."
+        self.pct = 0
+        self.final: FinalOutput | None = None
+        self.error: BaseException | None = None
+        self.submitted = time.time()
+        self.finished: float | None = None
+        self._events: List[PipelineEvent] = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in _TERMINAL
+
+    def poll(self, after: int = 0) -> Tuple[List[PipelineEvent], str]:
+        """
+        (events after the first `after` ones, status). Polling marks the run as still watched.
+        """
+        self.token.touch()
+        with self._lock:
+            return self._events[after:], self.status
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """
+        Stop the run: the LLM call in flight (if any) finishes, nothing after it starts. The
+        handle reports "cancelled" right away; the worker thread frees up shortly after.
+        """
+        self.token.cancel(reason)
+        self._finish("cancelled")
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Block until the worker has stopped (not just until cancel() returned).
+        """
+        return self._done.wait(timeout)
+
+    # --- worker side ---
+
+    def _progress(self, label: str, pct: int) -> None:
+        with self._lock:
+            self.label, self.pct = label, pct
+
+    def _event(self, ev: PipelineEvent) -> None:
+        if ev.type == "final":
+            return
+        with self._lock:
+            self._events.append(ev)
+
+    def _finish(self, status: str, final: FinalOutput | None = None, error: BaseException | None = None) -> bool:
+        with self._lock:
+            if self.done:
+                # cancel() already settled the handle
+                return False
+            self.status, self.final, self.error = status, final, error
+            self.finished = time.time()
+            return True
+
+
+class BackgroundRunner:
+    """
+    Shared thread pool that runs pipelines off the UI thread. Each submit() returns a
+    RunHandle the caller polls for progress and partial results instead of blocking on the
+    run, and can cancel.
+
+    Runs are stopped through a cancel.CancelToken threaded into run_mvp(): on cancel() and
+    also when the handle is not polled for idle_timeout_s (browser tab closed, session gone),
+    so abandoned sessions do not keep worker threads busy.
+    """
+
+    def __init__(self, max_workers: int = 4, idle_timeout_s: float | None = DEFAULT_IDLE_TIMEOUT_S):
+        self.max_workers = max_workers
+        self.idle_timeout_s = idle_timeout_s
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="adq-run")
+        self._lock = threading.Lock()
+        self._active: Dict[str, RunHandle] = {}
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.abandoned = 0
+
+    def submit(
+        self,
+        req: DecisionRequest,
+        runner: Callable[..., FinalOutput] | None = None,
+        **kwargs: Any,
+    ) -> RunHandle:
+        """
+        Queue runner(req, progress=..., events=..., cancel=..., **kwargs) (run_mvp by default,
+        or e.g. coalesce.Coalescer.run) and return its handle. The caller's context variables
+        (rate_context, tracing) carry over to the worker.
+        """
+        if "progress" in kwargs or "events" in kwargs or "cancel" in kwargs:
+            raise TypeError("BackgroundRunner.submit() provides its own progress/events/cancel.")
+        handle = RunHandle(idle_timeout_s=self.idle_timeout_s)
+        with self._lock:
+            self._active[handle.id] = handle
+            self.submitted += 1
+        ctx = contextvars.copy_context()
+        self._pool.submit(ctx.run, self._work, handle, runner or run_mvp, req, kwargs)
+        return handle
+
+    def _work(self, handle: RunHandle, runner: Callable[..., FinalOutput], req: DecisionRequest, kwargs: Dict[str, Any]) -> None:
+        status, final, error = "cancelled", None, None
+        try:
+            if not handle.token.cancelled:
+                with handle._lock:
+                    if handle.status == "queued":
+                        handle.status = "running"
+                final = runner(req, progress=handle._progress, events=handle._event, cancel=handle.token, **kwargs)
+                status = "done"
+        except Cancelled:
+            pass
+        except Exception as e:
+            status, error = "failed", e
+        finally:
+            handle._finish(status, final, error)
+            with self._lock:
+                self._active.pop(handle.id, None)
+                if status == "done":
+                    self.completed += 1
+                elif status == "failed":
+                    self.failed += 1
+                elif handle.token.reason == "abandoned":
+                    self.abandoned += 1
+                else:
+                    self.cancelled += 1
+            handle._done.set()
+
+    def cancel_all(self, reason: str = "cancelled") -> int:
+        """
+        Cancel every queued or running run; returns how many were cancelled.
+        """
+        with self._lock:
+            handles = list(self._active.values())
+        for h in handles:
+            h.cancel(reason)
+        return len(handles)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.cancel_all("shutdown")
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = list(self._active.values())
+            return {
+                "workers": self.max_workers,
+                "queued": sum(1 for h in active if h.status == "queued"),
+                "running": sum(1 for h in active if not h.done and h.status != "queued"),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "abandoned": self.abandoned,
+            }
+
+
+_default_runner: BackgroundRunner | None = None
+_default_lock = threading.Lock()
+
+
+def default_background_runner() -> BackgroundRunner:
+    """
+    Process-wide BackgroundRunner (shared by all Streamlit sessions).
+    """
+    global _default_runner
+    with _default_lock:
+        if _default_runner is None:
+            _default_runner = BackgroundRunner()
+        return _default_runner
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Tuple
+
+from schemas import DecisionRequest
+from llm import LLM
+from pipeline import run_mvp
+from checkpoint import CheckpointStore
+from coalesce import Coalescer
+from ratelimit import rate_context
+from tracing import export_jsonl
+
+
+def request_id(record: Dict[str, Any]) -> str:
+    """
+    Stable ID for a batch record: its "id" field if given, else a hash of title + narrative.
+    """
+    rid = record.get("id")
+    if rid is not None and str(rid).strip():
+        return str(rid)
+    blob = f"{record.get('title', '')}\n---\n{record.get('narrative', '')}"
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def read_records(stream: IO[str]) -> Iterator[Tuple[int, str, Dict[str, Any] | Exception]]:
+    """
+    Yield (line_no, id, record) for each non-blank JSONL line.
+    Unparseable lines yield the exception in place of the record so the caller can report them.
+    """
+    for n, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+            if not isinstance(rec, dict):
+                raise ValueError("record must be a JSON object")
+        except Exception as e:
+            yield n, f"line-{n}", e
+            continue
+        yield n, request_id(rec), rec
+
+
+def completed_ids(path: str) -> set[str]:
+    """
+    IDs already written successfully to an output JSONL (used to resume a batch).
+    """
+    done: set[str] = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except Exception:
+                    continue
+                if isinstance(row, dict) and row.get("ok") and row.get("id") is not None:
+                    done.add(str(row["id"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _percentile(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    s = sorted(xs)
+    k = min(len(s) - 1, max(0, int(round(q / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+class BatchSummary:
+    def __init__(self) -> None:
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+        self.latencies: List[float] = []
+        self.wall_s = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        done = self.ok + self.failed
+        return {
+            "ok": self.ok,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "wall_s": round(self.wall_s, 3),
+            "throughput_per_min": round(60.0 * done / self.wall_s, 2) if self.wall_s > 0 else 0.0,
+            "latency_p50_s": round(_percentile(self.latencies, 50), 3),
+            "latency_p95_s": round(_percentile(self.latencies, 95), 3),
+            "latency_max_s": round(max(self.latencies), 3) if self.latencies else 0.0,
+        }
+
+
+def run_batch(
+    records: Iterable[Tuple[int, str, Dict[str, Any] | Exception]],
+    out: IO[str],
+    llm: LLM | None = None,
+    concurrency: int = 4,
+    skip_ids: set[str] | None = None,
+    trace_out: IO[str] | None = None,
+    items_out: IO[str] | None = None,
+    checkpoint: CheckpointStore | None = None,
+    coalescer: Coalescer | None = None,
+    **pipeline_kwargs: Any,
+) -> BatchSummary:
+    """
+    Run each record through run_mvp() on a bounded pool and append one JSON line per record to out
+    as soon as it finishes: {"id", "ok": true, "latency_s", "output"} or {"id", "ok": false, "error"}.
+    A failing record never aborts the batch. At most `concurrency` records are in flight.
+    With trace=True in pipeline_kwargs and a trace_out stream, each record's spans are also
+    appended there as JSON lines tagged with the record id.
+    With an items_out stream, responses are streamed (stream_items=True) and every item is
+    appended there as {"id", "stage", "bucket", "item"} the moment it is parsed, long before
+    the record's result line.
+    With a checkpoint store, each record's completed stages are checkpointed under run ID
+    "batch:<id>", so a record that failed late is resumed (not regenerated) when the batch is
+    run again.
+    With a coalescer, duplicate records in flight at the same time share one pipeline run.
+    """
+    summary = BatchSummary()
+    skip_ids = skip_ids or set()
+    write_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max(1, concurrency))
+    if items_out is not None:
+        pipeline_kwargs = {**pipeline_kwargs, "stream_items": True}
+
+    def emit(row: Dict[str, Any]) -> None:
+        with write_lock:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            if row["ok"]:
+                summary.ok += 1
+                summary.latencies.append(row["latency_s"])
+            else:
+                summary.failed += 1
+
+    def work(rid: str, rec: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        try:
+            req = DecisionRequest(title=rec.get("title", ""), narrative=rec.get("narrative", ""))
+            # batch work yields to interactive sessions sharing the process-wide limiter
+            with rate_context(priority="batch", session="batch"):
+                runner = coalescer.run if coalescer is not None else run_mvp
+                final = runner(
+                    req,
+                    llm=llm,
+                    events=item_writer(rid),
+                    checkpoint=checkpoint,
+                    run_id=f"batch:{rid}" if checkpoint is not None else None,
+                    **pipeline_kwargs,
+                )
+            if trace_out is not None and final.meta.trace:
+                with write_lock:
+                    export_jsonl(final.meta.trace, trace_out, id=rid)
+                    trace_out.flush()
+            emit({
+                "id": rid,
+                "ok": True,
+                "latency_s": round(time.perf_counter() - t0, 3),
+                "output": final.model_dump(),
+            })
+        except Exception as e:
+            emit({"id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"})
+
+    def item_writer(rid: str) -> Callable[[Any], None] | None:
+        if items_out is None:
+            return None
+
+        def write(ev: Any) -> None:
+            if ev.type == "item":
+                row = {"id": rid, "stage": ev.stage, "bucket": ev.bucket, "item": ev.item.model_dump()}
+                with write_lock:
+                    items_out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    items_out.flush()
+
+        return write
+
+    def release(_: Future) -> None:
+        slots.release()
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="adq-batch") as pool:
+        for line_no, rid, rec in records:
+            if rid in skip_ids:
+                summary.skipped += 1
+                continue
+            if isinstance(rec, Exception):
+                emit({"id": rid, "ok": False, "error": f"line {line_no}: invalid JSON record: {rec}"})
+                continue
+            slots.acquire()
+            pool.submit(work, rid, rec).add_done_callback(release)
+    summary.wall_s = time.perf_counter() - t_start
+    return summary
@@ -0,0 +1,378 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+import zlib
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from typing import Any, Dict, FrozenSet, List, Tuple
+
+from pydantic import ValidationError
+
+from schemas import ClarificationAnswers, DecisionBrief, DecisionRequest
+from checkpoint import dump_stage, load_stage
+from dedup import fingerprint
+
+DEFAULT_BRIEF_CACHE_PATH = os.getenv("ADQ_BRIEF_CACHE_PATH", os.path.join(".cache", "adq_briefs.sqlite"))
+
+# sentence ends; "3.5" or "5:30" stay in one sentence
+_SENTENCE_RE = re.compile(r"[.!?;:]+(?=\s|$)|\n+")
+_TOKEN_RE = re.compile(r"\w+")
+
+_NUM_BINS = 64
+_BANDS = 8  # LSH over the first 32 bins, 4 rows per band: ~98.5% recall at similarity 0.8
+_ROWS = 4
+_EMPTY = 0xFFFFFFFF
+
+# stage outputs are counted (and pruned to the cap) once per this many writes
+_PRUNE_EVERY = 256
+
+
+def decision_features(req: DecisionRequest, answers: ClarificationAnswers | None = None) -> FrozenSet[str]:
+    """
+    Feature set of a decision for similarity matching: dedup.fingerprint() features of the
+    title and of each narrative sentence separately. Case, punctuation and whitespace are
+    normalized away, and sentence order does not matter. Clarification answers count too,
+    tagged by question.
+    """
+    feats = {"t:" + f for f in fingerprint(req.title)}
+    for sentence in _SENTENCE_RE.split(req.narrative):
+        feats.update(fingerprint(sentence))
+    if answers is not None:
+        for a in answers.answers:
+            feats.update(f"a:{a.question_id}:{f}" for f in fingerprint(a.answer))
+    return frozenset(feats)
+
+
+def _words(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall(unicodedata.normalize("NFKC", text).casefold()))
+
+
+def content_key(req: DecisionRequest, answers: ClarificationAnswers | None = None) -> str:
+    """
+    Exact identity of a decision's content: a hash of the Unicode-normalized, case-folded word
+    tokens of the title, of each narrative sentence and of each answer (by question). Words
+    keep their order within a sentence; only the sentences are sorted. Whitespace,
+    punctuation, casing and sentence order don't change it; any changed, reordered or negated
+    word or number does.
+    """
+    sentences = sorted(w for w in map(_words, _SENTENCE_RE.split(req.narrative)) if w)
+    parts = ["t:" + _words(req.title), *("s:" + w for w in sentences)]
+    if answers is not None:
+        parts += sorted(f"a:{a.question_id}:{_words(a.answer)}" for a in answers.answers)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def signature(feats: FrozenSet[str]) -> array:
+    """
+    One-permutation MinHash: every feature is hashed once (crc32) into one of _NUM_BINS bins,
+    keeping the minimum per bin. Empty bins borrow from the next non-empty bin. That costs one
+    hash per feature, where dedup.minhash() costs one per feature and permutation, and keeps
+    lookups well under a millisecond.
+    """
+    sig = [_EMPTY] * _NUM_BINS
+    for f in feats:
+        h = zlib.crc32(f.encode("utf-8"))
+        b, v = h % _NUM_BINS, h // _NUM_BINS
+        if v < sig[b]:
+            sig[b] = v
+    if _EMPTY in sig and len(set(sig)) > 1:
+        for i in range(_NUM_BINS):
+            if sig[i] == _EMPTY:
+                j = 1
+                while sig[(i + j) % _NUM_BINS] == _EMPTY:
+                    j += 1
+                sig[i] = (sig[(i + j) % _NUM_BINS] + j * 0x9E3779B1) & 0xFFFFFFFF
+    return array("I", sig)
+
+
+def estimate_similarity(a: array, b: array) -> float:
+    """
+    Estimated Jaccard similarity of the feature sets behind two signatures.
+    """
+    return sum(x == y for x, y in zip(a, b)) / _NUM_BINS
+
+
+class DecisionIndex:
+    """
+    In-memory MinHash LSH index of decision signatures, partitioned by run settings.
+
+    A query only compares against entries sharing at least one LSH band, so its cost depends
+    on the number of near neighbours, not on the index size. Signatures are kept as 256-byte
+    arrays, about 30 MB for 100k entries with the buckets.
+    """
+
+    def __init__(self) -> None:
+        self.sigs: Dict[int, Tuple[str, array]] = {}
+        self.buckets: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sigs)
+
+    @staticmethod
+    def _band_keys(partition: str, sig: array) -> List[int]:
+        return [hash((partition, i, tuple(sig[i * _ROWS:(i + 1) * _ROWS]))) for i in range(_BANDS)]
+
+    def add(self, entry_id: int, partition: str, sig: array) -> None:
+        self.sigs[entry_id] = (partition, sig)
+        for k in self._band_keys(partition, sig):
+            self.buckets.setdefault(k, []).append(entry_id)
+
+    def remove(self, entry_id: int) -> None:
+        partition, sig = self.sigs.pop(entry_id)
+        for k in self._band_keys(partition, sig):
+            ids = self.buckets.get(k)
+            if ids is not None:
+                ids.remove(entry_id)
+                if not ids:
+                    del self.buckets[k]
+
+    def query(self, partition: str, sig: array) -> Tuple[int, float] | None:
+        """
+        (entry_id, estimated similarity) of the most similar entry, or None without candidates.
+        """
+        cands = {j for k in self._band_keys(partition, sig) for j in self.buckets.get(k, ())}
+        best = None
+        for j in cands:
+            sim = estimate_similarity(sig, self.sigs[j][1])
+            if best is None or sim > best[1] or (sim == best[1] and j > best[0]):
+                best = (j, sim)
+        return best
+
+
+class BriefMatch:
+    """
+    A stored decision similar to the one being run: its brief, the estimated similarity and
+    whether its content_key() is the same (exact, the only case in which the brief is reused).
+    """
+
+    def __init__(self, entry_id: int, similarity: float, brief: DecisionBrief, exact: bool = False):
+        self.entry_id = entry_id
+        self.similarity = similarity
+        self.brief = brief
+        self.exact = exact
+
+
+class BriefMemo:
+    """
+    graph.Memo for one run: stage outputs by exact memo key from the cache. The orchestrator
+    stage also hits on an exact BriefMatch. Downstream stages are keyed by the brief,
+    so reusing a brief also reuses whatever was generated from it. New briefs are indexed
+    under the run's request.
+    """
+
+    def __init__(self, cache: "BriefCache", partition: str, sig: array, content: str, request: DecisionRequest,
+                 match: BriefMatch | None):
+        self.cache = cache
+        self.partition = partition
+        self.sig = sig
+        self.content = content
+        self.request = request
+        self.match = match
+
+    def get(self, node: str, key: str) -> Tuple[bool, Any]:
+        hit, value = self.cache.get_output(node, key)
+        if hit:
+            return True, value
+        if node == "orchestrator" and self.match is not None and self.match.exact:
+            return True, self.match.brief.model_copy(deep=True)
+        return False, None
+
+    def put(self, node: str, key: str, value: Any) -> None:
+        self.cache.put_output(node, key, value)
+        if node == "orchestrator" and isinstance(value, DecisionBrief):
+            self.cache.add(self.partition, self.sig, self.content, self.request, value)
+
+
+class BriefCache:
+    """
+    Cache of DecisionRequest -> DecisionBrief results and the stage outputs built on them, for
+    requests that differ from earlier ones only by whitespace, punctuation, casing or sentence
+    order (which exact-key caching misses), plus drafts for merely similar ones.
+
+    - Reuse: a request with the same content_key() (same words, numbers and negations) gets the
+      cached brief as-is, and with it every downstream output cached for that brief
+      (generators, critic, synthesis).
+    - seed_threshold: any other request at least this similar gets a fresh brief, and the
+      cached generator outputs are handed to the critic as seeds (see stages.cached_drafts()).
+      Similarity alone never reuses an output: a changed budget or a negated preference can
+      still score above 0.9.
+    - max_entries: decisions kept (oldest dropped first); stage outputs are capped at 8x that,
+      enforced every _PRUNE_EVERY writes.
+
+    Similarity is estimated from MinHash signatures over decision_features() and only compared
+    between runs with the same settings (model, synthesis mode, prompt style). Signatures live
+    in memory (DecisionIndex, rebuilt from the SQLite file on open), payloads stay on disk.
+    """
+
+    def __init__(
+        self,
+        path: str | None = DEFAULT_BRIEF_CACHE_PATH,
+        seed_threshold: float = 0.7,
+        max_entries: int = 100_000,
+    ):
+        self.path = path
+        self.seed_threshold = seed_threshold
+        self.max_entries = max_entries
+        self.index = DecisionIndex()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.lookups = 0
+        self.reuse_hits = 0
+        self.seed_hits = 0
+        self.output_hits = 0
+        self.lookup_s = 0.0
+        self.max_lookup_s = 0.0
+
+        if path:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, partition TEXT NOT NULL, sig BLOB NOT NULL,"
+            " request TEXT NOT NULL, brief TEXT NOT NULL, created REAL NOT NULL, content TEXT)"
+        )
+        if "content" not in {r[1] for r in self._db.execute("PRAGMA table_info(decisions)")}:
+            # files written before exact reuse: their entries can still seed, never be reused
+            self._db.execute("ALTER TABLE decisions ADD COLUMN content TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS decisions_content ON decisions(partition, content)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            " node TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL,"
+            " PRIMARY KEY (node, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS outputs_created ON outputs(created)")
+        self._db.commit()
+        for entry_id, partition, blob in self._db.execute("SELECT id, partition, sig FROM decisions ORDER BY id"):
+            self.index.add(entry_id, partition, array("I", blob))
+
+    @staticmethod
+    def partition(salt: str) -> str:
+        return hashlib.sha256(salt.encode("utf-8")).hexdigest()[:16]
+
+    def lookup(
+        self,
+        req: DecisionRequest,
+        answers: ClarificationAnswers | None,
+        salt: str,
+    ) -> Tuple[BriefMemo, BriefMatch | None]:
+        """
+        Find the stored decision with the same content_key() and settings (exact match), or
+        else the most similar one, and return the run's memo plus the match if it is exact or
+        at least seed_threshold similar.
+        """
+        t0 = time.perf_counter()
+        partition = self.partition(salt)
+        content = content_key(req, answers)
+        sig = signature(decision_features(req, answers))
+        match = None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, brief FROM decisions WHERE partition = ? AND content = ? ORDER BY id DESC LIMIT 1",
+                (partition, content),
+            ).fetchone()
+            if row is not None:
+                try:
+                    match = BriefMatch(row[0], 1.0, DecisionBrief.model_validate_json(row[1]), exact=True)
+                except ValidationError:
+                    self._drop_locked(row[0])
+                    self._db.commit()
+            if match is None:
+                best = self.index.query(partition, sig)
+                if best is not None and best[1] >= self.seed_threshold:
+                    row = self._db.execute("SELECT brief FROM decisions WHERE id = ?", (best[0],)).fetchone()
+                    if row is not None:
+                        try:
+                            match = BriefMatch(best[0], best[1], DecisionBrief.model_validate_json(row[0]))
+                        except ValidationError:
+                            self._drop_locked(best[0])
+                            self._db.commit()
+            dt = time.perf_counter() - t0
+            self.lookups += 1
+            self.lookup_s += dt
+            self.max_lookup_s = max(self.max_lookup_s, dt)
+            if match is not None:
+                if match.exact:
+                    self.reuse_hits += 1
+                else:
+                    self.seed_hits += 1
+        return BriefMemo(self, partition, sig, content, req, match), match
+
+    def add(self, partition: str, sig: array, content: str, req: DecisionRequest, brief: DecisionBrief) -> None:
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO decisions (partition, sig, request, brief, created, content) VALUES (?, ?, ?, ?, ?, ?)",
+                (partition, sig.tobytes(), req.model_dump_json(), brief.model_dump_json(), time.time(), content),
+            )
+            self.index.add(cur.lastrowid, partition, sig)
+            while len(self.index) > self.max_entries:
+                # ids are added in ascending order, so the first one is the oldest
+                self._drop_locked(next(iter(self.index.sigs)))
+            self._db.commit()
+
+    def _drop_locked(self, entry_id: int) -> None:
+        if entry_id in self.index.sigs:
+            self.index.remove(entry_id)
+        self._db.execute("DELETE FROM decisions WHERE id = ?", (entry_id,))
+
+    def get_output(self, node: str, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM outputs WHERE node = ? AND key = ?", (node, key)).fetchone()
+            if row is None:
+                return False, None
+            try:
+                value = load_stage(row[0])
+            except (ValueError, ValidationError, AttributeError, KeyError):
+                self._db.execute("DELETE FROM outputs WHERE node = ? AND key = ?", (node, key))
+                self._db.commit()
+                return False, None
+            self.output_hits += 1
+            return True, value
+
+    def put_output(self, node: str, key: str, value: Any) -> None:
+        raw = dump_stage(value)
+        if raw is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO outputs (node, key, value, created) VALUES (?, ?, ?, ?)",
+                (node, key, raw, time.time()),
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                (n,) = self._db.execute("SELECT COUNT(*) FROM outputs").fetchone()
+                extra = n - 8 * self.max_entries
+                if extra > 0:
+                    self._db.execute(
+                        "DELETE FROM outputs WHERE rowid IN (SELECT rowid FROM outputs ORDER BY created ASC LIMIT ?)",
+                        (extra,),
+                    )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.reuse_hits + self.seed_hits
+            return {
+                "entries": len(self.index),
+                "lookups": self.lookups,
+                "reuse_hits": self.reuse_hits,
+                "seed_hits": self.seed_hits,
+                "misses": self.lookups - hits,
+                "hit_rate": (hits / self.lookups) if self.lookups else 0.0,
+                "output_hits": self.output_hits,
+                "avg_lookup_ms": round(1000 * self.lookup_s / self.lookups, 3) if self.lookups else 0.0,
+                "max_lookup_ms": round(1000 * self.max_lookup_s, 3),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
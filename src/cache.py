@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from llm import is_async_llm
+
+T = TypeVar("T", bound=BaseModel)
+
+DEFAULT_CACHE_PATH = os.getenv("ADQ_CACHE_PATH", os.path.join(".cache", "adq_responses.sqlite"))
+
+
+def cache_key(model: str | None, system: str, user: str, model_cls: Type[BaseModel] | None = None) -> str:
+    """
+    Content address for one LLM request: sha256 over model name, prompts and the output schema.
+    Any change to a schema (fields, constraints) yields a new key.
+    """
+    schema = model_cls.model_json_schema() if model_cls is not None else None
+    blob = json.dumps(
+        {"model": model or "", "system": system, "user": user, "schema": schema},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: in-memory LRU in front of an optional SQLite file.
+
+    - ttl_s: entries older than this are treated as misses and dropped (None = never expire).
+    - max_memory_entries / max_disk_entries: LRU eviction bounds per tier.
+    - path=None keeps the cache memory-only.
+
+    Values are stored as JSON text. Structured entries are re-validated through their Pydantic
+    model on read; entries that no longer validate are evicted and counted as invalid misses.
+    """
+
+    def __init__(
+        self,
+        path: str | None = DEFAULT_CACHE_PATH,
+        ttl_s: float | None = 7 * 24 * 3600,
+        max_memory_entries: int = 512,
+        max_disk_entries: int = 50_000,
+    ):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalid = 0
+        self.evictions = 0
+
+        if path:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._db.commit()
+
+    # --- raw tier access ---
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_s is not None and now - created > self.ttl_s
+
+    def _mem_put(self, key: str, created: float, value: str) -> None:
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_memory_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _get_raw(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                created, value = hit
+                if not self._expired(created, now):
+                    self._mem.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._mem[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created, now):
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._mem_put(key, created, value)
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def _set_raw(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._mem_put(key, now, value)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (n,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if n > self.max_disk_entries:
+                extra = n - self.max_disk_entries
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                    (extra,),
+                )
+                self.evictions += extra
+            self._db.commit()
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._mem.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+    # --- typed access ---
+
+    def get_text(self, key: str) -> str | None:
+        return self._get_raw(key)
+
+    def set_text(self, key: str, value: str) -> None:
+        self._set_raw(key, value)
+
+    def get_model(self, key: str, model_cls: Type[T]) -> T | None:
+        raw = self._get_raw(key)
+        if raw is None:
+            return None
+        try:
+            return model_cls.model_validate_json(raw)
+        except ValidationError:
+            self.invalidate(key)
+            with self._lock:
+                self.invalid += 1
+            return None
+
+    def set_model(self, key: str, value: BaseModel) -> None:
+        self._set_raw(key, value.model_dump_json())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "invalid": self.invalid,
+                "evictions": self.evictions,
+                "hit_rate": (hits / total) if total else 0.0,
+                "memory_entries": len(self._mem),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class _CacheWrapper:
+    def __init__(self, llm: Any, cache: ResponseCache | None = None):
+        self.llm = llm
+        self.cache = cache or ResponseCache()
+        self.model = getattr(llm, "model", None)
+
+    # JSON-mode results are cached by complete_and_validate() itself, only once validated
+
+    def lookup_validated(self, system: str, user: str, model_cls: Type[T]) -> T | None:
+        return self.cache.get_model(cache_key(self.model, system, user, model_cls), model_cls)
+
+    def store_validated(self, system: str, user: str, model_cls: Type[T], out: T) -> None:
+        self.cache.set_model(cache_key(self.model, system, user, model_cls), out)
+
+
+class CachedLLM(_CacheWrapper):
+    """
+    LLM wrapper that serves repeated (model, system, user, schema) requests from a ResponseCache.
+
+    Exposes the same capabilities as the wrapped LLM (see cached_llm()). For a JSON-mode-only
+    LLM, complete() itself is not cached: complete_and_validate() looks the request up with
+    lookup_validated() and stores the result with store_validated() only after it validated
+    against its schema, so an invalid reply is never replayed and a schema change misses.
+
+    The structured streaming method forwards to the wrapped LLM on a miss and replays a hit as
+    a single delta, so item streaming keeps working behind the cache.
+    """
+
+    def complete(self, system: str, user: str) -> str:
+        return self.llm.complete(system=system, user=user)
+
+    def complete_stream(self, system: str, user: str, on_delta: Callable[[str], None]) -> str:
+        if hasattr(self.llm, "complete_stream"):
+            return self.llm.complete_stream(system=system, user=user, on_delta=on_delta)
+        out = self.llm.complete(system=system, user=user)
+        on_delta(out)
+        return out
+
+
+class CachedStructuredLLM(CachedLLM):
+    def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        key = cache_key(self.model, system, user, model_cls)
+        hit = self.cache.get_model(key, model_cls)
+        if hit is not None:
+            return hit
+        out = self.llm.complete_structured(system=system, user=user, model_cls=model_cls)
+        self.cache.set_model(key, out)
+        return out
+
+    def complete_structured_stream(
+        self, system: str, user: str, model_cls: Type[T], on_delta: Callable[[str], None]
+    ) -> T:
+        key = cache_key(self.model, system, user, model_cls)
+        hit = self.cache.get_model(key, model_cls)
+        if hit is not None:
+            on_delta(hit.model_dump_json())
+            return hit
+        if hasattr(self.llm, "complete_structured_stream"):
+            out = self.llm.complete_structured_stream(system=system, user=user, model_cls=model_cls, on_delta=on_delta)
+        else:
+            out = self.llm.complete_structured(system=system, user=user, model_cls=model_cls)
+            on_delta(out.model_dump_json())
+        self.cache.set_model(key, out)
+        return out
+
+
+class AsyncCachedLLM(_CacheWrapper):
+    """
+    AsyncLLM counterpart of CachedLLM (cache lookups themselves stay synchronous; they are local).
+    """
+
+    async def complete(self, system: str, user: str) -> str:
+        return await self.llm.complete(system=system, user=user)
+
+    async def complete_stream(self, system: str, user: str, on_delta: Callable[[str], None]) -> str:
+        if hasattr(self.llm, "complete_stream"):
+            return await self.llm.complete_stream(system=system, user=user, on_delta=on_delta)
+        out = await self.llm.complete(system=system, user=user)
+        on_delta(out)
+        return out
+
+
+class AsyncCachedStructuredLLM(AsyncCachedLLM):
+    async def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        key = cache_key(self.model, system, user, model_cls)
+        hit = self.cache.get_model(key, model_cls)
+        if hit is not None:
+            return hit
+        out = await self.llm.complete_structured(system=system, user=user, model_cls=model_cls)
+        self.cache.set_model(key, out)
+        return out
+
+    async def complete_structured_stream(
+        self, system: str, user: str, model_cls: Type[T], on_delta: Callable[[str], None]
+    ) -> T:
+        key = cache_key(self.model, system, user, model_cls)
+        hit = self.cache.get_model(key, model_cls)
+        if hit is not None:
+            on_delta(hit.model_dump_json())
+            return hit
+        if hasattr(self.llm, "complete_structured_stream"):
+            out = await self.llm.complete_structured_stream(
+                system=system, user=user, model_cls=model_cls, on_delta=on_delta
+            )
+        else:
+            out = await self.llm.complete_structured(system=system, user=user, model_cls=model_cls)
+            on_delta(out.model_dump_json())
+        self.cache.set_model(key, out)
+        return out
+
+
+def cached_llm(llm: Any, cache: ResponseCache | None = None) -> Any:
+    """
+    Wrap llm (sync or async) in the cache wrapper with the same capabilities (structured vs.
+    JSON-mode only).
+    """
+    structured = hasattr(llm, "complete_structured")
+    if is_async_llm(llm):
+        return (AsyncCachedStructuredLLM if structured else AsyncCachedLLM)(llm, cache=cache)
+    return (CachedStructuredLLM if structured else CachedLLM)(llm, cache=cache)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List
+
+
+class Cancelled(BaseException):
+    """
+    Raised inside a run whose CancelToken was cancelled. A BaseException (like
+    asyncio.CancelledError) so stage retries and `except Exception` error handling don't
+    swallow or retry it.
+    """
+
+
+class CancelToken:
+    """
+    Cancellation flag for one run, checked before every LLM call (see check_cancelled()).
+    An LLM call already in flight finishes; nothing after it starts.
+
+    idle_timeout_s: the token also counts as cancelled ("abandoned") once touch() has not been
+    called for this long, so a run whose caller stopped polling it (closed browser tab) stops
+    by itself instead of holding a worker thread.
+    """
+
+    def __init__(self, idle_timeout_s: float | None = None):
+        self.idle_timeout_s = idle_timeout_s
+        self.reason: str | None = None
+        self._event = threading.Event()
+        self._touched = time.monotonic()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn()
+
+    def touch(self) -> None:
+        self._touched = time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.idle_timeout_s is not None:
+            if time.monotonic() - self._touched > self.idle_timeout_s:
+                self.cancel("abandoned")
+        return self._event.is_set()
+
+    def on_cancel(self, fn: Callable[[], None]) -> None:
+        """
+        Call fn once the token is cancelled (immediately if it already is).
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason or "cancelled")
+
+
+_token_var: ContextVar[CancelToken | None] = ContextVar("adq_cancel", default=None)
+
+
+@contextmanager
+def cancel_scope(token: CancelToken | None) -> Iterator[CancelToken | None]:
+    """
+    Make token the current run's cancellation token (inherited by stage threads and tasks,
+    which copy the context).
+    """
+    tok = _token_var.set(token)
+    try:
+        yield token
+    finally:
+        _token_var.reset(tok)
+
+
+def current_token() -> CancelToken | None:
+    return _token_var.get()
+
+
+def check_cancelled() -> None:
+    """
+    Raise Cancelled if the current run has been cancelled; a no-op outside cancel_scope().
+    """
+    token = _token_var.get()
+    if token is not None:
+        token.raise_if_cancelled()
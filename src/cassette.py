@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, Dict, List, Literal, Type, TypeVar, cast
+
+from pydantic import BaseModel
+
+from llm import LLM, AsyncLLM, is_async_llm
+from utils import normalize
+
+T = TypeVar("T", bound=BaseModel)
+
+MatchMode = Literal["exact", "normalized", "schema"]
+
+
+class CassetteMissError(LookupError):
+    pass
+
+
+def match_key(kind: str, schema: str | None, system: str, user: str, match: MatchMode = "exact") -> str:
+    """
+    Lookup key for one recorded request. "normalized" collapses whitespace and case so
+    cosmetic prompt edits still replay; "schema" ignores the prompts entirely (any request for
+    the same output schema gets a recorded response, for load tests at real response sizes).
+    """
+    if match == "schema":
+        system = user = ""
+    elif match == "normalized":
+        system, user = normalize(system), normalize(user)
+    blob = json.dumps([kind, schema or "", system, user], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded LLM interactions, one JSON object per line:
+      {"kind": "complete"|"structured", "schema", "model", "system", "user",
+       "response" (raw text or model_dump), "error", "latency_s", "recorded_at"}
+
+    Recording appends each interaction as it completes. For replay, entries with the same key
+    are served in recorded order and then cycle, so a short cassette can drive long load tests.
+    """
+
+    def __init__(self, path: str | None = None, match: MatchMode = "exact"):
+        if match not in ("exact", "normalized", "schema"):
+            raise ValueError(f"Unknown match mode {match!r}. Expected 'exact', 'normalized' or 'schema'.")
+        self.path = path
+        self.match = match
+        self.entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index_entry(json.loads(line))
+
+    def _index_entry(self, entry: Dict[str, Any]) -> None:
+        self.entries.append(entry)
+        key = match_key(entry["kind"], entry.get("schema"), entry["system"], entry["user"], self.match)
+        self._index.setdefault(key, []).append(entry)
+
+    @property
+    def structured(self) -> bool:
+        return any(e["kind"] == "structured" for e in self.entries)
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._index_entry(entry)
+            if self.path:
+                d = os.path.dirname(self.path)
+                if d:
+                    os.makedirs(d, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def lookup(self, kind: str, schema: str | None, system: str, user: str) -> Dict[str, Any]:
+        key = match_key(kind, schema, system, user, self.match)
+        with self._lock:
+            entries = self._index.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMissError(f"No recorded {kind} interaction for schema={schema!r} ({self.match} match).")
+            n = self._served.get(key, 0)
+            self._served[key] = n + 1
+            self.hits += 1
+            return entries[n % len(entries)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "match": self.match}
+
+
+def _entry(kind: str, model: str | None, system: str, user: str, schema: str | None = None) -> Dict[str, Any]:
+    return {
+        "kind": kind,
+        "schema": schema,
+        "model": model,
+        "system": system,
+        "user": user,
+        "response": None,
+        "error": None,
+        "latency_s": 0.0,
+        "recorded_at": time.time(),
+    }
+
+
+# --- recording ---
+
+class RecordingLLM:
+    """
+    Pass-through LLM wrapper that appends every complete() request/response (or error) to a
+    Cassette, with the inner call's latency.
+    """
+
+    def __init__(self, llm: LLM, cassette: Cassette):
+        self.llm = llm
+        self.cassette = cassette
+        self.model = getattr(llm, "model", None)
+
+    def complete(self, system: str, user: str) -> str:
+        e = _entry("complete", self.model, system, user)
+        t0 = time.perf_counter()
+        try:
+            e["response"] = self.llm.complete(system=system, user=user)
+            return e["response"]
+        except Exception as err:
+            e["error"] = f"{type(err).__name__}: {err}"
+            raise
+        finally:
+            e["latency_s"] = round(time.perf_counter() - t0, 4)
+            self.cassette.append(e)
+
+
+class RecordingStructuredLLM(RecordingLLM):
+    def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        e = _entry("structured", self.model, system, user, model_cls.__name__)
+        t0 = time.perf_counter()
+        try:
+            out = self.llm.complete_structured(system=system, user=user, model_cls=model_cls)  # type: ignore[attr-defined]
+            e["response"] = out.model_dump(mode="json")
+            return out
+        except Exception as err:
+            e["error"] = f"{type(err).__name__}: {err}"
+            raise
+        finally:
+            e["latency_s"] = round(time.perf_counter() - t0, 4)
+            self.cassette.append(e)
+
+
+class AsyncRecordingLLM:
+    """
+    AsyncLLM counterpart of RecordingLLM.
+    """
+
+    def __init__(self, llm: AsyncLLM, cassette: Cassette):
+        self.llm = llm
+        self.cassette = cassette
+        self.model = getattr(llm, "model", None)
+
+    async def complete(self, system: str, user: str) -> str:
+        e = _entry("complete", self.model, system, user)
+        t0 = time.perf_counter()
+        try:
+            e["response"] = await self.llm.complete(system=system, user=user)
+            return e["response"]
+        except Exception as err:
+            e["error"] = f"{type(err).__name__}: {err}"
+            raise
+        finally:
+            e["latency_s"] = round(time.perf_counter() - t0, 4)
+            self.cassette.append(e)
+
+
+class AsyncRecordingStructuredLLM(AsyncRecordingLLM):
+    async def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        e = _entry("structured", self.model, system, user, model_cls.__name__)
+        t0 = time.perf_counter()
+        try:
+            out = await self.llm.complete_structured(system=system, user=user, model_cls=model_cls)  # type: ignore[attr-defined]
+            e["response"] = out.model_dump(mode="json")
+            return out
+        except Exception as err:
+            e["error"] = f"{type(err).__name__}: {err}"
+            raise
+        finally:
+            e["latency_s"] = round(time.perf_counter() - t0, 4)
+            self.cassette.append(e)
+
+
+def record_llm(llm: LLM | AsyncLLM, cassette: Cassette) -> Any:
+    """
+    Wrap llm in the recording adapter matching its capabilities (sync/async, structured or not).
+    """
+    structured = hasattr(llm, "complete_structured")
+    if is_async_llm(llm):
+        return (AsyncRecordingStructuredLLM if structured else AsyncRecordingLLM)(cast(AsyncLLM, llm), cassette)
+    return (RecordingStructuredLLM if structured else RecordingLLM)(cast(LLM, llm), cassette)
+
+
+# --- replay ---
+
+class ReplayLLM:
+    """
+    Serves complete() from a Cassette; no network. latency_scale replays the recorded latency
+    (1.0 = original timing, 0 = instant). Recorded errors are re-raised as RuntimeError.
+    A request with no recording raises CassetteMissError, or goes to `fallback` if given.
+    """
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0, fallback: Any = None):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self.fallback = fallback
+        self.model = getattr(fallback, "model", None) or "replay"
+
+    def _serve(self, kind: str, schema: str | None, system: str, user: str) -> Any:
+        e = self.cassette.lookup(kind, schema, system, user)
+        if self.latency_scale > 0:
+            time.sleep(e.get("latency_s", 0.0) * self.latency_scale)
+        if e.get("error"):
+            raise RuntimeError(f"Replayed error: {e['error']}")
+        return e["response"]
+
+    def complete(self, system: str, user: str) -> str:
+        try:
+            return self._serve("complete", None, system, user)
+        except CassetteMissError:
+            if self.fallback is None:
+                raise
+            return self.fallback.complete(system=system, user=user)
+
+
+class ReplayStructuredLLM(ReplayLLM):
+    def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        try:
+            return model_cls.model_validate(self._serve("structured", model_cls.__name__, system, user))
+        except CassetteMissError:
+            if self.fallback is None:
+                raise
+            return self.fallback.complete_structured(system=system, user=user, model_cls=model_cls)
+
+
+class AsyncReplayLLM:
+    """
+    AsyncLLM counterpart of ReplayLLM (latency simulated with asyncio.sleep).
+    """
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0, fallback: Any = None):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self.fallback = fallback
+        self.model = getattr(fallback, "model", None) or "replay"
+
+    async def _serve(self, kind: str, schema: str | None, system: str, user: str) -> Any:
+        e = self.cassette.lookup(kind, schema, system, user)
+        if self.latency_scale > 0:
+            await asyncio.sleep(e.get("latency_s", 0.0) * self.latency_scale)
+        if e.get("error"):
+            raise RuntimeError(f"Replayed error: {e['error']}")
+        return e["response"]
+
+    async def complete(self, system: str, user: str) -> str:
+        try:
+            return await self._serve("complete", None, system, user)
+        except CassetteMissError:
+            if self.fallback is None:
+                raise
+            return await self.fallback.complete(system=system, user=user)
+
+
+class AsyncReplayStructuredLLM(AsyncReplayLLM):
+    async def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        try:
+            return model_cls.model_validate(await self._serve("structured", model_cls.__name__, system, user))
+        except CassetteMissError:
+            if self.fallback is None:
+                raise
+            return await self.fallback.complete_structured(system=system, user=user, model_cls=model_cls)
+
+
+def replay_llm(cassette: Cassette, latency_scale: float = 0.0, fallback: Any = None, asynchronous: bool = False) -> Any:
+    """
+    Replay adapter matching what was recorded: structured recordings replay through
+    complete_structured(), JSON-mode recordings through complete() (so the same parse/retry
+    path runs again).
+    """
+    if asynchronous:
+        cls = AsyncReplayStructuredLLM if cassette.structured else AsyncReplayLLM
+    else:
+        cls = ReplayStructuredLLM if cassette.structured else ReplayLLM
+    return cls(cassette, latency_scale=latency_scale, fallback=fallback)
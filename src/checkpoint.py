@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+import schemas
+from schemas import ClarificationAnswers, DecisionRequest
+
+DEFAULT_CHECKPOINT_PATH = os.getenv("ADQ_CHECKPOINT_PATH", os.path.join(".cache", "adq_checkpoints.sqlite"))
+
+
+def run_id_for(req: DecisionRequest, answers: ClarificationAnswers | None = None, salt: str = "") -> str:
+    """
+    Default run ID: a hash of the request, the clarification answers and the run settings, so
+    retrying the same decision with the same settings resumes the same run.
+    """
+    blob = json.dumps(
+        {
+            "request": req.model_dump(mode="json"),
+            "answers": answers.model_dump(mode="json") if answers is not None else None,
+            "salt": salt,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def dump_stage(value: Any) -> str | None:
+    """
+    JSON text for a stage output: schema models (tagged with their class) and None for skipped
+    stages. Returns None for anything else, which is not stored.
+    """
+    if value is None:
+        return json.dumps({"type": None})
+    if isinstance(value, BaseModel) and getattr(schemas, type(value).__name__, None) is type(value):
+        return json.dumps({"type": type(value).__name__, "data": value.model_dump(mode="json")}, ensure_ascii=False)
+    return None
+
+
+def load_stage(raw: str) -> Any:
+    """
+    Inverse of dump_stage(); raises ValueError/ValidationError if the schema has changed.
+    """
+    env = json.loads(raw)
+    if env.get("type") is None:
+        return None
+    return getattr(schemas, env["type"]).model_validate(env["data"])
+
+
+class RunCheckpoint:
+    """
+    graph.Memo over one run's stored stage outputs: run_graph() writes each cacheable stage's
+    validated output as it completes and, on a resumed run, takes it from here instead of
+    calling the stage again.
+    """
+
+    def __init__(self, store: "CheckpointStore", run_id: str):
+        self.store = store
+        self.run_id = run_id
+
+    def get(self, node: str, key: str) -> Tuple[bool, Any]:
+        return self.store._get_stage(self.run_id, node, key)
+
+    def put(self, node: str, key: str, value: Any) -> None:
+        self.store._put_stage(self.run_id, node, key, value)
+
+
+class CheckpointStore:
+    """
+    SQLite store of per-stage pipeline outputs (brief, generator outputs, critic, ...) keyed by
+    run ID, so a run that fails late (critic, synthesizer) can be resumed without paying for the
+    stages that already completed.
+
+    Stage rows are keyed by graph.memo_key(): a resumed run only reuses outputs whose inputs
+    and settings still match, so reusing a run ID for a changed request is safe (it just misses).
+
+    - ttl_s: runs not touched for this long are dropped on open (None = keep).
+    - keep_completed=False deletes a run's stage outputs once it finishes successfully; the run
+      row (request, options, status) is kept until it expires.
+    - path=None keeps the store in memory (process lifetime only).
+    """
+
+    def __init__(
+        self,
+        path: str | None = DEFAULT_CHECKPOINT_PATH,
+        ttl_s: float | None = 7 * 24 * 3600,
+        keep_completed: bool = False,
+    ):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.keep_completed = keep_completed
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0
+        self.resumed = 0
+        self.failed = 0
+
+        if path:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            # Streamlit sessions and batch processes may share the file
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY, request TEXT NOT NULL, answers TEXT, options TEXT NOT NULL,"
+            " status TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS stages ("
+            " run_id TEXT NOT NULL, node TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL,"
+            " PRIMARY KEY (run_id, node, key))"
+        )
+        self._db.commit()
+        if ttl_s is not None:
+            self.prune(ttl_s)
+
+    # --- run lifecycle (called by run_mvp) ---
+
+    def begin(
+        self,
+        run_id: str,
+        req: DecisionRequest,
+        answers: ClarificationAnswers | None,
+        options: Dict[str, Any],
+    ) -> RunCheckpoint:
+        """
+        Record an attempt of run_id (request, answers and JSON-able pipeline options, for
+        resume) and return its memo. An attempt on a run with stored stages counts as a resume.
+        """
+        now = time.time()
+        with self._lock:
+            (n,) = self._db.execute("SELECT COUNT(*) FROM stages WHERE run_id = ?", (run_id,)).fetchone()
+            if n:
+                self.resumed += 1
+            self._db.execute(
+                "INSERT INTO runs (run_id, request, answers, options, status, error, attempts, created, updated)"
+                " VALUES (?, ?, ?, ?, 'running', NULL, 1, ?, ?)"
+                " ON CONFLICT(run_id) DO UPDATE SET request = excluded.request, answers = excluded.answers,"
+                " options = excluded.options, status = 'running', error = NULL, attempts = attempts + 1,"
+                " updated = excluded.updated",
+                (
+                    run_id,
+                    req.model_dump_json(),
+                    answers.model_dump_json() if answers is not None else None,
+                    json.dumps(options, sort_keys=True),
+                    now,
+                    now,
+                ),
+            )
+            self._db.commit()
+        return RunCheckpoint(self, run_id)
+
+    def finish(self, run_id: str, status: str = "done", error: str | None = None) -> None:
+        """
+        Mark an attempt done, waiting (for clarification answers), failed or cancelled. Stage
+        outputs of unfinished runs are kept for the next attempt.
+        """
+        with self._lock:
+            if status == "failed":
+                self.failed += 1
+            self._db.execute(
+                "UPDATE runs SET status = ?, error = ?, updated = ? WHERE run_id = ?",
+                (status, error, time.time(), run_id),
+            )
+            if status == "done" and not self.keep_completed:
+                self._db.execute("DELETE FROM stages WHERE run_id = ?", (run_id,))
+            self._db.commit()
+
+    def load(self, run_id: str) -> Tuple[DecisionRequest, ClarificationAnswers | None, Dict[str, Any]] | None:
+        """
+        (request, answers, options) recorded for run_id, or None if the run is unknown.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT request, answers, options FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        request, answers, options = row
+        return (
+            DecisionRequest.model_validate_json(request),
+            ClarificationAnswers.model_validate_json(answers) if answers else None,
+            json.loads(options),
+        )
+
+    def runs(self, status: str | None = None) -> List[Dict[str, Any]]:
+        """
+        Recorded runs, most recently updated first, optionally filtered by status.
+        """
+        q = "SELECT run_id, status, error, attempts, created, updated," \
+            " (SELECT COUNT(*) FROM stages s WHERE s.run_id = r.run_id) FROM runs r"
+        args: Tuple[Any, ...] = ()
+        if status is not None:
+            q += " WHERE status = ?"
+            args = (status,)
+        with self._lock:
+            rows = self._db.execute(q + " ORDER BY updated DESC", args).fetchall()
+        keys = ("run_id", "status", "error", "attempts", "created", "updated", "stages")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def stages(self, run_id: str) -> List[str]:
+        """
+        Names of the stages with a stored output for run_id.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node FROM stages WHERE run_id = ? ORDER BY created", (run_id,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def delete(self, run_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM stages WHERE run_id = ?", (run_id,))
+            self._db.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            self._db.commit()
+
+    def prune(self, older_than_s: float) -> int:
+        """
+        Drop runs not updated within older_than_s seconds; returns how many were dropped.
+        """
+        cutoff = time.time() - older_than_s
+        with self._lock:
+            dead = [r[0] for r in self._db.execute("SELECT run_id FROM runs WHERE updated < ?", (cutoff,))]
+            self._db.execute("DELETE FROM stages WHERE created < ?", (cutoff,))
+            self._db.executemany("DELETE FROM runs WHERE run_id = ?", [(r,) for r in dead])
+            self._db.commit()
+        return len(dead)
+
+    # --- stage outputs (through RunCheckpoint) ---
+
+    def _get_stage(self, run_id: str, node: str, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM stages WHERE run_id = ? AND node = ? AND key = ?", (run_id, node, key)
+            ).fetchone()
+            if row is not None:
+                try:
+                    value = load_stage(row[0])
+                except (ValueError, ValidationError, AttributeError, KeyError):
+                    # schema changed since the checkpoint was written: rerun the stage
+                    self._db.execute(
+                        "DELETE FROM stages WHERE run_id = ? AND node = ? AND key = ?", (run_id, node, key)
+                    )
+                    self._db.commit()
+                else:
+                    self.hits += 1
+                    return True, value
+            self.misses += 1
+            return False, None
+
+    def _put_stage(self, run_id: str, node: str, key: str, value: Any) -> None:
+        raw = dump_stage(value)
+        if raw is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stages (run_id, node, key, value, created) VALUES (?, ?, ?, ?, ?)",
+                (run_id, node, key, raw, time.time()),
+            )
+            self._db.commit()
+            self.saved += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (n_runs,) = self._db.execute("SELECT COUNT(*) FROM runs").fetchone()
+            (n_stages,) = self._db.execute("SELECT COUNT(*) FROM stages").fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved": self.saved,
+                "resumed": self.resumed,
+                "failed": self.failed,
+                "runs": n_runs,
+                "stored_stages": n_stages,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_default_store: CheckpointStore | None = None
+_default_lock = threading.Lock()
+
+
+def default_checkpoint_store() -> CheckpointStore:
+    """
+    Process-wide CheckpointStore at DEFAULT_CHECKPOINT_PATH.
+    """
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = CheckpointStore()
+        return _default_store
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Tuple, Type
+
+from dotenv import load_dotenv
+from openai import (
+    DEFAULT_CONNECTION_LIMITS,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    OpenAI,
+    Timeout,
+)
+from pydantic import BaseModel
+
+try:
+    from openai.lib._parsing._responses import type_to_text_format_param
+except ImportError:  # SDK layout changed: callers fall back to responses.parse()
+    type_to_text_format_param = None
+
+load_dotenv()
+
+# (base_url, api key fingerprint)
+ClientKey = Tuple[str, str]
+
+
+def _env_num(name: str, default: float) -> float:
+    v = os.getenv(name, "").strip()
+    return float(v) if v else default
+
+
+class PoolConfig:
+    """
+    HTTP settings for registry clients. Defaults (env overrides in brackets):
+
+    - max_connections 64 [OPENAI_MAX_CONNECTIONS], max_keepalive 32 [OPENAI_MAX_KEEPALIVE]:
+      enough for batch concurrency with all stages of several runs in flight.
+    - keepalive_s 90 [OPENAI_KEEPALIVE_S]: the SDK default (5s) drops idle connections between
+      pipeline stages, so every stage paid a new TCP+TLS handshake.
+    - connect_timeout_s 10 [OPENAI_CONNECT_TIMEOUT_S], timeout_s 300 [OPENAI_TIMEOUT_S].
+    - max_retries 2 [OPENAI_MAX_RETRIES]: SDK-level retries on connection errors / 429 / 5xx.
+    """
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        max_keepalive: int | None = None,
+        keepalive_s: float | None = None,
+        connect_timeout_s: float | None = None,
+        timeout_s: float | None = None,
+        max_retries: int | None = None,
+    ):
+        self.max_connections = max_connections or int(_env_num("OPENAI_MAX_CONNECTIONS", 64))
+        self.max_keepalive = max_keepalive or int(_env_num("OPENAI_MAX_KEEPALIVE", 32))
+        self.keepalive_s = keepalive_s or _env_num("OPENAI_KEEPALIVE_S", 90.0)
+        self.connect_timeout_s = connect_timeout_s or _env_num("OPENAI_CONNECT_TIMEOUT_S", 10.0)
+        self.timeout_s = timeout_s or _env_num("OPENAI_TIMEOUT_S", 300.0)
+        self.max_retries = max_retries if max_retries is not None else int(_env_num("OPENAI_MAX_RETRIES", 2))
+
+    def limits(self) -> Any:
+        # httpx.Limits, taken from the SDK so the HTTP library version stays the SDK's business
+        return type(DEFAULT_CONNECTION_LIMITS)(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_s,
+        )
+
+    def timeout(self) -> Timeout:
+        return Timeout(self.timeout_s, connect=self.connect_timeout_s)
+
+
+def client_key(base_url: str | None = None, api_key: str | None = None) -> ClientKey:
+    """
+    Registry key: base URL and a fingerprint of the API key (env defaults resolved at call
+    time, so keys injected later, e.g. from Streamlit secrets, get their own client).
+    """
+    base_url = base_url or os.getenv("OPENAI_BASE_URL", "")
+    api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+    return base_url, hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def text_format(model_cls: Type[BaseModel]) -> Dict[str, Any] | None:
+    """
+    Strict json_schema text format for model_cls, compiled once per class. responses.parse()
+    rebuilds it from the Pydantic model on every call. None if the SDK helper is unavailable.
+    """
+    if type_to_text_format_param is None:
+        return None
+    return dict(type_to_text_format_param(model_cls))
+
+
+class ClientRegistry:
+    """
+    Process-wide OpenAI clients keyed by (base_url, api key), so every LLM wrapper shares one
+    keep-alive connection pool per endpoint instead of opening its own.
+
+    AsyncOpenAI clients are additionally per event loop: their connection pool is bound to the
+    loop that created it (asyncio.run() per batch item would otherwise reuse dead sockets).
+    Clients of closed loops are dropped on the next lookup.
+    """
+
+    def __init__(self, config: PoolConfig | None = None):
+        self.config = config or PoolConfig()
+        self._lock = threading.Lock()
+        self._clients: Dict[ClientKey, OpenAI] = {}
+        # clients reference their loop, so a WeakKeyDictionary would never let go of it
+        self._aclients: Dict[asyncio.AbstractEventLoop, Dict[ClientKey, AsyncOpenAI]] = {}
+        self.lookups = 0
+        self.created = 0
+        self.prewarms = 0
+        self.prewarm_errors = 0
+        self.last_prewarm_ms: float | None = None
+
+    def client(self, base_url: str | None = None, api_key: str | None = None) -> OpenAI:
+        key = client_key(base_url, api_key)
+        with self._lock:
+            self.lookups += 1
+            c = self._clients.get(key)
+            if c is None:
+                c = OpenAI(
+                    base_url=base_url or None,
+                    api_key=api_key or None,
+                    timeout=self.config.timeout(),
+                    max_retries=self.config.max_retries,
+                    http_client=DefaultHttpxClient(limits=self.config.limits(), timeout=self.config.timeout()),
+                )
+                self._clients[key] = c
+                self.created += 1
+            return c
+
+    def aclient(self, base_url: str | None = None, api_key: str | None = None) -> AsyncOpenAI:
+        """
+        AsyncOpenAI client for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        key = client_key(base_url, api_key)
+        with self._lock:
+            self.lookups += 1
+            for dead in [x for x in self._aclients if x.is_closed()]:
+                del self._aclients[dead]
+            per_loop = self._aclients.setdefault(loop, {})
+            c = per_loop.get(key)
+            if c is None:
+                c = AsyncOpenAI(
+                    base_url=base_url or None,
+                    api_key=api_key or None,
+                    timeout=self.config.timeout(),
+                    max_retries=self.config.max_retries,
+                    http_client=DefaultAsyncHttpxClient(limits=self.config.limits(), timeout=self.config.timeout()),
+                )
+                per_loop[key] = c
+                self.created += 1
+            return c
+
+    def prewarm(
+        self,
+        model: str | None = None,
+        schemas: Iterable[Type[BaseModel]] = (),
+        base_url: str | None = None,
+        api_key: str | None = None,
+        background: bool = True,
+    ) -> threading.Thread | None:
+        """
+        Compile the structured-output schemas and open a connection to the endpoint (DNS, TCP,
+        TLS) with one cheap models.retrieve() call, so the first pipeline call doesn't pay for
+        either. Errors are counted, never raised: a failed pre-warm only means a cold first call.
+        """
+        schemas = list(schemas)
+        client = self.client(base_url, api_key)
+        model = model or os.getenv("OPENAI_MODEL", "gpt-5-mini")
+
+        def run() -> None:
+            t0 = time.perf_counter()
+            for cls in schemas:
+                text_format(cls)
+            try:
+                client.with_options(max_retries=0, timeout=self.config.connect_timeout_s).models.retrieve(model)
+            except Exception:
+                with self._lock:
+                    self.prewarm_errors += 1
+            with self._lock:
+                self.prewarms += 1
+                self.last_prewarm_ms = round(1000 * (time.perf_counter() - t0), 1)
+
+        if not background:
+            run()
+            return None
+        th = threading.Thread(target=run, name="adq-prewarm", daemon=True)
+        th.start()
+        return th
+
+    def stats(self) -> Dict[str, Any]:
+        info = text_format.cache_info()
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "async_clients": sum(len(v) for k, v in self._aclients.items() if not k.is_closed()),
+                "lookups": self.lookups,
+                "created": self.created,
+                "prewarms": self.prewarms,
+                "prewarm_errors": self.prewarm_errors,
+                "last_prewarm_ms": self.last_prewarm_ms,
+                "schemas_cached": info.currsize,
+                "schema_hits": info.hits,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for c in clients:
+            c.close()
+
+
+_default_registry: ClientRegistry | None = None
+_default_lock = threading.Lock()
+
+
+def default_client_registry() -> ClientRegistry:
+    """
+    Process-wide registry configured from the OPENAI_* pool environment variables.
+    """
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ClientRegistry()
+        return _default_registry
@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import json
+import hashlib
+import threading
+import contextvars
+import unicodedata
+from typing import Any, Callable, Dict, List, Tuple
+
+from schemas import ClarificationAnswers, DecisionRequest, FinalEvent, FinalOutput, PipelineEvent
+from llm import shared_llm
+from pipeline import run_mvp
+from cancel import Cancelled, CancelToken
+from graph import StageGraph
+
+ProgressCallback = Callable[[str, int], None]
+EventCallback = Callable[[PipelineEvent], None]
+
+# how often an attached caller checks its own cancel token while waiting
+_WAIT_POLL_S = 0.1
+
+# run_mvp() keyword arguments that change what a run produces (besides request, answers, model)
+MODE_KWARGS = (
+    "use_questioner",
+    "synthesis",
+    "generation",
+    "dedup",
+    "dedup_threshold",
+    "compact_prompts",
+    "token_budgets",
+    "stream_items",
+    "speculate",
+)
+
+
+def _norm(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _callable_name(fn: Any) -> str | None:
+    return None if fn is None else f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', repr(fn))}"
+
+
+def _graph_identity(graph: StageGraph | None) -> List[Dict[str, Any]] | None:
+    # node by node, so equally configured copies (e.g. two MVP_GRAPH.configure() calls) match
+    if graph is None:
+        return None
+    return [
+        {
+            "name": n.name,
+            "fn": _callable_name(n.fn),
+            "afn": _callable_name(n.afn),
+            "when": _callable_name(n.when),
+            "inputs": list(n.inputs),
+            "after": list(n.after),
+            "output": n.output,
+            "timeout_s": n.timeout_s,
+            "retries": n.retries,
+            "retry_backoff_s": n.retry_backoff_s,
+            "cacheable": n.cacheable,
+            "lane": n.lane,
+        }
+        for n in graph.order
+    ]
+
+
+def request_fingerprint(
+    req: DecisionRequest,
+    answers: ClarificationAnswers | None = None,
+    model: str | None = None,
+    **mode: Any,
+) -> str:
+    """
+    Identity of a decision run for coalescing: title and narrative (Unicode- and
+    whitespace-normalized), clarification answers (order-insensitive), model name, the
+    pipeline mode (MODE_KWARGS), the stage graph (each node's name, functions, wiring and
+    timeout/retry settings) and the memo (by object: runs sharing a memo store coalesce).
+    """
+    ans = None
+    if answers is not None:
+        ans = sorted((_norm(a.question_id), _norm(a.answer)) for a in answers.answers)
+    blob = json.dumps(
+        {
+            "title": _norm(req.title),
+            "narrative": _norm(req.narrative),
+            "answers": ans,
+            "model": model or "",
+            "mode": {k: mode.get(k) for k in MODE_KWARGS},
+            "graph": _graph_identity(mode.get("graph")),
+            "memo": None if mode.get("memo") is None else id(mode["memo"]),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _llm_calls(final: FinalOutput) -> int:
+    # the leader always runs traced: one llm span per request, plus its retries
+    return sum(1 + sp.retries for sp in final.meta.trace if sp.kind == "llm")
+
+
+class _FlightToken(CancelToken):
+    """
+    Cancel token of a shared run: cancelled once every attached caller has cancelled (or
+    detached), never by one of several callers alone. Callers without a token keep the run
+    alive.
+    """
+
+    def __init__(self, flight: "_Flight"):
+        super().__init__()
+        self._flight = flight
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set():
+            # under the flight's lock, so attach() never joins a run that is being cancelled
+            with self._flight.lock:
+                if all(tok is not None and tok.cancelled for _, _, _, tok in self._flight.listeners):
+                    self.cancel("cancelled by all callers")
+        return self._event.is_set()
+
+
+class _Flight:
+    """
+    One in-flight run and the callers attached to it. Events are kept so late joiners get
+    the progress so far replayed before the live ones.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.history: List[Tuple[str, Any]] = []
+        self.listeners: List[Tuple[ProgressCallback | None, EventCallback | None, bool, CancelToken | None]] = []
+        self.final: FinalOutput | None = None
+        self.error: BaseException | None = None
+        self.token = _FlightToken(self)
+
+    def attach(
+        self,
+        progress: ProgressCallback | None,
+        events: EventCallback | None,
+        trace: bool,
+        cancel: CancelToken | None = None,
+    ) -> Tuple[Any, ...] | None:
+        """
+        Add a caller (replaying the events so far); None if the run is already cancelled.
+        """
+        listener = (progress, events, trace, cancel)
+        with self.lock:
+            if self.token._event.is_set():
+                return None
+            for kind, payload in self.history:
+                self._deliver(progress, events, trace, kind, payload)
+            self.listeners.append(listener)
+        return listener
+
+    def detach(self, listener: Tuple[Any, ...]) -> None:
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def publish(self, kind: str, payload: Any) -> None:
+        # delivered under the lock so a joiner never sees an event twice or out of order
+        with self.lock:
+            self.history.append((kind, payload))
+            for progress, events, trace, _ in self.listeners:
+                self._deliver(progress, events, trace, kind, payload)
+
+    @staticmethod
+    def _deliver(progress: ProgressCallback | None, events: EventCallback | None, trace: bool, kind: str, payload: Any) -> None:
+        if kind == "progress":
+            if progress is not None:
+                progress(*payload)
+        elif events is not None:
+            if payload.type == "final":
+                payload = FinalEvent(final=_output(payload.final, trace))
+            events(payload)
+
+
+def _output(final: FinalOutput, trace: bool) -> FinalOutput:
+    # every caller gets its own copy (callers edit meta); the trace only if it asked for one
+    out = final.model_copy(deep=True)
+    if not trace:
+        out.meta.trace = []
+    return out
+
+
+class Coalescer:
+    """
+    Single-flight execution of run_mvp(): concurrent calls with the same request_fingerprint()
+    attach to the one in-flight run instead of starting their own. Attached callers get the
+    run's progress ticks and events (replayed from the start, then live) and their own copy
+    of its FinalOutput, or its exception.
+
+    The first caller (the leader) starts the run on a dedicated thread with its own settings
+    (parallelism, checkpoint, rate-limit context); options outside the fingerprint are not
+    merged. Every caller, the leader included, then waits for it the same way. Only
+    concurrent calls are coalesced: once a run has finished, the next identical call starts a
+    new one (see cache.cached_llm() / checkpoint for reuse across time).
+
+    cancel: a caller that cancels its token detaches right away (raising cancel.Cancelled)
+    without stopping the run for the others; the run itself is cancelled once all its callers
+    have.
+
+    Callbacks are invoked under the flight's lock and should return quickly.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+
+        self.runs = 0
+        self.joined = 0
+        self.llm_calls = 0
+        self.llm_calls_saved = 0
+
+    def run(
+        self,
+        req: DecisionRequest,
+        llm: Any = None,
+        progress: ProgressCallback | None = None,
+        events: EventCallback | None = None,
+        **kwargs: Any,
+    ) -> FinalOutput:
+        """
+        run_mvp() with coalescing; accepts the same arguments.
+        """
+        llm = llm or shared_llm()
+        trace = bool(kwargs.pop("trace", False))
+        cancel: CancelToken | None = kwargs.pop("cancel", None)
+        key = request_fingerprint(
+            req,
+            kwargs.get("clarification_answers"),
+            getattr(llm, "model", None) or type(llm).__name__,
+            **kwargs,
+        )
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            listener = flight.attach(progress, events, trace, cancel) if flight is not None else None
+            leader = listener is None
+            if leader:
+                # no run in flight, or one that is winding down after being cancelled
+                flight = self._inflight[key] = _Flight()
+                listener = flight.attach(progress, events, trace, cancel)
+                self.runs += 1
+            else:
+                self.joined += 1
+
+        if leader:
+            ctx = contextvars.copy_context()
+            threading.Thread(
+                target=ctx.run,
+                args=(self._fly, key, flight, req, llm, kwargs),
+                name="adq-coalesce",
+                daemon=True,
+            ).start()
+
+        # leader and followers alike: any of them can stop waiting without stopping the others
+        while not flight.done.wait(_WAIT_POLL_S if cancel is not None else None):
+            if cancel.cancelled:
+                flight.detach(listener)
+                raise Cancelled(cancel.reason or "cancelled")
+        if flight.error is not None:
+            raise flight.error
+        return _output(flight.final, trace)
+
+    def _fly(self, key: str, flight: _Flight, req: DecisionRequest, llm: Any, kwargs: Dict[str, Any]) -> None:
+        try:
+            flight.final = run_mvp(
+                req,
+                llm=llm,
+                progress=lambda label, pct: flight.publish("progress", (label, pct)),
+                events=lambda ev: flight.publish("event", ev),
+                trace=True,
+                cancel=flight.token,
+                **kwargs,
+            )
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                followers = max(0, len(flight.listeners) - 1)
+            if flight.final is not None:
+                calls = _llm_calls(flight.final)
+                with self._lock:
+                    self.llm_calls += calls
+                    self.llm_calls_saved += calls * followers
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "joined": self.joined,
+                "in_flight": len(self._inflight),
+                "llm_calls": self.llm_calls,
+                "llm_calls_saved": self.llm_calls_saved,
+            }
+
+
+_default_coalescer: Coalescer | None = None
+_default_lock = threading.Lock()
+
+
+def default_coalescer() -> Coalescer:
+    """
+    Process-wide Coalescer (shared by Streamlit sessions and batch workers).
+    """
+    global _default_coalescer
+    with _default_lock:
+        if _default_coalescer is None:
+            _default_coalescer = Coalescer()
+        return _default_coalescer
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from schemas import DecisionBrief, Item, PromptStats
+from utils import estimate_tokens
+from dedup import fingerprint, jaccard
+
+# Default per-stage input-token budgets (system + user) for compact prompts.
+DEFAULT_STAGE_BUDGETS: Dict[str, int] = {
+    "orchestrator": 3000,
+    "alternatives": 1200,
+    "preferences": 1200,
+    "uncertainties": 1200,
+    "generators": 1400,
+    "critic": 3500,
+    "synthesizer": 3500,
+}
+
+_ID_PREFIX = {"alternative": "A", "preference": "P", "uncertainty": "U"}
+_SENT_RE = re.compile(r"(?<=[.!?])\s+")
+_TRUNC = " …[truncated]"
+
+
+def stage_budgets(overrides: Dict[str, int] | None = None) -> Dict[str, int]:
+    return {**DEFAULT_STAGE_BUDGETS, **(overrides or {})}
+
+
+def prompt_stats(stage: str, system: str, verbose_user: str, user: str, budget: int | None, truncated: bool) -> PromptStats:
+    return PromptStats(
+        stage=stage,
+        tokens_before=estimate_tokens(system) + estimate_tokens(verbose_user),
+        tokens_after=estimate_tokens(system) + estimate_tokens(user),
+        budget=budget,
+        truncated=truncated,
+    )
+
+
+def _join(xs: Sequence[str]) -> str:
+    return "; ".join(x.strip() for x in xs if x.strip()) or "none"
+
+
+def render_brief(brief: DecisionBrief) -> str:
+    """
+    Tight plain-text brief: no Python reprs, no quotes, lists joined with '; '.
+    """
+    return (
+        f"TITLE: {brief.title}\n"
+        f"BRIEF: {brief.summary}\n"
+        f"HARD: {_join(brief.hard_constraints)}\n"
+        f"SOFT: {_join(brief.soft_preferences)}\n"
+    )
+
+
+def brief_prompt(brief: DecisionBrief, tail: str, budget_tokens: int | None = None) -> Tuple[str, bool]:
+    """
+    render_brief() + a task line, shortening the summary (then the lists) to fit budget_tokens.
+    """
+    text = render_brief(brief) + tail
+    if budget_tokens is None or estimate_tokens(text) <= budget_tokens:
+        return text, False
+    room = max(20, budget_tokens - estimate_tokens(tail) - 20)
+    summary, _ = truncate_text(brief.summary, room // 2)
+    hard, _ = truncate_text(_join(brief.hard_constraints), room // 4)
+    soft, _ = truncate_text(_join(brief.soft_preferences), room // 4)
+    return f"TITLE: {brief.title}\nBRIEF: {summary}\nHARD: {hard}\nSOFT: {soft}\n" + tail, True
+
+
+def truncate_text(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    Cut text to roughly max_tokens, preferring a sentence boundary. Returns (text, truncated).
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    max_chars = max(0, max_tokens * 4 - len(_TRUNC))
+    out = ""
+    for sent in _SENT_RE.split(text):
+        nxt = f"{out} {sent}".strip()
+        if len(nxt) > max_chars:
+            break
+        out = nxt
+    if not out:
+        out = text[:max_chars].rstrip()
+    return out + _TRUNC, True
+
+
+def _item_line(item_id: str, text: str, rationale: str | None) -> str:
+    return f"{item_id}. {text}" + (f" | why: {rationale}" if rationale else "")
+
+
+def render_items(
+    buckets: Dict[str, List[Item]],
+    budget_tokens: int | None = None,
+) -> Tuple[str, bool]:
+    """
+    Render item lists as short-ID lines ("A1. text | why: rationale"), grouped by bucket.
+    type/provenance are omitted (implied by the section), null rationales are skipped.
+
+    If budget_tokens is exceeded, degrade in order: drop rationales, shorten texts to one
+    sentence / 30 tokens, then drop trailing items from the longest bucket.
+    Returns (text, truncated).
+    """
+    rows: Dict[str, List[List[str | None]]] = {}
+    for name, items in buckets.items():
+        rows[name] = []
+        for i, it in enumerate(items, 1):
+            rows[name].append([f"{_ID_PREFIX.get(it.type, 'X')}{i}", it.text, it.rationale])
+
+    def render() -> str:
+        parts = []
+        for name, rs in rows.items():
+            parts.append(f"[{name.upper()}]")
+            parts.extend(_item_line(r[0] or "", r[1] or "", r[2]) for r in rs)
+        return "\n".join(parts)
+
+    text = render()
+    if budget_tokens is None or estimate_tokens(text) <= budget_tokens:
+        return text, False
+
+    # 1) drop rationales, longest first
+    flat = sorted((r for rs in rows.values() for r in rs), key=lambda r: -len(r[2] or ""))
+    for r in flat:
+        if not r[2]:
+            break
+        r[2] = None
+        if estimate_tokens(render()) <= budget_tokens:
+            return render(), True
+
+    # 2) shorten long texts
+    for rs in rows.values():
+        for r in rs:
+            r[1], _ = truncate_text(r[1] or "", 30)
+    if estimate_tokens(render()) <= budget_tokens:
+        return render(), True
+
+    # 3) drop trailing items from the longest bucket, keeping at least one per bucket
+    while estimate_tokens(render()) > budget_tokens:
+        name = max(rows, key=lambda k: len(rows[k]))
+        if len(rows[name]) <= 1:
+            break
+        rows[name].pop()
+    return render(), True
+
+
+def restore_provenance(out_items: List[Item], in_items: List[Item], default_agent: str, iteration: int = 0) -> None:
+    """
+    Compact prompts omit provenance, so re-attach it from the closest input item by text
+    (fingerprint Jaccard >= 0.5); unmatched items are attributed to default_agent.
+    """
+    feats = [(fingerprint(x.text), x) for x in in_items]
+    for it in out_items:
+        f = fingerprint(it.text)
+        best, best_sim = None, 0.0
+        for g, src in feats:
+            sim = jaccard(f, g)
+            if sim > best_sim:
+                best, best_sim = src, sim
+        if best is not None and best_sim >= 0.5:
+            it.provenance = best.provenance.model_copy()
+        else:
+            it.provenance.agent = default_agent
+            it.provenance.iteration = iteration
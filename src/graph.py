@@ -0,0 +1,501 @@
+from __future__ import annotations
+
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Protocol, Sequence, Tuple
+
+from tracing import span
+
+ProgressCallback = Callable[[str, int], None]
+
+
+class GraphError(ValueError):
+    pass
+
+
+class NodeTimeoutError(TimeoutError):
+    pass
+
+
+class Halt:
+    """
+    Returned by a node to stop the run early; run_graph() returns the Halt itself and the
+    caller reads .value (e.g. the pending-clarification stub).
+    """
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class Node:
+    """
+    One stage of a StageGraph.
+
+    fn(ctx, **inputs) is called with the values named in `inputs` (outputs of upstream nodes or
+    initial run inputs); afn is its coroutine twin for arun_graph() (fn is called inline there if
+    afn is missing, so local/CPU nodes need only fn). `after` adds ordering-only dependencies.
+
+    when(ctx, state) -> False skips the node; its output is then None. A skipped or removed
+    node's output is None for every consumer, so consumers must accept None.
+
+    label / done_label are progress texts ticked when the node starts / finishes; weight is its
+    share of the progress bar. timeout_s and retries apply per attempt. cacheable nodes go
+    through the run's memo, if any. traced nodes get a tracing span named after the node.
+    Nodes sharing a `lane` never overlap when that lane is listed in serial_lanes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Any] | None = None,
+        afn: Callable[..., Awaitable[Any]] | None = None,
+        inputs: Sequence[str] = (),
+        after: Sequence[str] = (),
+        output: str | None = None,
+        when: Callable[[Any, Dict[str, Any]], bool] | None = None,
+        label: str | None = None,
+        done_label: str | None = None,
+        weight: float = 1.0,
+        timeout_s: float | None = None,
+        retries: int = 0,
+        retry_backoff_s: float = 0.0,
+        cacheable: bool = False,
+        traced: bool = True,
+        lane: str | None = None,
+        on_done: Callable[[Any, Any], None] | None = None,
+    ):
+        if fn is None and afn is None:
+            raise GraphError(f"Node {name!r} needs fn or afn.")
+        self.name = name
+        self.fn = fn
+        self.afn = afn
+        self.inputs = tuple(inputs)
+        self.after = tuple(after)
+        self.output = output or name
+        self.when = when
+        self.label = label
+        self.done_label = done_label
+        self.weight = weight
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.retry_backoff_s = retry_backoff_s
+        self.cacheable = cacheable
+        self.traced = traced
+        self.lane = lane
+        self.on_done = on_done
+
+    @property
+    def deps(self) -> Tuple[str, ...]:
+        return self.inputs + self.after
+
+    def replace(self, **changes: Any) -> "Node":
+        n = copy.copy(self)
+        for k, v in changes.items():
+            if not hasattr(n, k):
+                raise GraphError(f"Node has no attribute {k!r}.")
+            setattr(n, k, tuple(v) if k in ("inputs", "after") else v)
+        return n
+
+    def __repr__(self) -> str:
+        return f"Node({self.name!r}, inputs={self.inputs}, output={self.output!r})"
+
+
+class StageGraph:
+    """
+    Immutable DAG of Nodes over named values.
+
+    inputs: names supplied by the caller of run_graph(). absent: outputs of removed nodes,
+    which resolve to None. Nodes are validated (unique names/outputs, resolvable dependencies,
+    no cycles) and kept in a stable topological order: ties keep declaration order, which is
+    also the start order among ready nodes.
+    """
+
+    def __init__(self, nodes: Iterable[Node], inputs: Sequence[str] = (), absent: Iterable[str] = ()):
+        self.inputs = tuple(inputs)
+        self.absent = frozenset(absent)
+        self.nodes: List[Node] = list(nodes)
+        self.order = self._validate()
+
+    def _validate(self) -> List[Node]:
+        names, outputs = set(), {}
+        for n in self.nodes:
+            if n.name in names:
+                raise GraphError(f"Duplicate node name {n.name!r}.")
+            names.add(n.name)
+            if n.output in outputs or n.output in self.inputs:
+                raise GraphError(f"Value {n.output!r} is produced twice.")
+            outputs[n.output] = n
+        known = set(self.inputs) | set(outputs) | set(self.absent)
+        for n in self.nodes:
+            missing = [d for d in n.deps if d not in known]
+            if missing:
+                raise GraphError(f"Node {n.name!r} depends on unknown value(s) {missing}.")
+
+        order: List[Node] = []
+        resolved = set(self.inputs) | set(self.absent)
+        remaining = list(self.nodes)
+        while remaining:
+            ready = [n for n in remaining if all(d in resolved for d in n.deps)]
+            if not ready:
+                raise GraphError(f"Cycle among nodes {[n.name for n in remaining]}.")
+            for n in ready:
+                order.append(n)
+                resolved.add(n.output)
+                remaining.remove(n)
+        return order
+
+    def node(self, name: str) -> Node:
+        for n in self.nodes:
+            if n.name == name:
+                return n
+        raise KeyError(name)
+
+    def without(self, *names: str) -> "StageGraph":
+        """
+        Variant with the named nodes removed; their outputs become None for consumers.
+        """
+        for name in names:
+            self.node(name)
+        gone = {n.output for n in self.nodes if n.name in names}
+        return StageGraph([n for n in self.nodes if n.name not in names], self.inputs, self.absent | gone)
+
+    def replace(self, node: Node) -> "StageGraph":
+        """
+        Variant with the same-named node swapped for `node`.
+        """
+        self.node(node.name)
+        return StageGraph([node if n.name == node.name else n for n in self.nodes], self.inputs, self.absent)
+
+    def configure(self, name: str, **changes: Any) -> "StageGraph":
+        """
+        Variant with one node's settings changed, e.g. configure("critic", timeout_s=60, retries=1).
+        """
+        return self.replace(self.node(name).replace(**changes))
+
+    def add(self, node: Node) -> "StageGraph":
+        return StageGraph([*self.nodes, node], self.inputs, self.absent - {node.output})
+
+    def names(self) -> List[str]:
+        return [n.name for n in self.order]
+
+
+class Memo(Protocol):
+    def get(self, node: str, key: str) -> Tuple[bool, Any]:
+        ...
+
+    def put(self, node: str, key: str, value: Any) -> None:
+        ...
+
+
+class DictMemo:
+    """
+    In-process memo for cacheable nodes. Values are deep-copied in and out because downstream
+    stages mutate their inputs (provenance/type hardening, rationale merging).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[Tuple[str, str], Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, node: str, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if (node, key) in self._data:
+                self.hits += 1
+                return True, copy.deepcopy(self._data[(node, key)])
+            self.misses += 1
+            return False, None
+
+    def put(self, node: str, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[(node, key)] = copy.deepcopy(value)
+
+
+class ChainMemo:
+    """
+    Several memos as one: get() returns the first hit, put() writes to all of them.
+    """
+
+    def __init__(self, *memos: Memo):
+        self.memos = memos
+
+    def get(self, node: str, key: str) -> Tuple[bool, Any]:
+        for m in self.memos:
+            hit, value = m.get(node, key)
+            if hit:
+                return True, value
+        return False, None
+
+    def put(self, node: str, key: str, value: Any) -> None:
+        for m in self.memos:
+            m.put(node, key, value)
+
+
+def _jsonable(o: Any) -> Any:
+    dump = getattr(o, "model_dump", None)
+    if dump is not None:
+        return dump(mode="json")
+    return repr(o)
+
+
+def memo_key(node: str, inputs: Dict[str, Any], salt: str = "") -> str:
+    """
+    Content hash of a node's name, its input values and a run-level salt (settings that change
+    what the node would produce, e.g. model or prompt style).
+    """
+    blob = json.dumps({"node": node, "salt": salt, "inputs": inputs}, default=_jsonable, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _Progress:
+    def __init__(self, graph: StageGraph, progress: ProgressCallback | None):
+        self.progress = progress
+        self.total = sum(n.weight for n in graph.nodes) or 1.0
+        self.done = 0.0
+
+    def pct(self) -> int:
+        return int(100 * self.done / self.total)
+
+    def start(self, node: Node) -> None:
+        if self.progress is not None and node.label:
+            self.progress(node.label, self.pct())
+
+    def finish(self, node: Node, ran: bool = True) -> None:
+        self.done += node.weight
+        if self.progress is not None and ran and node.done_label:
+            self.progress(node.done_label, self.pct())
+
+
+class _Scheduler:
+    """
+    State shared by the sync and async schedulers: what is resolved, what may start next.
+    """
+
+    def __init__(self, graph: StageGraph, ctx: Any, initial: Dict[str, Any], progress: ProgressCallback | None,
+                 memo: Memo | None, memo_salt: str, serial_lanes: Iterable[str]):
+        missing = [k for k in graph.inputs if k not in initial]
+        if missing:
+            raise GraphError(f"Missing graph input(s) {missing}.")
+        self.graph = graph
+        self.ctx = ctx
+        self.state: Dict[str, Any] = {**{k: None for k in graph.absent}, **initial}
+        self.pending: List[Node] = list(graph.order)
+        self.progress = _Progress(graph, progress)
+        self.memo = memo
+        self.memo_salt = memo_salt
+        self.serial_lanes = set(serial_lanes)
+        self.busy_lanes: Dict[str, int] = {}
+
+    def ready(self, n_running: int, limit: int | None) -> List[Tuple[Node, Dict[str, Any], str | None]]:
+        """
+        Resolve skips and memo hits in place; return the nodes to start now with their inputs
+        and memo key.
+        """
+        out = []
+        changed = True
+        while changed:
+            changed = False
+            for node in list(self.pending):
+                if not all(d in self.state for d in node.deps):
+                    continue
+                if node.lane in self.serial_lanes and self.busy_lanes.get(node.lane):
+                    continue
+                if node.when is not None and not node.when(self.ctx, self.state):
+                    self.pending.remove(node)
+                    self.resolve(node, None, ran=False)
+                    changed = True
+                    continue
+                kwargs = {k: self.state[k] for k in node.inputs}
+                key = None
+                if self.memo is not None and node.cacheable:
+                    key = memo_key(node.name, kwargs, self.memo_salt)
+                    hit, value = self.memo.get(node.name, key)
+                    if hit:
+                        self.pending.remove(node)
+                        self.resolve(node, value)
+                        changed = True
+                        continue
+                if limit is not None and n_running + len(out) >= limit:
+                    return out
+                self.pending.remove(node)
+                if node.lane is not None:
+                    self.busy_lanes[node.lane] = self.busy_lanes.get(node.lane, 0) + 1
+                self.progress.start(node)
+                out.append((node, kwargs, key))
+        return out
+
+    def resolve(self, node: Node, value: Any, ran: bool = True, key: str | None = None) -> None:
+        self.state[node.output] = value
+        if key is not None and self.memo is not None:
+            self.memo.put(node.name, key, value)
+        if ran and node.on_done is not None:
+            node.on_done(self.ctx, value)
+        self.progress.finish(node, ran)
+
+    def release(self, node: Node) -> None:
+        if node.lane is not None and self.busy_lanes.get(node.lane):
+            self.busy_lanes[node.lane] -= 1
+
+
+def _call(node: Node, ctx: Any, kwargs: Dict[str, Any]) -> Any:
+    if node.fn is None:
+        return asyncio.run(node.afn(ctx, **kwargs))  # type: ignore[misc]
+    if not node.traced:
+        return node.fn(ctx, **kwargs)
+    with span(node.name):
+        return node.fn(ctx, **kwargs)
+
+
+def run_graph(
+    graph: StageGraph,
+    ctx: Any,
+    initial: Dict[str, Any],
+    max_workers: int = 4,
+    progress: ProgressCallback | None = None,
+    memo: Memo | None = None,
+    memo_salt: str = "",
+    serial_lanes: Iterable[str] = (),
+) -> Dict[str, Any] | Halt:
+    """
+    Run graph on a thread pool: every node whose dependencies are resolved starts (in graph
+    order) as soon as a worker is free. Returns the final value state, or the Halt a node
+    returned.
+
+    Timeouts and retries are per node. A timed-out attempt cannot be killed; it is abandoned
+    and its worker finishes in the background. The first unrecoverable failure cancels queued
+    nodes and is re-raised.
+    """
+    sched = _Scheduler(graph, ctx, initial, progress, memo, memo_salt, serial_lanes)
+    running: Dict[Future, Tuple[Node, Dict[str, Any], str | None, int, float | None]] = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="adq-node")
+    abandoned = False
+
+    def submit(node: Node, kwargs: Dict[str, Any], key: str | None, attempt: int) -> None:
+        fut = pool.submit(contextvars.copy_context().run, _call, node, ctx, kwargs)
+        deadline = time.monotonic() + node.timeout_s if node.timeout_s else None
+        running[fut] = (node, kwargs, key, attempt, deadline)
+
+    def fail(fut: Future, err: BaseException) -> None:
+        node, kwargs, key, attempt, _ = running.pop(fut)
+        if attempt < node.retries and isinstance(err, Exception):
+            if node.retry_backoff_s:
+                time.sleep(node.retry_backoff_s * (2 ** attempt))
+            submit(node, kwargs, key, attempt + 1)
+            return
+        raise err
+
+    try:
+        while sched.pending or running:
+            for node, kwargs, key in sched.ready(len(running), max_workers):
+                submit(node, kwargs, key, 0)
+            if not running:
+                if sched.pending:
+                    raise GraphError(f"Graph stalled with pending nodes {[n.name for n in sched.pending]}.")
+                break
+
+            deadlines = [d for (_, _, _, _, d) in running.values() if d is not None]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                err = fut.exception()
+                if err is not None:
+                    fail(fut, err)
+                    continue
+                node, _, key, _, _ = running.pop(fut)
+                sched.release(node)
+                value = fut.result()
+                if isinstance(value, Halt):
+                    return value
+                sched.resolve(node, value, key=key)
+
+            now = time.monotonic()
+            for fut, (node, _, _, attempt, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline and not fut.done():
+                    abandoned = True
+                    fut.cancel()
+                    fail(fut, NodeTimeoutError(f"Node {node.name!r} timed out after {node.timeout_s}s (attempt {attempt + 1})."))
+        return sched.state
+    finally:
+        # normal exit: nothing is running. On failure/halt, don't block on abandoned attempts.
+        pool.shutdown(wait=not abandoned, cancel_futures=True)
+
+
+async def _acall(node: Node, ctx: Any, kwargs: Dict[str, Any], attempt: int) -> Any:
+    async def call() -> Any:
+        if node.afn is not None:
+            return await node.afn(ctx, **kwargs)
+        return node.fn(ctx, **kwargs)  # type: ignore[misc]
+
+    async def timed() -> Any:
+        if not node.timeout_s:
+            return await call()
+        try:
+            return await asyncio.wait_for(call(), node.timeout_s)
+        except asyncio.TimeoutError as e:
+            raise NodeTimeoutError(f"Node {node.name!r} timed out after {node.timeout_s}s (attempt {attempt + 1}).") from e
+
+    if not node.traced:
+        return await timed()
+    with span(node.name):
+        return await timed()
+
+
+async def arun_graph(
+    graph: StageGraph,
+    ctx: Any,
+    initial: Dict[str, Any],
+    max_concurrency: int | None = None,
+    progress: ProgressCallback | None = None,
+    memo: Memo | None = None,
+    memo_salt: str = "",
+    serial_lanes: Iterable[str] = (),
+) -> Dict[str, Any] | Halt:
+    """
+    asyncio counterpart of run_graph(): nodes run as tasks on the current loop (timeouts
+    cancel the attempt). On failure or Halt the other running nodes are cancelled and awaited.
+    """
+    sched = _Scheduler(graph, ctx, initial, progress, memo, memo_salt, serial_lanes)
+    running: Dict[asyncio.Task, Tuple[Node, Dict[str, Any], str | None, int]] = {}
+
+    def submit(node: Node, kwargs: Dict[str, Any], key: str | None, attempt: int) -> None:
+        running[asyncio.ensure_future(_acall(node, ctx, kwargs, attempt))] = (node, kwargs, key, attempt)
+
+    try:
+        while sched.pending or running:
+            for node, kwargs, key in sched.ready(len(running), max_concurrency):
+                submit(node, kwargs, key, 0)
+            if not running:
+                if sched.pending:
+                    raise GraphError(f"Graph stalled with pending nodes {[n.name for n in sched.pending]}.")
+                break
+
+            done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node, kwargs, key, attempt = running.pop(task)
+                err = task.exception() if not task.cancelled() else asyncio.CancelledError()
+                if err is not None:
+                    if attempt < node.retries and isinstance(err, Exception):
+                        if node.retry_backoff_s:
+                            await asyncio.sleep(node.retry_backoff_s * (2 ** attempt))
+                        submit(node, kwargs, key, attempt + 1)
+                        continue
+                    raise err
+                sched.release(node)
+                value = task.result()
+                if isinstance(value, Halt):
+                    return value
+                sched.resolve(node, value, key=key)
+        return sched.state
+    finally:
+        for t in running:
+            t.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import contextlib
+import contextvars
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from pydantic import ValidationError
+
+from schemas import Item
+
+# (bucket, item) for each array element that completed in a streamed response
+ItemCallback = Callable[[str, Item], None]
+
+BUCKET_TYPES = {"alternatives": "alternative", "preferences": "preference", "uncertainties": "uncertainty"}
+
+
+class ItemStreamParser:
+    """
+    Incremental scanner over a streamed JSON object like {"alternatives": [{...}, ...], ...}.
+
+    feed() accepts text deltas of any size and returns (key, element) for every object element
+    of a top-level array field whose closing brace has arrived, parsed with json.loads. Text
+    before the first "{" (code fences, prose) is skipped. It only tracks nesting, strings and
+    escapes; the complete response is still parsed and validated as a whole afterwards.
+    """
+
+    def __init__(self) -> None:
+        self._text = ""  # unconsumed tail: from the start of an open element/key, else empty
+        self._stack: List[str] = []  # "{" / "["
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key = ""  # last string closed directly inside the top-level object
+        self._array_key = ""
+        self._elem_start = -1
+        self.errors = 0
+
+    def feed(self, delta: str) -> List[Tuple[str, Dict[str, Any]]]:
+        out: List[Tuple[str, Dict[str, Any]]] = []
+        text = self._text + delta
+        for i in range(len(self._text), len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_key = text[self._string_start + 1 : i]
+                continue
+            if not self._stack:
+                if ch == "{":
+                    self._stack.append("{")
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and self._stack == ["{"]:
+                    self._array_key = self._last_key
+                elif ch == "{" and self._stack == ["{", "["]:
+                    self._elem_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                self._stack.pop()
+                if ch == "}" and self._stack == ["{", "["] and self._elem_start >= 0:
+                    raw = text[self._elem_start : i + 1]
+                    self._elem_start = -1
+                    try:
+                        out.append((self._array_key, json.loads(raw)))
+                    except ValueError:
+                        self.errors += 1
+
+        # keep only what a later delta may still need, so long streams stay linear
+        keep = len(text)
+        if self._elem_start >= 0:
+            keep = self._elem_start
+        elif self._in_string and len(self._stack) == 1:
+            keep = self._string_start
+        self._text = text[keep:]
+        if self._elem_start >= 0:
+            self._elem_start -= keep
+        if self._in_string:
+            self._string_start -= keep
+        return out
+
+
+class ItemSink:
+    """
+    Validates streamed elements one by one as Items and hands them to a callback.
+
+    Elements outside the item buckets are ignored. Elements that fail validation are counted
+    and dropped (the whole response is validated again once complete). type is forced to the
+    bucket's type and a missing provenance is filled with `agent` (default: the bucket name,
+    i.e. the generator agent), as the agents' own hardening would do.
+    """
+
+    def __init__(self, on_item: ItemCallback, agent: str = ""):
+        self.on_item = on_item
+        self.agent = agent
+        self.emitted = 0
+        self.invalid = 0
+
+    def handle(self, elements: List[Tuple[str, Dict[str, Any]]]) -> None:
+        for bucket, raw in elements:
+            kind = BUCKET_TYPES.get(bucket)
+            if kind is None or not isinstance(raw, dict):
+                continue
+            raw = {**raw, "type": kind}
+            raw.setdefault("provenance", {"agent": self.agent or bucket})
+            try:
+                item = Item.model_validate(raw)
+            except ValidationError:
+                self.invalid += 1
+                continue
+            self.emitted += 1
+            self.on_item(bucket, item)
+
+
+_sink: contextvars.ContextVar[ItemSink | None] = contextvars.ContextVar("adq_item_sink", default=None)
+
+
+@contextlib.contextmanager
+def item_stream(on_item: ItemCallback | None, agent: str = "") -> Iterator[ItemSink | None]:
+    """
+    Stream LLM calls made inside the block (if the LLM supports it) and report each completed
+    Item via on_item(bucket, item). None disables streaming for the block.
+    """
+    sink = ItemSink(on_item, agent) if on_item is not None else None
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+
+def current_item_sink() -> ItemSink | None:
+    return _sink.get()
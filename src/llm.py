@@ -2,13 +2,24 @@ from __future__ import annotations
 
 import os
 import json
-from typing import Protocol, Type, TypeVar, cast
+import asyncio
+import inspect
+import threading
+from typing import Any, Callable, Dict, Protocol, Tuple, Type, TypeVar, cast
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from pydantic import BaseModel
 
+from clients import client_key, default_client_registry, text_format
+from ratelimit import RateLimiter, default_rate_limiter
+from tracing import record_queue, record_usage
+from utils import estimate_tokens
+
 load_dotenv()
 
+# Output allowance reserved against the TPM budget before the real usage is known.
+OUTPUT_TOKEN_ALLOWANCE = int(os.getenv("OPENAI_OUTPUT_TOKEN_ALLOWANCE", "1500"))
+
 T = TypeVar("T", bound=BaseModel)
 
 
@@ -17,32 +28,102 @@ class LLM(Protocol):
         ...
 
 
+class AsyncLLM(Protocol):
+    async def complete(self, system: str, user: str) -> str:
+        ...
+
+
+def _messages(system: str, user: str) -> list[dict[str, str]]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+
+def _reserve_tokens(system: str, user: str) -> int:
+    return estimate_tokens(system) + estimate_tokens(user) + OUTPUT_TOKEN_ALLOWANCE
+
+
+def _text_delta(event: Any) -> str | None:
+    return event.delta if getattr(event, "type", None) == "response.output_text.delta" else None
+
+
+def _usage_tokens(resp: Any) -> int | None:
+    usage = getattr(resp, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def _structured_format(model_cls: Type[T]) -> Dict[str, Any]:
+    # pre-compiled strict schema (clients.text_format) when available, else let the SDK build it
+    fmt = text_format(model_cls)
+    return {"text": {"format": fmt}} if fmt is not None else {"text_format": model_cls}
+
+
+def _parsed(resp: Any, model_cls: Type[T]) -> T:
+    if text_format(model_cls) is not None:
+        out = resp.output_text
+        if not out:
+            raise ValueError("OpenAI response output_text is empty (refusal or cut off).")
+        return model_cls.model_validate_json(out)
+    parsed = resp.output_parsed
+    if parsed is None:
+        raise ValueError("OpenAI response output_parsed is None (refusal or cut off).")
+    return cast(T, parsed)
+
+
+def is_async_llm(llm: Any) -> bool:
+    """
+    True if llm's completion methods are coroutines (AsyncLLM), False for a blocking LLM.
+    """
+    fn = getattr(llm, "complete_structured", None) or getattr(llm, "complete", None)
+    return fn is not None and inspect.iscoroutinefunction(fn)
+
+
 class OpenAILLM:
     """
     OpenAI official SDK wrapper.
 
     - complete(): returns a JSON string (JSON mode). Good for simple cases but does NOT guarantee schema.
     - complete_structured(): returns a parsed Pydantic model using Structured Outputs (recommended).
+
+    Every call first acquires a slot from the process-wide RateLimiter (RPM/TPM budgets,
+    priority classes set via ratelimit.rate_context()); a call that fails settles with zero
+    usage, giving its reserved tokens back. The OpenAI client comes from the process-wide
+    clients.ClientRegistry unless one is passed in.
     """
 
-    def __init__(self, model: str | None = None):
-        self.client = OpenAI()  # reads OPENAI_API_KEY from env by default
+    def __init__(
+        self,
+        model: str | None = None,
+        limiter: RateLimiter | None = None,
+        client: OpenAI | None = None,
+        base_url: str | None = None,
+        api_key: str | None = None,
+    ):
+        # reads OPENAI_API_KEY / OPENAI_BASE_URL from env by default
+        self.client = client or default_client_registry().client(base_url, api_key)
         # Recommended: set OPENAI_MODEL=gpt-5-mini in your .env
         self.model = model or os.getenv("OPENAI_MODEL", "gpt-5-mini")
+        self.limiter = limiter or default_rate_limiter()
 
     def complete(self, system: str, user: str) -> str:
         """
         JSON mode: guarantees valid JSON, not strict schema adherence.
         Prefer complete_structured() when you need schema-correct outputs.
         """
-        resp = self.client.responses.create(
-            model=self.model,
-            input=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            text={"format": {"type": "json_object"}},
-        )
+        grant = self.limiter.acquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            resp = self.client.responses.create(
+                model=self.model,
+                input=_messages(system, user),
+                text={"format": {"type": "json_object"}},
+            )
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
         out = resp.output_text
         if out is None:
             raise RuntimeError("OpenAI response output_text is None.")
@@ -53,15 +134,267 @@ class OpenAILLM:
         Structured Outputs: the model is constrained to the schema derived from model_cls.
         Returns a Pydantic model instance.
         """
-        resp = self.client.responses.parse(
-            model=self.model,
-            input=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            text_format=model_cls,
+        grant = self.limiter.acquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            fmt = _structured_format(model_cls)
+            call = self.client.responses.create if "text" in fmt else self.client.responses.parse
+            resp = call(
+                model=self.model,
+                input=_messages(system, user),
+                **fmt,
+            )
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
+        return _parsed(resp, model_cls)
+
+    def complete_stream(self, system: str, user: str, on_delta: Callable[[str], None]) -> str:
+        """
+        complete() over a streamed response: on_delta(text) is called as output text arrives.
+        """
+        grant = self.limiter.acquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            with self.client.responses.stream(
+                model=self.model,
+                input=_messages(system, user),
+                text={"format": {"type": "json_object"}},
+            ) as stream:
+                for event in stream:
+                    delta = _text_delta(event)
+                    if delta:
+                        on_delta(delta)
+                resp = stream.get_final_response()
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
+        out = resp.output_text
+        if out is None:
+            raise RuntimeError("OpenAI response output_text is None.")
+        return out
+
+    def complete_structured_stream(self, system: str, user: str, model_cls: Type[T], on_delta: Callable[[str], None]) -> T:
+        """
+        complete_structured() over a streamed response; the parsed model is returned at the end.
+        """
+        grant = self.limiter.acquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            with self.client.responses.stream(
+                model=self.model,
+                input=_messages(system, user),
+                **_structured_format(model_cls),
+            ) as stream:
+                for event in stream:
+                    delta = _text_delta(event)
+                    if delta:
+                        on_delta(delta)
+                resp = stream.get_final_response()
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
+        return _parsed(resp, model_cls)
+
+
+class AsyncOpenAILLM:
+    """
+    Async counterpart of OpenAILLM built on AsyncOpenAI.
+    Same two methods, awaited instead of blocking a thread per in-flight request.
+    Without an explicit client, each call uses the registry's client for the running loop.
+    """
+
+    def __init__(
+        self,
+        model: str | None = None,
+        limiter: RateLimiter | None = None,
+        client: AsyncOpenAI | None = None,
+        base_url: str | None = None,
+        api_key: str | None = None,
+    ):
+        self._client = client
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model or os.getenv("OPENAI_MODEL", "gpt-5-mini")
+        self.limiter = limiter or default_rate_limiter()
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        return self._client or default_client_registry().aclient(self.base_url, self.api_key)
+
+    async def complete(self, system: str, user: str) -> str:
+        grant = await self.limiter.aacquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            resp = await self.client.responses.create(
+                model=self.model,
+                input=_messages(system, user),
+                text={"format": {"type": "json_object"}},
+            )
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
+        out = resp.output_text
+        if out is None:
+            raise RuntimeError("OpenAI response output_text is None.")
+        return out
+
+    async def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        grant = await self.limiter.aacquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            fmt = _structured_format(model_cls)
+            call = self.client.responses.create if "text" in fmt else self.client.responses.parse
+            resp = await call(
+                model=self.model,
+                input=_messages(system, user),
+                **fmt,
+            )
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
+        return _parsed(resp, model_cls)
+
+    async def complete_stream(self, system: str, user: str, on_delta: Callable[[str], None]) -> str:
+        grant = await self.limiter.aacquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            async with self.client.responses.stream(
+                model=self.model,
+                input=_messages(system, user),
+                text={"format": {"type": "json_object"}},
+            ) as stream:
+                async for event in stream:
+                    delta = _text_delta(event)
+                    if delta:
+                        on_delta(delta)
+                resp = await stream.get_final_response()
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
+        out = resp.output_text
+        if out is None:
+            raise RuntimeError("OpenAI response output_text is None.")
+        return out
+
+    async def complete_structured_stream(
+        self, system: str, user: str, model_cls: Type[T], on_delta: Callable[[str], None]
+    ) -> T:
+        grant = await self.limiter.aacquire(_reserve_tokens(system, user))
+        used: int | None = 0
+        try:
+            async with self.client.responses.stream(
+                model=self.model,
+                input=_messages(system, user),
+                **_structured_format(model_cls),
+            ) as stream:
+                async for event in stream:
+                    delta = _text_delta(event)
+                    if delta:
+                        on_delta(delta)
+                resp = await stream.get_final_response()
+            used = _usage_tokens(resp)
+        finally:
+            self.limiter.settle(grant, used)
+        record_queue(grant.waited_s)
+        record_usage(getattr(resp, "usage", None))
+        return _parsed(resp, model_cls)
+
+
+class ThreadedAsyncLLM:
+    """
+    Adapts a blocking LLM to the AsyncLLM protocol by running each call in a worker thread.
+    Lets arun_mvp() accept any sync LLM (stubs, wrappers) unchanged.
+    """
+
+    def __init__(self, llm: LLM):
+        self.llm = llm
+        self.model = getattr(llm, "model", None)
+
+    async def complete(self, system: str, user: str) -> str:
+        return await asyncio.to_thread(self.llm.complete, system, user)
+
+    async def complete_stream(self, system: str, user: str, on_delta: Callable[[str], None]) -> str:
+        # a blocking LLM without streaming delivers its whole output as one delta
+        if not hasattr(self.llm, "complete_stream"):
+            out = await self.complete(system, user)
+            on_delta(out)
+            return out
+        return await asyncio.to_thread(self.llm.complete_stream, system, user, _on_loop(on_delta))  # type: ignore[attr-defined]
+
+
+class ThreadedAsyncStructuredLLM(ThreadedAsyncLLM):
+    async def complete_structured(self, system: str, user: str, model_cls: Type[T]) -> T:
+        return await asyncio.to_thread(self.llm.complete_structured, system, user, model_cls)  # type: ignore[attr-defined]
+
+    async def complete_structured_stream(
+        self, system: str, user: str, model_cls: Type[T], on_delta: Callable[[str], None]
+    ) -> T:
+        if not hasattr(self.llm, "complete_structured_stream"):
+            return await self.complete_structured(system, user, model_cls)
+        return await asyncio.to_thread(
+            self.llm.complete_structured_stream, system, user, model_cls, _on_loop(on_delta)  # type: ignore[attr-defined]
         )
-        parsed = resp.output_parsed
-        if parsed is None:
-            raise RuntimeError("OpenAI response output_parsed is None.")
-        return cast(T, parsed)
+
+
+def _on_loop(fn: Callable[[str], None]) -> Callable[[str], None]:
+    """
+    Wrap a callback so calls from a worker thread run on the current event loop (in order,
+    before the awaiting coroutine resumes).
+    """
+    loop = asyncio.get_running_loop()
+    return lambda delta: loop.call_soon_threadsafe(fn, delta)
+
+
+def to_async_llm(llm: LLM | AsyncLLM) -> AsyncLLM:
+    """
+    Return llm unchanged if it is already async, otherwise a thread-backed adapter that keeps
+    the same capabilities (structured vs. JSON-mode only).
+    """
+    if is_async_llm(llm):
+        return cast(AsyncLLM, llm)
+    if hasattr(llm, "complete_structured"):
+        return ThreadedAsyncStructuredLLM(cast(LLM, llm))
+    return ThreadedAsyncLLM(cast(LLM, llm))
+
+
+_shared: Dict[Tuple[str, str, str, bool], Any] = {}
+_shared_lock = threading.Lock()
+
+
+def _shared_key(model: str | None, base_url: str | None, api_key: str | None, asynchronous: bool) -> Tuple[str, str, str, bool]:
+    return (*client_key(base_url, api_key), model or os.getenv("OPENAI_MODEL", "gpt-5-mini"), asynchronous)
+
+
+def shared_llm(model: str | None = None, base_url: str | None = None, api_key: str | None = None) -> OpenAILLM:
+    """
+    One OpenAILLM per (base_url, api key, model) for the whole process, on a registry client.
+    """
+    key = _shared_key(model, base_url, api_key, False)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = OpenAILLM(model=model, base_url=base_url, api_key=api_key)
+        return _shared[key]
+
+
+def shared_async_llm(model: str | None = None, base_url: str | None = None, api_key: str | None = None) -> AsyncOpenAILLM:
+    """
+    Async counterpart of shared_llm(); safe across event loops (clients are looked up per loop).
+    """
+    key = _shared_key(model, base_url, api_key, True)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = AsyncOpenAILLM(model=model, base_url=base_url, api_key=api_key)
+        return _shared[key]
@@ -1,103 +1,597 @@
 from __future__ import annotations
 
-from typing import Callable
+import json
+import queue
+import asyncio
+import inspect
+import functools
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Literal
 
-from schemas import DecisionRequest, FinalOutput, ClarificationAnswers
-from llm import LLM, OpenAILLM
+from schemas import (
+    PromptStats,
+    DecisionRequest,
+    DecisionBrief,
+    FinalOutput,
+    ClarificationAnswers,
+    QuestionerOutput,
+    AlternativesOutput,
+    PreferencesOutput,
+    UncertaintiesOutput,
+    GeneratorsOutput,
+    CriticOutput,
+    CriticSynthesisOutput,
+    SynthesisSummary,
+    SynthesizerOutput,
+    PipelineEvent,
+    ProgressEvent,
+    QuestionsEvent,
+    FinalEvent,
+)
+from llm import LLM, AsyncLLM, shared_llm, shared_async_llm, to_async_llm
 
 from agents.orchestrator import Orchestrator
 from agents.alternatives import AlternativesAgent
 from agents.preferences import PreferencesAgent
 from agents.uncertainties import UncertaintiesAgent
+from agents.generators import GeneratorsAgent
 from agents.critic import CriticAgent
 from agents.synthesizer import Synthesizer
-from agents.questioner import QuestionerAgent
+from compact import stage_budgets
+from tracing import Tracer, tracing, snapshot
+from speculation import SpeculationStore, speculation_key, default_speculation_store
+from ratelimit import current_session
+from graph import ChainMemo, Halt, Memo, StageGraph, run_graph, arun_graph
+from checkpoint import CheckpointStore, RunCheckpoint, default_checkpoint_store, run_id_for
+from briefcache import BriefCache
+from cancel import Cancelled, CancelToken, cancel_scope
+from stages import MVP_GRAPH, RunContext, cached_drafts
 
 ProgressCallback = Callable[[str, int], None]  # (stage_label, percent_0_100)
+EventCallback = Callable[[PipelineEvent], None]
 
-def run_mvp(
-    req: DecisionRequest,
-    llm: LLM | None = None,
-    use_questioner: bool = False,
-    clarification_answers: ClarificationAnswers | None = None,
-    progress: ProgressCallback | None = None,
-) -> FinalOutput:
+# "llm": Synthesizer re-emits FinalOutput via the model (original behavior)
+# "local": FinalOutput assembled locally from brief + CriticOutput, no LLM call
+# "summary": local assembly plus one small LLM call for Meta.synthesis_summary only
+# "fused": the critic call also writes synthesis_summary/critic notes; local assembly, no Synthesizer call
+SynthesisMode = Literal["llm", "local", "summary", "fused"]
+
+# "split": one Alternatives/Preferences/Uncertainties agent call each (specialized prompts)
+# "fused": a single GeneratorsAgent call returning all three lists (fewer requests/input tokens)
+GenerationMode = Literal["split", "fused"]
+
+# every schema an agent asks the LLM for (for clients.ClientRegistry.prewarm())
+OUTPUT_SCHEMAS = (
+    QuestionerOutput,
+    DecisionBrief,
+    AlternativesOutput,
+    PreferencesOutput,
+    UncertaintiesOutput,
+    GeneratorsOutput,
+    CriticOutput,
+    CriticSynthesisOutput,
+    SynthesisSummary,
+    SynthesizerOutput,
+)
+
+def _make_tick(progress: ProgressCallback | None) -> Callable[[str, int], None]:
     def tick(label: str, pct: int) -> None:
         if progress is not None:
             progress(label, max(0, min(100, int(pct))))
 
-    llm = llm or OpenAILLM()
+    return tick
 
-    tick("Initializing...", 3)
 
-    orch = Orchestrator(llm=llm)
-    critic = CriticAgent(llm=llm)
-    synth = Synthesizer(llm=llm)
+def _make_emit(events: EventCallback | None) -> Callable[[PipelineEvent], None]:
+    def emit(event: PipelineEvent) -> None:
+        if events is not None:
+            events(event)
 
-    # --- Phase 1: ask questions (return early) ---
-    if use_questioner and clarification_answers is None:
-        tick("Generating clarification questions...", 10)
-        q_agent = QuestionerAgent(llm=llm)
-        q_out = q_agent.run(req, iteration=0)
+    return emit
 
-        # If model decides no need to ask, continue normally
-        if q_out.ask and q_out.questions:
-            tick("Summarizing decision brief...", 22)
-            brief = orch.build_brief(req)
 
-            stub = FinalOutput(
-                decision_title=req.title,
-                brief=brief,
-                alternatives=[],
-                preferences=[],
-                uncertainties=[],
-            )
-            stub.meta.used_questioner = True
-            stub.meta.pending_clarification = True
-            stub.meta.clarifying_questions = q_out.questions
-            tick("Waiting for answers...", 28)
-            return stub
-
-        tick("No clarification needed...", 18)
-
-    # --- Phase 2: build brief (with answers if provided) ---
-    if use_questioner and clarification_answers is not None:
-        tick("Integrating answers into brief...", 22)
-        brief = orch.build_brief_with_clarification(req, clarification_answers)
-    else:
-        tick("Building decision brief...", 22)
-        brief = orch.build_brief(req)
+def _traceable(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Install a Tracer for the call when it is invoked with trace=True; the wrapped pipeline
+    attaches the collected spans to meta.trace (works for plain and coroutine functions).
+    """
+    sig = inspect.signature(fn)
 
-    alt_agent = AlternativesAgent(llm)
-    pref_agent = PreferencesAgent(llm)
-    unc_agent = UncertaintiesAgent(llm)
+    def wants_trace(args: Any, kwargs: Any) -> bool:
+        return bool(sig.bind_partial(*args, **kwargs).arguments.get("trace", False))
 
-    tick("Generating alternatives...", 40)
-    alt_out = alt_agent.run(brief, iteration=0)
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def awrapper(*args: Any, **kwargs: Any) -> Any:
+            with tracing(Tracer() if wants_trace(args, kwargs) else None):
+                return await fn(*args, **kwargs)
 
-    tick("Generating preferences...", 58)
-    pref_out = pref_agent.run(brief, iteration=0)
+        return awrapper
 
-    tick("Generating uncertainties...", 72)
-    unc_out = unc_agent.run(brief, iteration=0)
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with tracing(Tracer() if wants_trace(args, kwargs) else None):
+            return fn(*args, **kwargs)
+
+    return wrapper
 
-    tick("Critic review...", 85)
-    critic_out = critic.review(
-        brief=brief,
-        alternatives=alt_out.alternatives,
-        preferences=pref_out.preferences,
-        uncertainties=unc_out.uncertainties,
-        iteration=0,
-    )
 
-    tick("Synthesizing final output...", 95)
-    final = synth.synthesize(brief=brief, critic_out=critic_out)
+def _make_agents(llm: Any, compact_prompts: bool, token_budgets: Dict[str, int] | None) -> Dict[str, Any]:
+    """
+    One agent per stage, keyed by stage name. compact_prompts switches every stage that has a
+    compact encoding to it, each with its own input-token budget.
+    """
+    budgets = stage_budgets(token_budgets) if compact_prompts else {}
 
+    def kw(stage: str) -> Dict[str, Any]:
+        return {"compact": compact_prompts, "budget": budgets.get(stage)}
+
+    return {
+        "orchestrator": Orchestrator(llm, **kw("orchestrator")),
+        "alternatives": AlternativesAgent(llm, **kw("alternatives")),
+        "preferences": PreferencesAgent(llm, **kw("preferences")),
+        "uncertainties": UncertaintiesAgent(llm, **kw("uncertainties")),
+        "generators": GeneratorsAgent(llm, **kw("generators")),
+        "critic": CriticAgent(llm, **kw("critic")),
+        "synthesizer": Synthesizer(llm, **kw("synthesizer")),
+    }
+
+
+def _collect_prompt_stats(agents: Dict[str, Any]) -> List[PromptStats]:
+    return [st for a in agents.values() for st in getattr(a, "prompt_stats", [])]
+
+
+def _finalize(
+    final: FinalOutput,
+    use_questioner: bool,
+    clarification_answers: ClarificationAnswers | None,
+) -> FinalOutput:
     # Fill meta flags
     final.meta.used_questioner = use_questioner
     final.meta.pending_clarification = False
     if clarification_answers is not None:
         final.meta.clarification_answers = clarification_answers.answers
+    final.meta.trace = snapshot()
+    return final
+
+
+def _run_context(
+    req: DecisionRequest,
+    llm: Any,
+    emit: Callable[[PipelineEvent], None],
+    use_questioner: bool,
+    clarification_answers: ClarificationAnswers | None,
+    synthesis: SynthesisMode,
+    generation: GenerationMode,
+    dedup: bool,
+    dedup_threshold: float,
+    compact_prompts: bool,
+    token_budgets: Dict[str, int] | None,
+    stream_items: bool,
+    speculate: bool,
+    speculation_store: SpeculationStore | None,
+) -> RunContext:
+    store = speculation_store or default_speculation_store()
+    # the rate-limiter session (e.g. the Streamlit session) scopes drafts to their user
+    spec_key = speculation_key(
+        req,
+        compact_prompts,
+        token_budgets,
+        model=getattr(llm, "model", None) or type(llm).__name__,
+        generation=generation,
+        session=current_session(),
+    )
+    spec = None
+    if speculate and use_questioner and clarification_answers is not None:
+        spec = store.take(spec_key)
+    return RunContext(
+        req,
+        llm,
+        _make_agents(llm, compact_prompts, token_budgets),
+        emit,
+        use_questioner=use_questioner,
+        synthesis=synthesis,
+        generation=generation,
+        dedup=dedup,
+        dedup_threshold=dedup_threshold,
+        stream_items=stream_items,
+        speculate=speculate,
+        store=store,
+        spec_key=spec_key,
+        spec=spec,
+    )
+
+
+def _graph_inputs(req: DecisionRequest, use_questioner: bool, clarification_answers: ClarificationAnswers | None) -> Dict[str, Any]:
+    return {"request": req, "answers": clarification_answers if use_questioner else None}
+
+
+def _memo_salt(llm: Any, synthesis: SynthesisMode, compact_prompts: bool, token_budgets: Dict[str, int] | None) -> str:
+    # everything besides the node inputs that changes what a stage would return
+    return json.dumps(
+        {
+            "model": getattr(llm, "model", None) or type(llm).__name__,
+            "synthesis": synthesis,
+            "compact": compact_prompts,
+            "budgets": token_budgets or {},
+        },
+        sort_keys=True,
+    )
+
+
+def _begin_checkpoint(
+    checkpoint: CheckpointStore | None,
+    run_id: str | None,
+    req: DecisionRequest,
+    answers: ClarificationAnswers | None,
+    salt: str,
+    options: Dict[str, Any],
+) -> RunCheckpoint | None:
+    if checkpoint is None:
+        return None
+    return checkpoint.begin(run_id or run_id_for(req, answers, salt), req, answers, options)
+
+
+def _run_memo(
+    ctx: RunContext,
+    answers: ClarificationAnswers | None,
+    salt: str,
+    memos: List[Memo | None],
+    brief_cache: BriefCache | None,
+) -> Memo | None:
+    """
+    Combine the run's memos; with a brief cache, look the request up and, on a similar but
+    not exact match, hand its generator outputs to the speculation stage as drafts.
+    """
+    memos = [m for m in memos if m is not None]
+    if brief_cache is not None:
+        bmemo, match = brief_cache.lookup(ctx.req, answers, salt)
+        memos.append(bmemo)
+        if match is not None and not match.exact and ctx.spec is None:
+            ctx.spec = cached_drafts(brief_cache.get_output, match.brief, salt, ctx.generation)
+    if not memos:
+        return None
+    return memos[0] if len(memos) == 1 else ChainMemo(*memos)
+
+
+def _end_checkpoint(run: RunCheckpoint | None, result: Dict[str, Any] | Halt | None, error: BaseException | None = None) -> None:
+    if run is None:
+        return
+    if isinstance(error, Cancelled):
+        run.store.finish(run.run_id, "cancelled", str(error))
+    elif error is not None:
+        run.store.finish(run.run_id, "failed", f"{type(error).__name__}: {error}")
+    else:
+        run.store.finish(run.run_id, "waiting" if isinstance(result, Halt) else "done")
+
+
+def _complete(
+    result: Dict[str, Any] | Halt,
+    ctx: RunContext,
+    tick: Callable[[str, int], None],
+    use_questioner: bool,
+    clarification_answers: ClarificationAnswers | None,
+) -> FinalOutput:
+    if isinstance(result, Halt):
+        stub = result.value
+        ctx.emit(QuestionsEvent(questions=stub.meta.clarifying_questions))
+        tick("Waiting for answers...", 28)
+        stub.meta.prompt_stats = _collect_prompt_stats(ctx.agents)
+        stub.meta.trace = snapshot()
+        ctx.emit(FinalEvent(final=stub))
+        return stub
+
+    spec = result["speculation"]
+    final = _finalize(result["final"], use_questioner, clarification_answers)
+    final.meta.dedup_removed = result["dedup"]["removed"] if result["dedup"] is not None else []
+    final.meta.prompt_stats = _collect_prompt_stats(ctx.agents) + (ctx.spec.prompt_stats() if spec else [])
+    final.meta.speculation = spec["outcome"] if spec else None
+    ctx.emit(FinalEvent(final=final))
 
     tick("Done", 100)
-    return final
\ No newline at end of file
+    return final
+
+
+@_traceable
+def run_mvp(
+    req: DecisionRequest,
+    llm: LLM | None = None,
+    use_questioner: bool = False,
+    clarification_answers: ClarificationAnswers | None = None,
+    progress: ProgressCallback | None = None,
+    parallel: bool = False,
+    max_workers: int = 3,
+    events: EventCallback | None = None,
+    synthesis: SynthesisMode = "llm",
+    generation: GenerationMode = "split",
+    dedup: bool = False,
+    dedup_threshold: float = 0.6,
+    compact_prompts: bool = False,
+    token_budgets: Dict[str, int] | None = None,
+    trace: bool = False,
+    stream_items: bool = False,
+    speculate: bool = False,
+    speculation_store: SpeculationStore | None = None,
+    graph: StageGraph | None = None,
+    memo: Memo | None = None,
+    checkpoint: CheckpointStore | None = None,
+    run_id: str | None = None,
+    brief_cache: BriefCache | None = None,
+    cancel: CancelToken | None = None,
+) -> FinalOutput:
+    """
+    parallel=True runs the Alternatives/Preferences/Uncertainties agents concurrently
+    on a pool of at most max_workers threads (they only depend on the brief).
+
+    synthesis selects how FinalOutput is produced (see SynthesisMode); all modes return
+    the same schema.
+
+    generation="fused" replaces the three generator calls with one GeneratorsAgent call (see
+    GenerationMode); items carry the same type/provenance either way.
+
+    dedup=True drops near-duplicate generator items locally before the critic sees them
+    (see dedup.dedupe_buckets); removals are listed in meta.dedup_removed.
+
+    compact_prompts=True sends compact prompt encodings (short item IDs, no provenance/null
+    fields, plain-text brief) capped by per-stage input-token budgets (compact.DEFAULT_STAGE_BUDGETS,
+    overridable via token_budgets). Estimated tokens before/after land in meta.prompt_stats.
+
+    trace=True records a span per stage and per LLM call (wall/queue time, token usage,
+    retries, validation failures) into meta.trace; see tracing.export_jsonl().
+
+    stream_items=True streams the generator, critic and synthesizer responses (LLMs with
+    complete_structured_stream()/complete_stream()) and emits an ItemEvent for each item as soon
+    as it has been received and validated, ahead of the stage's own event. With the thread pool
+    these events are emitted from worker threads. They are previews: the stage result and
+    FinalOutput are still built from the validated full responses.
+
+    speculate=True (with use_questioner): phase 1 starts the three generator agents on the
+    unclarified brief in the background (background rate-limit priority) before returning the
+    pending stub. Phase 2 for the same request, model, generation mode and rate_context()
+    session picks the drafts up from speculation_store (default: process-wide): reused as-is
+    if the clarified brief is materially unchanged, otherwise handed to the critic as seeds.
+    meta.speculation records which.
+
+    graph replaces the stage graph (default stages.MVP_GRAPH), e.g. MVP_GRAPH.without("critic")
+    or MVP_GRAPH.configure("critic", timeout_s=60, retries=1). memo (see graph.Memo) short-cuts
+    cacheable stages whose inputs and settings were seen before.
+
+    checkpoint (see checkpoint.CheckpointStore) stores each cacheable stage's output under
+    run_id (default: a hash of request, answers and settings) as it completes. If the run fails
+    later, calling again with the same run_id, or resume_mvp(run_id), picks up after the last
+    completed stage instead of paying for every call again.
+
+    brief_cache (see briefcache.BriefCache) matches the request against earlier ones by text
+    similarity: a near-identical earlier decision supplies its brief and every stage output
+    built on it; a less similar one supplies its generator outputs as drafts for the
+    speculation stage (meta.speculation says whether they were reused or seeded the critic).
+
+    cancel (see cancel.CancelToken) stops the run once cancelled: LLM calls already in flight
+    finish, no further call is made and cancel.Cancelled is raised. Completed stages stay in
+    the checkpoint, if any.
+
+    events, if given, receives a typed PipelineEvent as each stage result becomes available
+    (see run_mvp_stream()).
+    """
+    tick = _make_tick(progress)
+    emit = _make_emit(events)
+
+    llm = llm or shared_llm()
+
+    tick("Initializing...", 0)
+
+    ctx = _run_context(
+        req, llm, emit, use_questioner, clarification_answers, synthesis, generation, dedup, dedup_threshold,
+        compact_prompts, token_budgets, stream_items, speculate, speculation_store,
+    )
+    salt = _memo_salt(llm, synthesis, compact_prompts, token_budgets)
+    inputs = _graph_inputs(req, use_questioner, clarification_answers)
+    run = _begin_checkpoint(
+        checkpoint, run_id, req, clarification_answers, salt,
+        {
+            "use_questioner": use_questioner, "parallel": parallel, "max_workers": max_workers,
+            "synthesis": synthesis, "generation": generation, "dedup": dedup, "dedup_threshold": dedup_threshold,
+            "compact_prompts": compact_prompts, "token_budgets": token_budgets, "trace": trace,
+            "stream_items": stream_items, "speculate": speculate,
+        },
+    )
+    memo = _run_memo(ctx, inputs["answers"], salt, [memo, run], brief_cache)
+    try:
+        with cancel_scope(cancel):
+            result = run_graph(
+                graph or MVP_GRAPH,
+                ctx,
+                inputs,
+                # phase 1 always overlaps questioner and orchestrator
+                max_workers=max(2, max_workers),
+                progress=tick,
+                memo=memo,
+                memo_salt=salt,
+                serial_lanes=() if parallel else ("generators",),
+            )
+    except BaseException as e:
+        _end_checkpoint(run, None, e)
+        raise
+    _end_checkpoint(run, result)
+    return _complete(result, ctx, tick, use_questioner, clarification_answers)
+
+
+@_traceable
+async def arun_mvp(
+    req: DecisionRequest,
+    llm: AsyncLLM | LLM | None = None,
+    use_questioner: bool = False,
+    clarification_answers: ClarificationAnswers | None = None,
+    progress: ProgressCallback | None = None,
+    events: EventCallback | None = None,
+    synthesis: SynthesisMode = "llm",
+    generation: GenerationMode = "split",
+    dedup: bool = False,
+    dedup_threshold: float = 0.6,
+    compact_prompts: bool = False,
+    token_budgets: Dict[str, int] | None = None,
+    trace: bool = False,
+    stream_items: bool = False,
+    speculate: bool = False,
+    speculation_store: SpeculationStore | None = None,
+    graph: StageGraph | None = None,
+    memo: Memo | None = None,
+    checkpoint: CheckpointStore | None = None,
+    run_id: str | None = None,
+    brief_cache: BriefCache | None = None,
+    cancel: CancelToken | None = None,
+) -> FinalOutput:
+    """
+    Coroutine version of run_mvp(). The three generator agents always run concurrently
+    on the event loop. A blocking LLM is accepted and driven through worker threads.
+    With speculate=True the phase-1 drafts run as a task on the current loop; a phase 2 on a
+    different loop cannot use them and regenerates.
+    """
+    tick = _make_tick(progress)
+    emit = _make_emit(events)
+
+    allm = to_async_llm(llm) if llm is not None else shared_async_llm()
+
+    tick("Initializing...", 0)
+
+    ctx = _run_context(
+        req, allm, emit, use_questioner, clarification_answers, synthesis, generation, dedup, dedup_threshold,
+        compact_prompts, token_budgets, stream_items, speculate, speculation_store,
+    )
+    salt = _memo_salt(allm, synthesis, compact_prompts, token_budgets)
+    inputs = _graph_inputs(req, use_questioner, clarification_answers)
+    run = _begin_checkpoint(
+        checkpoint, run_id, req, clarification_answers, salt,
+        {
+            "use_questioner": use_questioner, "synthesis": synthesis, "generation": generation, "dedup": dedup,
+            "dedup_threshold": dedup_threshold, "compact_prompts": compact_prompts, "token_budgets": token_budgets,
+            "trace": trace, "stream_items": stream_items, "speculate": speculate,
+        },
+    )
+    memo = _run_memo(ctx, inputs["answers"], salt, [memo, run], brief_cache)
+    try:
+        with cancel_scope(cancel):
+            result = await arun_graph(
+                graph or MVP_GRAPH,
+                ctx,
+                inputs,
+                progress=tick,
+                memo=memo,
+                memo_salt=salt,
+            )
+    except BaseException as e:
+        _end_checkpoint(run, None, e)
+        raise
+    _end_checkpoint(run, result)
+    return _complete(result, ctx, tick, use_questioner, clarification_answers)
+
+
+def _resume_args(run_id: str, checkpoint: CheckpointStore | None, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    store = checkpoint or default_checkpoint_store()
+    run = store.load(run_id)
+    if run is None:
+        raise KeyError(f"No checkpointed run {run_id!r}.")
+    req, answers, options = run
+    return {"req": req, "clarification_answers": answers, **options, **kwargs, "checkpoint": store, "run_id": run_id}
+
+
+def resume_mvp(run_id: str, checkpoint: CheckpointStore | None = None, **kwargs: Any) -> FinalOutput:
+    """
+    Re-run a checkpointed run_mvp() call from its stored request, answers and options (keyword
+    arguments override them; llm/progress/events are not stored and must be passed again).
+    Stages that completed in an earlier attempt are taken from the checkpoint.
+    """
+    return run_mvp(**_resume_args(run_id, checkpoint, kwargs))
+
+
+async def aresume_mvp(run_id: str, checkpoint: CheckpointStore | None = None, **kwargs: Any) -> FinalOutput:
+    """
+    Coroutine version of resume_mvp().
+    """
+    kwargs = _resume_args(run_id, checkpoint, kwargs)
+    for k in ("parallel", "max_workers"):
+        kwargs.pop(k, None)
+    return await arun_mvp(**kwargs)
+
+
+_STREAM_DONE = object()
+
+
+def run_mvp_stream(req: DecisionRequest, **kwargs: Any) -> Iterator[PipelineEvent]:
+    """
+    Generator form of run_mvp(): yields ProgressEvent ticks and typed partial results
+    (BriefEvent, QuestionsEvent, AgentOutputEvent, CriticEvent) as soon as each stage finishes,
+    ending with a FinalEvent. Accepts the same keyword arguments as run_mvp().
+    Pipeline errors are re-raised from the generator.
+
+    The pipeline runs on a background thread; closing the generator early stops delivery
+    but lets the in-flight run finish.
+
+    runner replaces run_mvp() as the function called (same signature), e.g.
+    coalesce.Coalescer.run to share identical in-flight runs.
+    """
+    if "progress" in kwargs or "events" in kwargs:
+        raise TypeError("run_mvp_stream() provides its own progress/events callbacks.")
+    runner = kwargs.pop("runner", None) or run_mvp
+
+    q: "queue.Queue[Any]" = queue.Queue()
+    failure: List[BaseException] = []
+
+    def worker() -> None:
+        try:
+            runner(
+                req,
+                progress=lambda label, pct: q.put(ProgressEvent(label=label, pct=pct)),
+                events=q.put,
+                **kwargs,
+            )
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            q.put(_STREAM_DONE)
+
+    ctx = contextvars.copy_context()
+    threading.Thread(target=ctx.run, args=(worker,), name="adq-stream", daemon=True).start()
+
+    while True:
+        item = q.get()
+        if item is _STREAM_DONE:
+            break
+        yield item
+
+    if failure:
+        raise failure[0]
+
+
+async def arun_mvp_stream(req: DecisionRequest, **kwargs: Any) -> AsyncIterator[PipelineEvent]:
+    """
+    Async-iterator form of arun_mvp() with the same event sequence as run_mvp_stream().
+    Closing the iterator early cancels the underlying run.
+    """
+    if "progress" in kwargs or "events" in kwargs:
+        raise TypeError("arun_mvp_stream() provides its own progress/events callbacks.")
+
+    q: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    task = asyncio.ensure_future(
+        arun_mvp(
+            req,
+            progress=lambda label, pct: q.put_nowait(ProgressEvent(label=label, pct=pct)),
+            events=q.put_nowait,
+            **kwargs,
+        )
+    )
+    task.add_done_callback(lambda _: q.put_nowait(_STREAM_DONE))
+
+    try:
+        while True:
+            item = await q.get()
+            if item is _STREAM_DONE:
+                break
+            yield item
+        task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
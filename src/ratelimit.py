@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import threading
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Literal
+
+from cancel import check_cancelled, current_token
+
+Priority = Literal["interactive", "batch", "background"]
+
+# lower rank is served first
+PRIORITY_RANK: Dict[str, int] = {"interactive": 0, "batch": 1, "background": 2}
+
+# how often a waiting acquire() re-checks its run's CancelToken
+_CANCEL_POLL_S = 0.25
+
+_priority_var: ContextVar[str] = ContextVar("adq_priority", default="interactive")
+_session_var: ContextVar[str] = ContextVar("adq_session", default="default")
+
+
+@contextmanager
+def rate_context(priority: Priority | None = None, session: str | None = None) -> Iterator[None]:
+    """
+    Tag every LLM call made inside the block (including worker threads/tasks that copy the
+    context) with a priority class and a fair-share session key.
+    """
+    tokens = []
+    if priority is not None:
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"Unknown priority {priority!r}. Expected one of {list(PRIORITY_RANK)}.")
+        tokens.append((_priority_var, _priority_var.set(priority)))
+    if session is not None:
+        tokens.append((_session_var, _session_var.set(session)))
+    try:
+        yield
+    finally:
+        for var, tok in reversed(tokens):
+            var.reset(tok)
+
+
+def current_session() -> str:
+    """
+    Session key set by the innermost rate_context() ("default" outside one).
+    """
+    return _session_var.get()
+
+
+class _Bucket:
+    """
+    Classic token bucket refilled continuously at per_minute / 60 per second, capped at per_minute.
+    per_minute=None means unlimited.
+    """
+
+    def __init__(self, per_minute: float | None):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute or 0)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.per_minute is None:
+            return
+        self.tokens = min(float(self.per_minute), self.tokens + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def wait_s(self, n: float) -> float:
+        if self.per_minute is None:
+            return 0.0
+        n = min(n, float(self.per_minute))  # oversized requests wait for a full bucket, not forever
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) * 60.0 / self.per_minute
+
+    def take(self, n: float) -> None:
+        if self.per_minute is not None:
+            self.tokens -= n
+
+
+class _Ticket:
+    __slots__ = ("seq", "rank", "priority", "session", "tokens", "enqueued")
+
+    def __init__(self, seq: int, priority: str, session: str, tokens: int):
+        self.seq = seq
+        self.rank = PRIORITY_RANK[priority]
+        self.priority = priority
+        self.session = session
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+
+
+class Grant:
+    def __init__(self, tokens: int, priority: str, waited_s: float):
+        self.tokens = tokens
+        self.priority = priority
+        self.waited_s = waited_s
+
+
+class RateLimiter:
+    """
+    Request/token budget scheduler shared by every LLM client in the process.
+
+    Waiters are served strictly by priority class (interactive before batch before background);
+    within a class, the session that has been granted the fewest calls goes first, then FIFO.
+    A call reserves its estimated tokens up front; settle() corrects the TPM bucket with the
+    actual usage reported by the API.
+    """
+
+    def __init__(self, rpm: float | None = None, tpm: float | None = None):
+        self._req = _Bucket(rpm)
+        self._tok = _Bucket(tpm)
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: Dict[int, _Ticket] = {}
+        self._served: Dict[str, int] = {}
+
+        self.max_queue_depth = 0
+        self._granted: Dict[str, int] = {p: 0 for p in PRIORITY_RANK}
+        self._wait_total: Dict[str, float] = {p: 0.0 for p in PRIORITY_RANK}
+        self._wait_max: Dict[str, float] = {p: 0.0 for p in PRIORITY_RANK}
+
+    @property
+    def rpm(self) -> float | None:
+        return self._req.per_minute
+
+    @property
+    def tpm(self) -> float | None:
+        return self._tok.per_minute
+
+    def _enqueue(self, tokens: int, priority: str | None, session: str | None) -> _Ticket:
+        t = _Ticket(next(self._seq), priority or _priority_var.get(), session or _session_var.get(), tokens)
+        with self._cond:
+            if t.session not in self._served:
+                active = [self._served.get(w.session, 0) for w in self._waiting.values()]
+                self._served[t.session] = min(active) if active else 0
+            self._waiting[t.seq] = t
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+        return t
+
+    def _poll_locked(self, t: _Ticket) -> float:
+        """
+        Grant t if it is at the head of the queue and both buckets have room.
+        Returns 0.0 when granted, else how long to wait before polling again.
+        """
+        head = min(self._waiting.values(), key=lambda w: (w.rank, self._served.get(w.session, 0), w.seq))
+        if head is not t:
+            return 0.05
+        now = time.monotonic()
+        self._req.refill(now)
+        self._tok.refill(now)
+        wait = max(self._req.wait_s(1), self._tok.wait_s(t.tokens))
+        if wait > 0:
+            return wait
+
+        self._req.take(1)
+        self._tok.take(t.tokens)
+        del self._waiting[t.seq]
+        self._served[t.session] = self._served.get(t.session, 0) + 1
+        if len(self._served) > 10_000:
+            live = {w.session for w in self._waiting.values()}
+            self._served = {k: v for k, v in self._served.items() if k in live}
+
+        waited = now - t.enqueued
+        self._granted[t.priority] += 1
+        self._wait_total[t.priority] += waited
+        self._wait_max[t.priority] = max(self._wait_max[t.priority], waited)
+        self._cond.notify_all()
+        return 0.0
+
+    def _grant(self, t: _Ticket) -> Grant:
+        return Grant(t.tokens, t.priority, time.monotonic() - t.enqueued)
+
+    def _abandon(self, t: _Ticket) -> None:
+        with self._cond:
+            self._waiting.pop(t.seq, None)
+            self._cond.notify_all()
+
+    def acquire(self, tokens: int = 0, priority: Priority | None = None, session: str | None = None) -> Grant:
+        """
+        Block until one request slot and `tokens` TPM budget are available for this caller.
+        Raises cancel.Cancelled if the caller's run is cancelled while it waits.
+        """
+        t = self._enqueue(tokens, priority, session)
+        cancel = current_token()
+        try:
+            with self._cond:
+                while True:
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                    w = self._poll_locked(t)
+                    if w == 0.0:
+                        return self._grant(t)
+                    # a cancelled run leaves the queue within _CANCEL_POLL_S
+                    self._cond.wait(timeout=w if cancel is None else min(w, _CANCEL_POLL_S))
+        except BaseException:
+            self._abandon(t)
+            raise
+
+    async def aacquire(self, tokens: int = 0, priority: Priority | None = None, session: str | None = None) -> Grant:
+        """
+        Event-loop friendly acquire(): polls without holding a thread while waiting.
+        """
+        t = self._enqueue(tokens, priority, session)
+        try:
+            while True:
+                check_cancelled()
+                with self._cond:
+                    w = self._poll_locked(t)
+                if w == 0.0:
+                    return self._grant(t)
+                await asyncio.sleep(min(w, 0.05))
+        except BaseException:
+            self._abandon(t)
+            raise
+
+    def settle(self, grant: Grant, actual_tokens: int | None) -> None:
+        """
+        Replace the estimated token reservation with the usage reported by the API.
+        """
+        if actual_tokens is None:
+            return
+        with self._cond:
+            self._tok.take(actual_tokens - grant.tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            by_priority = {}
+            for p in PRIORITY_RANK:
+                n = self._granted[p]
+                by_priority[p] = {
+                    "granted": n,
+                    "avg_wait_s": round(self._wait_total[p] / n, 4) if n else 0.0,
+                    "max_wait_s": round(self._wait_max[p], 4),
+                    "queued": sum(1 for w in self._waiting.values() if w.priority == p),
+                }
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queue_depth": len(self._waiting),
+                "max_queue_depth": self.max_queue_depth,
+                "by_priority": by_priority,
+            }
+
+
+def _env_float(name: str) -> float | None:
+    v = os.getenv(name, "").strip()
+    return float(v) if v and float(v) > 0 else None
+
+
+_default_limiter: RateLimiter | None = None
+_default_lock = threading.Lock()
+
+
+def default_rate_limiter() -> RateLimiter:
+    """
+    Process-wide limiter configured from OPENAI_RPM / OPENAI_TPM (unset or 0 = unlimited).
+    """
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(rpm=_env_float("OPENAI_RPM"), tpm=_env_float("OPENAI_TPM"))
+        return _default_limiter
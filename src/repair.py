@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import re
+import json
+import threading
+from typing import Any, Dict, List, Tuple, Type, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+
+_CLOSE = {"{": "}", "[": "]"}
+
+# cut points tried (last first) when closing a truncated document
+_MAX_CUTS = 256
+
+
+def salvage_json(text: str | None) -> Tuple[Any, str | None]:
+    """
+    Recover a JSON document from model output that json.loads() rejects: code fences or prose
+    around it, or a response cut off mid-way (closed after its last complete value).
+
+    Returns (data, open_key): open_key is None for a complete document, otherwise the top-level
+    key whose value was cut off ("" if the cut fell between fields). Raises ValueError if nothing can be recovered.
+    """
+    if not text:
+        raise ValueError("Model output is empty.")
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError(f"No JSON found in model output. Output was:\n{text}")
+    start = min(starts)
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+        return data, None
+    except ValueError:
+        pass
+
+    for end, closers, open_key in reversed(_cut_points(text, start)[-_MAX_CUTS:]):
+        try:
+            return json.loads(text[start:end] + closers), open_key
+        except ValueError:
+            continue
+    raise ValueError(f"Could not recover JSON from model output. Output was:\n{text}")
+
+
+def _cut_points(text: str, start: int) -> List[Tuple[int, str, str | None]]:
+    """
+    (end, closing brackets, open top-level key) for every place a truncated document can be cut
+    and closed: between top-level fields, between elements of their containers, and right
+    after a "[" (empty list). Deeper positions are skipped so no half-written element survives.
+    """
+    cuts: List[Tuple[int, str, str | None]] = []
+    stack: List[str] = []
+    in_string = escape = False
+    string_start = -1
+    last_key = ""
+    open_key: str | None = None
+
+    def closers() -> str:
+        return "".join(_CLOSE[c] for c in reversed(stack))
+
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if len(stack) == 1:
+                    last_key = text[string_start + 1 : i]
+            continue
+        if ch == '"':
+            in_string = True
+            string_start = i
+        elif ch in "{[":
+            stack.append(ch)
+            if len(stack) == 2:
+                open_key = last_key
+            if len(stack) == 1 or (ch == "[" and len(stack) == 2):
+                cuts.append((i + 1, closers(), open_key if len(stack) == 2 else ""))
+        elif ch in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                break  # closed but unparseable: a syntax error, not a truncation
+            if len(stack) <= 2:
+                cuts.append((i + 1, closers(), open_key if len(stack) == 2 else ""))
+        elif ch == "," and len(stack) <= 2:
+            cuts.append((i, closers(), open_key if len(stack) == 2 else ""))
+    return cuts
+
+
+def _item_fields(model_cls: Type[BaseModel]) -> Dict[str, Type[BaseModel]]:
+    """
+    Fields of model_cls typed List[SomeModel] (item lists), mapped to the element model.
+    """
+    out: Dict[str, Type[BaseModel]] = {}
+    for name, field in model_cls.model_fields.items():
+        args = get_args(field.annotation)
+        if get_origin(field.annotation) is list and args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            out[name] = args[0]
+    return out
+
+
+def _item_key(item: BaseModel) -> str:
+    text = getattr(item, "text", None)
+    if isinstance(text, str):
+        return " ".join(text.lower().split())
+    return item.model_dump_json()
+
+
+def _error_text(err: Dict[str, Any]) -> str:
+    loc = ".".join(str(x) for x in err.get("loc", ()))
+    return f"{loc}: {err.get('msg', '')}" if loc else str(err.get("msg", ""))
+
+
+class Salvage:
+    """
+    The valid part of an output that failed validation, and what a repair call still has to
+    supply: missing/invalid fields, replacements for dropped list items and the rest of a list
+    that was cut off.
+
+    Item lists are validated element by element, so one bad Item costs one replacement instead
+    of the whole response.
+    """
+
+    def __init__(self, model_cls: Type[BaseModel]):
+        self.model_cls = model_cls
+        self.lists = _item_fields(model_cls)
+        self.data: Dict[str, Any] = {}
+        self.missing: Dict[str, str] = {}  # field -> why it has to be (re)sent
+        self.replace: Dict[str, int] = {}  # list field -> number of items dropped as invalid
+        self.item_errors: Dict[str, List[str]] = {}
+        self.incomplete: str | None = None  # list field cut off by truncation
+        self.items_kept = 0
+        self._absorbed = False
+
+    def usable(self) -> bool:
+        return bool(self.data)
+
+    def pending(self) -> Dict[str, str]:
+        """
+        Instructions per field for the next repair call (empty once the output is complete).
+        """
+        out: Dict[str, str] = {}
+        for name in self.model_cls.model_fields:
+            asks = []
+            if name == self.incomplete:
+                asks.append("the rest of the list (your output was cut off); do not repeat kept items")
+            if self.replace.get(name):
+                errs = "; ".join(self.item_errors.get(name, [])[:3])
+                asks.append(f"{self.replace[name]} replacement item(s) for invalid ones ({errs})")
+            if name in self.missing:
+                asks.append(self.missing[name])
+            if asks:
+                out[name] = " + ".join(asks)
+        return out
+
+    def absorb(self, data: Any, open_key: str | None = None) -> None:
+        """
+        Merge a (salvaged) response: the full output the first time, then repair responses of
+        which only the pending fields are used.
+        """
+        wanted = list(self.pending()) if self._absorbed else list(self.model_cls.model_fields)
+        first = not self._absorbed
+        self._absorbed = True
+        if not isinstance(data, dict):
+            data = {}
+
+        scalars: Dict[str, Any] = {}
+        for name in wanted:
+            if name not in data:
+                continue
+            value = data[name]
+            if name not in self.lists or not isinstance(value, list):
+                if open_key == name:
+                    self.missing[name] = "your output was cut off here, send it again"
+                else:
+                    scalars[name] = value
+                continue
+            good, errors = self._split(name, value)
+            if first:
+                self.items_kept += len(good)
+                self.replace[name] = len(errors)
+                if open_key == name:
+                    self.incomplete = name
+            else:
+                # models often resend the kept items along with the new ones
+                seen = {_item_key(x) for x in self.data.get(name, [])}
+                good = [x for x in good if _item_key(x) not in seen]
+                self.replace[name] = max(0, self.replace.get(name, 0) - len(good))
+                if name == self.incomplete and open_key != name:
+                    self.incomplete = None
+            self.data[name] = self.data.get(name, []) + good
+            self.item_errors[name] = errors
+            self.missing.pop(name, None)
+
+        self._absorb_scalars(scalars)
+        for name, field in self.model_cls.model_fields.items():
+            if name in self.data:
+                continue
+            if field.is_required():
+                self.missing.setdefault(name, "required, missing from your output")
+            elif first and open_key is not None:
+                # optional fields are only skipped when the model chose to leave them out
+                self.missing.setdefault(name, "missing, your output was cut off before it")
+
+    def _split(self, name: str, values: List[Any]) -> Tuple[List[BaseModel], List[str]]:
+        item_cls = self.lists[name]
+        good, errors = [], []
+        for i, raw in enumerate(values):
+            try:
+                good.append(item_cls.model_validate(raw))
+            except ValidationError as e:
+                errors.append(f"{name}[{i}] " + ", ".join(_error_text(x) for x in e.errors()[:2]))
+        return good, errors
+
+    def _absorb_scalars(self, scalars: Dict[str, Any]) -> None:
+        # validate non-list fields together with what is already kept; drop the ones that fail
+        while scalars:
+            try:
+                self.model_cls.model_validate({**self.data, **scalars})
+                break
+            except ValidationError as e:
+                bad = {}
+                for err in e.errors():
+                    name = str(err["loc"][0]) if err.get("loc") else ""
+                    if name in scalars:
+                        bad.setdefault(name, _error_text(err))
+                if not bad:
+                    break  # only fields still to come are missing
+                for name, msg in bad.items():
+                    del scalars[name]
+                    self.missing[name] = f"previous value was invalid ({msg})"
+        for name, value in scalars.items():
+            self.data[name] = value
+            self.missing.pop(name, None)
+
+    def kept_json(self) -> str:
+        kept = {
+            k: [x.model_dump(mode="json", exclude_none=True) for x in v] if k in self.lists else v
+            for k, v in self.data.items()
+        }
+        return json.dumps(kept, ensure_ascii=False)
+
+    def build(self) -> BaseModel:
+        return self.model_cls.model_validate(self.data)
+
+
+_REPAIR_MARKER = "REPAIR:"
+_KEY_RE = re.compile(r'^- "([^"]+)": ', re.MULTILINE)
+
+
+def repair_prompt(user_json: str, sv: Salvage) -> str:
+    """
+    Follow-up user prompt asking only for the pending pieces, with the kept output as context.
+    """
+    lines = [
+        user_json,
+        "",
+        f"{_REPAIR_MARKER} Part of your previous output was invalid or cut off. These parts were valid and are kept:",
+        sv.kept_json(),
+        "Return JSON ONLY with just these keys (no other keys, no markdown, no commentary):",
+    ]
+    lines += [f'- "{name}": {what}' for name, what in sv.pending().items()]
+    return "\n".join(lines)
+
+
+def requested_fields(user: str) -> List[str] | None:
+    """
+    Fields a repair_prompt() asks for, or None if user is not a repair prompt.
+    """
+    at = user.rfind(_REPAIR_MARKER)
+    return _KEY_RE.findall(user, at) if at >= 0 else None
+
+
+class RepairStats:
+    """
+    Per-schema counters for complete_and_validate(): how often outputs failed validation and
+    how they were recovered.
+
+    - salvaged: fixed locally (fences, trailing text) with no extra call
+    - repair_calls: follow-ups asking only for the missing/invalid pieces
+    - full_retries: follow-ups regenerating everything (nothing salvageable, or structured path)
+    - items_kept / kept_tokens: valid items and output tokens (estimate) carried over from failed
+      outputs, i.e. what a full retry would have regenerated
+    """
+
+    FIELDS = (
+        "calls",
+        "first_pass_ok",
+        "failed",
+        "salvaged",
+        "repair_calls",
+        "full_retries",
+        "recovered",
+        "exhausted",
+        "items_kept",
+        "kept_tokens",
+    )
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_schema: Dict[str, Dict[str, int]] = {}
+
+    def record(self, schema: str, **counts: int) -> None:
+        with self._lock:
+            row = self._by_schema.setdefault(schema, dict.fromkeys(self.FIELDS, 0))
+            for k, v in counts.items():
+                row[k] += v
+
+    def reset(self) -> None:
+        with self._lock:
+            self._by_schema.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_schema = {k: dict(v) for k, v in self._by_schema.items()}
+        totals = dict.fromkeys(self.FIELDS, 0)
+        for row in by_schema.values():
+            for k, v in row.items():
+                totals[k] += v
+        return {**totals, "by_schema": by_schema}
+
+
+_default_stats = RepairStats()
+
+
+def default_repair_stats() -> RepairStats:
+    """
+    Process-wide RepairStats that complete_and_validate() records into.
+    """
+    return _default_stats
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import List, Optional, Literal
+from typing import Annotated, List, Optional, Literal, Union
 from pydantic import BaseModel, Field, ConfigDict
 
 
@@ -63,6 +63,12 @@ class UncertaintiesOutput(BaseModel):
     uncertainties: List[Item]
 
 
+class GeneratorsOutput(BaseModel):
+    alternatives: List[Item]
+    preferences: List[Item]
+    uncertainties: List[Item]
+
+
 class CriticOutput(BaseModel):
     alternatives: List[Item]
     preferences: List[Item]
@@ -70,7 +76,49 @@ class CriticOutput(BaseModel):
     notes: List[str] = Field(default_factory=list)
 
 
-class Meta(BaseModel):
+class CriticSynthesisOutput(CriticOutput):
+    # critic review and final summary from one call (synthesis="fused")
+    synthesis_summary: str = Field(..., min_length=1)
+
+
+class DedupRemoval(BaseModel):
+    removed_text: str
+    removed_type: Literal["alternative", "preference", "uncertainty"]
+    kept_text: str
+    kept_type: Literal["alternative", "preference", "uncertainty"]
+    similarity: float
+
+
+class PromptStats(BaseModel):
+    stage: str
+    tokens_before: int
+    tokens_after: int
+    budget: Optional[int] = None
+    truncated: bool = False
+
+
+class TraceSpan(BaseModel):
+    id: int
+    parent_id: Optional[int] = None
+    name: str
+    kind: Literal["run", "stage", "llm"] = "stage"
+    start_s: float = 0.0  # offset from trace start
+    wall_s: float = 0.0
+    queue_s: float = 0.0  # time spent waiting on the rate limiter
+    input_tokens: int = 0
+    output_tokens: int = 0
+    reasoning_tokens: int = 0
+    cached_tokens: int = 0
+    retries: int = 0
+    validation_failures: int = 0
+    error: Optional[str] = None
+
+
+class SynthesisSummary(BaseModel):
+    synthesis_summary: str = Field(..., min_length=1)
+
+
+class SynthesisMeta(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
     mvp: bool = True
@@ -83,10 +131,72 @@ class Meta(BaseModel):
     clarification_answers: List[ClarificationAnswer] = Field(default_factory=list)
 
 
-class FinalOutput(BaseModel):
+class Meta(SynthesisMeta):
+    # run bookkeeping, attached by the pipeline after the stages ran (never asked of the LLM)
+    dedup_removed: List[DedupRemoval] = Field(default_factory=list)
+    prompt_stats: List[PromptStats] = Field(default_factory=list)
+    trace: List[TraceSpan] = Field(default_factory=list)
+    # "reused" / "seeded" when phase 2 used generator drafts made while answers were pending
+    speculation: Optional[Literal["reused", "seeded"]] = None
+
+
+class SynthesizerOutput(BaseModel):
+    # what the LLM Synthesizer returns (synthesis="llm"); the pipeline turns it into FinalOutput
     decision_title: str
     brief: DecisionBrief
     alternatives: List[Item]
     preferences: List[Item] = Field(default_factory=list)
     uncertainties: List[Item] = Field(default_factory=list)
+    meta: SynthesisMeta = Field(default_factory=SynthesisMeta)
+
+
+class FinalOutput(SynthesizerOutput):
     meta: Meta = Field(default_factory=Meta)
+
+
+# --- Streaming stage events (run_mvp_stream / arun_mvp_stream) ---
+
+class ProgressEvent(BaseModel):
+    type: Literal["progress"] = "progress"
+    label: str
+    pct: int
+
+
+class BriefEvent(BaseModel):
+    type: Literal["brief"] = "brief"
+    brief: DecisionBrief
+
+
+class QuestionsEvent(BaseModel):
+    type: Literal["questions"] = "questions"
+    questions: List[ClarifyingQuestion]
+
+
+class AgentOutputEvent(BaseModel):
+    type: Literal["agent_output"] = "agent_output"
+    agent: Literal["alternatives", "preferences", "uncertainties"]
+    items: List[Item]
+
+
+class ItemEvent(BaseModel):
+    # one item parsed from a still-streaming LLM response (run_mvp(stream_items=True))
+    type: Literal["item"] = "item"
+    stage: str
+    bucket: Literal["alternatives", "preferences", "uncertainties"]
+    item: Item
+
+
+class CriticEvent(BaseModel):
+    type: Literal["critic"] = "critic"
+    critic: CriticOutput
+
+
+class FinalEvent(BaseModel):
+    type: Literal["final"] = "final"
+    final: FinalOutput
+
+
+PipelineEvent = Annotated[
+    Union[ProgressEvent, BriefEvent, QuestionsEvent, AgentOutputEvent, ItemEvent, CriticEvent, FinalEvent],
+    Field(discriminator="type"),
+]
@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import json
+import time
+import uuid
+import queue
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Literal, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from pydantic import BaseModel, Field, ValidationError
+
+from schemas import ClarificationAnswers, ClarifyingQuestion, DecisionRequest, FinalOutput, ProgressEvent
+from llm import LLM
+from pipeline import GenerationMode, SynthesisMode, run_mvp
+from ratelimit import default_rate_limiter, rate_context
+
+JobStatus = Literal["queued", "running", "waiting_for_answers", "done", "failed"]
+
+# statuses after which a job's event log stops growing (until answers re-queue it)
+_RESTING = ("waiting_for_answers", "done", "failed")
+
+
+class JobOptions(BaseModel):
+    # per-job overrides of the service's pipeline defaults (unset = service default)
+    synthesis: SynthesisMode | None = None
+    generation: GenerationMode | None = None
+    dedup: bool | None = None
+    compact_prompts: bool | None = None
+    parallel: bool | None = None
+    stream_items: bool | None = None
+    speculate: bool | None = None
+    trace: bool | None = None
+
+
+class JobRequest(BaseModel):
+    title: str = Field(..., min_length=1)
+    narrative: str = Field(..., min_length=1)
+    use_questioner: bool = False
+    session: str | None = None  # fair-share key for the rate limiter (default: the job id)
+    options: JobOptions = Field(default_factory=JobOptions)
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class Job:
+    """
+    One decision moving through the service. A questioner job runs twice: phase 1 ends in
+    "waiting_for_answers" with the questions, answers() re-queues it for phase 2 under the same
+    id. Every pipeline event is appended to one event log (seq = index) across both phases.
+    """
+
+    def __init__(self, req: DecisionRequest, use_questioner: bool, session: str, opts: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.req = req
+        self.use_questioner = use_questioner
+        self.session = session or self.id
+        self.opts = opts
+        self.status: JobStatus = "queued"
+        self.phase = 1
+        self.questions: List[ClarifyingQuestion] = []
+        self.answers: ClarificationAnswers | None = None
+        self.final: FinalOutput | None = None
+        self.error: str | None = None
+        self.progress: Tuple[str, int] = ("Queued", 0)
+        self.events: List[Dict[str, Any]] = []
+        self.created_s = time.time()
+        self.updated_s = self.created_s
+        self.cond = threading.Condition()
+
+    def _set(self, **fields: Any) -> None:
+        with self.cond:
+            for k, v in fields.items():
+                setattr(self, k, v)
+            self.updated_s = time.time()
+            self.cond.notify_all()
+
+    def add_event(self, ev: Any) -> None:
+        row = ev.model_dump(mode="json")
+        with self.cond:
+            row["seq"] = len(self.events)
+            self.events.append(row)
+            if ev.type == "progress":
+                self.progress = (ev.label, ev.pct)
+            self.updated_s = time.time()
+            self.cond.notify_all()
+
+    def wait_events(self, after: int, timeout_s: float) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Events with seq >= after, waiting up to timeout_s for the first one (long poll).
+        """
+        deadline = time.monotonic() + max(0.0, timeout_s)
+        with self.cond:
+            while len(self.events) <= after and self.status not in _RESTING:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self.cond.wait(left)
+            return self.events[after:], self.status
+
+    def view(self, with_final: bool = True) -> Dict[str, Any]:
+        with self.cond:
+            out: Dict[str, Any] = {
+                "id": self.id,
+                "status": self.status,
+                "phase": self.phase,
+                "title": self.req.title,
+                "progress": {"label": self.progress[0], "pct": self.progress[1]},
+                "events": len(self.events),
+                "created_s": round(self.created_s, 3),
+                "updated_s": round(self.updated_s, 3),
+            }
+            if self.status == "waiting_for_answers":
+                out["questions"] = [q.model_dump(mode="json") for q in self.questions]
+            if self.error:
+                out["error"] = self.error
+            if with_final and self.final is not None and self.status == "done":
+                out["final"] = self.final.model_dump(mode="json")
+            return out
+
+
+class JobManager:
+    """
+    Bounded job queue in front of a pool of worker threads that all share one LLM (and with
+    it the process-wide client registry and rate limiter).
+
+    - defaults: pipeline kwargs for every job (JobOptions override them per job).
+    - max_queue: submit() raises QueueFullError beyond this many queued jobs.
+    - job_ttl_s: finished/abandoned jobs are forgotten this long after their last update.
+    """
+
+    def __init__(
+        self,
+        llm: LLM | None = None,
+        workers: int = 4,
+        max_queue: int = 1000,
+        job_ttl_s: float = 3600.0,
+        **defaults: Any,
+    ):
+        self.llm = llm
+        self.defaults = defaults
+        self.job_ttl_s = job_ttl_s
+        self._queue: "queue.Queue[Job | None]" = queue.Queue(maxsize=max(1, max_queue))
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"adq-service-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for th in self._workers:
+            th.start()
+
+    def submit(self, jr: JobRequest) -> Job:
+        req = DecisionRequest(title=jr.title, narrative=jr.narrative)
+        opts = {**self.defaults, **jr.options.model_dump(exclude_none=True)}
+        job = Job(req, jr.use_questioner, jr.session or "", opts)
+        self._prune()
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._enqueue(job)
+        except QueueFullError:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        return job
+
+    def answer(self, job_id: str, answers: ClarificationAnswers) -> Job:
+        job = self.get(job_id)
+        with job.cond:
+            if job.status != "waiting_for_answers":
+                raise ValueError(f"Job {job_id} is {job.status}, not waiting_for_answers.")
+            job.answers = answers
+            job.phase = 2
+            job.status = "queued"
+            job.cond.notify_all()
+        try:
+            self._enqueue(job)
+        except QueueFullError:
+            job._set(status="waiting_for_answers", phase=1, answers=None)
+            raise
+        return job
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def _enqueue(self, job: Job) -> None:
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError(f"Queue full ({self._queue.maxsize} jobs); retry later.") from None
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.job_ttl_s
+        with self._lock:
+            for jid in [j.id for j in self._jobs.values() if j.status in _RESTING and j.updated_s < cutoff]:
+                del self._jobs[jid]
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job) -> None:
+        job._set(status="running")
+        try:
+            with rate_context(priority="interactive", session=job.session):
+                final = run_mvp(
+                    job.req,
+                    llm=self.llm,
+                    events=job.add_event,
+                    progress=lambda label, pct: job.add_event(ProgressEvent(label=label, pct=pct)),
+                    use_questioner=job.use_questioner,
+                    clarification_answers=job.answers,
+                    **job.opts,
+                )
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            job._set(status="failed", error=f"{type(e).__name__}: {e}")
+            return
+        if final.meta.pending_clarification and final.meta.clarifying_questions:
+            job._set(status="waiting_for_answers", questions=final.meta.clarifying_questions, final=final)
+            return
+        with self._lock:
+            self.completed += 1
+        job._set(status="done", final=final)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+            completed, failed = self.completed, self.failed
+        by_status: Dict[str, int] = {}
+        for j in jobs:
+            by_status[j.status] = by_status.get(j.status, 0) + 1
+        return {
+            "workers": len(self._workers),
+            "queue_depth": self._queue.qsize(),
+            "jobs": len(jobs),
+            "by_status": by_status,
+            "completed": completed,
+            "failed": failed,
+            "rate_limiter": default_rate_limiter().stats(),
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the workers once the jobs already queued are done.
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for th in self._workers:
+                th.join()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over a JobManager (set as server.manager):
+
+      POST /jobs                    JobRequest -> 202 job view
+      GET  /jobs/{id}               status, progress, questions (waiting), final (done)
+      GET  /jobs/{id}/events        ?after=N&wait=S  long-poll: {"events", "next", "status"}
+      GET  /jobs/{id}/stream        NDJSON events until the job is done/failed/waiting
+      POST /jobs/{id}/answers       ClarificationAnswers -> 202 (phase 2 queued)
+      GET  /jobs/{id}/result        FinalOutput (409 until done)
+      GET  /healthz, GET /stats
+    """
+
+    server_version = "adq-service/1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    @property
+    def manager(self) -> JobManager:
+        return self.server.manager  # type: ignore[attr-defined]
+
+    def _send(self, code: int, body: Any) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, code: int, msg: str) -> None:
+        self._send(code, {"error": msg})
+
+    def _body(self) -> Any:
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}")
+
+    def _route(self) -> Tuple[List[str], Dict[str, List[str]]]:
+        url = urlparse(self.path)
+        return [p for p in url.path.split("/") if p], parse_qs(url.query)
+
+    def do_POST(self) -> None:
+        parts, _ = self._route()
+        try:
+            if parts == ["jobs"]:
+                job = self.manager.submit(JobRequest.model_validate(self._body()))
+                self._send(202, job.view())
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "answers":
+                job = self.manager.answer(parts[1], ClarificationAnswers.model_validate(self._body()))
+                self._send(202, job.view())
+            else:
+                self._error(404, "Not found.")
+        except (ValidationError, json.JSONDecodeError) as e:
+            self._error(400, str(e))
+        except KeyError:
+            self._error(404, "Unknown job.")
+        except ValueError as e:
+            self._error(409, str(e))
+        except QueueFullError as e:
+            self._error(503, str(e))
+
+    def do_GET(self) -> None:
+        parts, query = self._route()
+        if parts == ["healthz"]:
+            self._send(200, {"ok": True})
+            return
+        if parts == ["stats"]:
+            self._send(200, self.manager.stats())
+            return
+        if len(parts) < 2 or parts[0] != "jobs":
+            self._error(404, "Not found.")
+            return
+        try:
+            job = self.manager.get(parts[1])
+        except KeyError:
+            self._error(404, "Unknown job.")
+            return
+        tail = parts[2] if len(parts) > 2 else ""
+
+        if tail == "":
+            self._send(200, job.view())
+        elif tail == "result":
+            if job.status != "done" or job.final is None:
+                self._error(409, f"Job is {job.status}.")
+            else:
+                self._send(200, job.final.model_dump(mode="json"))
+        elif tail in ("events", "stream"):
+            try:
+                after = int(query.get("after", ["0"])[0])
+                wait = float(query.get("wait", ["0"])[0])
+                if after < 0 or not 0 <= wait < float("inf"):
+                    raise ValueError("after and wait must be non-negative numbers.")
+            except ValueError as e:
+                self._error(400, f"Bad query parameter: {e}")
+                return
+            if tail == "stream":
+                self._stream(job, after)
+                return
+            events, status = job.wait_events(after, min(wait, 60.0))
+            self._send(200, {"events": events, "next": after + len(events), "status": status})
+        else:
+            self._error(404, "Not found.")
+
+    def _stream(self, job: Job, after: int) -> None:
+        # HTTP/1.0 style: no Content-Length, the body ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            while True:
+                events, status = job.wait_events(after, 15.0)
+                for ev in events:
+                    self.wfile.write((json.dumps(ev, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                after += len(events)
+                if status in _RESTING and not events:
+                    self.wfile.write((json.dumps({"type": "status", **job.view(with_final=False)}) + "\n").encode("utf-8"))
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return  # client went away; the job keeps running
+
+
+def make_server(manager: JobManager, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.manager = manager  # type: ignore[attr-defined]
+    return server
+
+
+def serve(manager: JobManager, host: str = "127.0.0.1", port: int = 8080) -> None:
+    """
+    Serve until interrupted (Ctrl-C or SIGTERM), then let the workers finish the queued jobs.
+    """
+    server = make_server(manager, host, port)
+    if threading.current_thread() is threading.main_thread():
+        # shutdown() blocks until serve_forever() returns, so it can't run on this thread
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.shutdown()
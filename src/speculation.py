@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+from schemas import DecisionRequest, DecisionBrief, PromptStats
+from compact import render_brief
+from dedup import fingerprint, jaccard
+
+
+def speculation_key(
+    req: DecisionRequest,
+    compact_prompts: bool = False,
+    token_budgets: Dict[str, int] | None = None,
+    model: str | None = None,
+    generation: str = "split",
+    session: str | None = None,
+) -> str:
+    """
+    Identifies the phase-1 run whose drafts a phase-2 run may pick up: same request text, the
+    same prompt settings, model and generation mode, and the same session, so identical
+    requests from different users neither share nor cancel each other's drafts.
+    """
+    blob = json.dumps(
+        {
+            "title": req.title,
+            "narrative": req.narrative,
+            "compact": compact_prompts,
+            "budgets": token_budgets or {},
+            "model": model or "",
+            "generation": generation,
+            "session": session or "",
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def brief_similarity(a: DecisionBrief, b: DecisionBrief) -> float:
+    """
+    Jaccard similarity of two briefs over dedup.fingerprint() features of their rendered text.
+    """
+    return jaccard(fingerprint(render_brief(a)), fingerprint(render_brief(b)))
+
+
+class Speculation:
+    """
+    Generator drafts started on the unclarified brief while the user answers questions.
+
+    handle is a concurrent.futures.Future (run_mvp) or an asyncio.Task (arun_mvp) resolving to
+    {"alternatives": AlternativesOutput, "preferences": ..., "uncertainties": ...}.
+    """
+
+    def __init__(self, brief: DecisionBrief, handle: Future | asyncio.Task, agents: Dict[str, Any],
+                 seed_only: bool = False):
+        self.brief = brief
+        self.handle = handle
+        self.agents = agents
+        # drafts of a different decision (briefcache): only ever seeds for the critic
+        self.seed_only = seed_only
+        self.created = time.monotonic()
+
+    def prompt_stats(self) -> List[PromptStats]:
+        return [st for a in self.agents.values() for st in getattr(a, "prompt_stats", [])]
+
+    def cancel(self) -> None:
+        if isinstance(self.handle, asyncio.Task):
+            # may be called from another thread than the task's loop (which may be gone)
+            loop = self.handle.get_loop()
+            if not self.handle.done() and not loop.is_closed():
+                loop.call_soon_threadsafe(self.handle.cancel)
+        else:
+            self.handle.cancel()
+
+
+class SpeculationStore:
+    """
+    In-process registry of pending speculative drafts, keyed by speculation_key().
+
+    take() hands an entry to exactly one phase-2 run. Entries older than ttl_s (the user never
+    answered) are cancelled and dropped. A clarified brief whose brief_similarity() to the
+    speculative one is >= reuse_threshold reuses the drafts as-is; below it, the drafts are
+    passed to the critic as seeds.
+    """
+
+    def __init__(self, ttl_s: float = 900.0, max_entries: int = 256, reuse_threshold: float = 0.8):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.reuse_threshold = reuse_threshold
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Speculation] = {}
+
+        self.started = 0
+        self.reused = 0
+        self.seeded = 0
+        self.discarded = 0
+
+    def _evict_locked(self, now: float) -> None:
+        for k in [k for k, s in self._entries.items() if now - s.created > self.ttl_s]:
+            self._entries.pop(k).cancel()
+            self.discarded += 1
+        while len(self._entries) > self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k].created)
+            self._entries.pop(oldest).cancel()
+            self.discarded += 1
+
+    def put(self, key: str, spec: Speculation) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                old.cancel()
+                self.discarded += 1
+            self._entries[key] = spec
+            self.started += 1
+            self._evict_locked(time.monotonic())
+
+    def take(self, key: str) -> Speculation | None:
+        with self._lock:
+            self._evict_locked(time.monotonic())
+            return self._entries.pop(key, None)
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            if outcome == "reused":
+                self.reused += 1
+            elif outcome == "seeded":
+                self.seeded += 1
+            else:
+                self.discarded += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._entries),
+                "started": self.started,
+                "reused": self.reused,
+                "seeded": self.seeded,
+                "discarded": self.discarded,
+            }
+
+
+_default_store: SpeculationStore | None = None
+_default_lock = threading.Lock()
+
+
+def default_speculation_store() -> SpeculationStore:
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = SpeculationStore()
+        return _default_store
@@ -0,0 +1,568 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import functools
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Awaitable, Callable, Dict, List
+
+from schemas import (
+    DecisionRequest,
+    DecisionBrief,
+    FinalOutput,
+    CriticOutput,
+    ClarifyingQuestion,
+    PipelineEvent,
+    BriefEvent,
+    AgentOutputEvent,
+    ItemEvent,
+    CriticEvent,
+)
+from agents.questioner import QuestionerAgent
+from dedup import dedupe_buckets
+from tracing import tracing
+from jsonstream import ItemCallback, item_stream
+from ratelimit import rate_context
+from speculation import Speculation, SpeculationStore, brief_similarity
+from graph import Halt, Node, StageGraph, memo_key
+
+_GEN_LABELS = {"alternatives": "Alternatives", "preferences": "Preferences", "uncertainties": "Uncertainties"}
+
+
+class RunContext:
+    """
+    Per-run settings and agents shared by the MVP_GRAPH nodes.
+    """
+
+    def __init__(
+        self,
+        req: DecisionRequest,
+        llm: Any,
+        agents: Dict[str, Any],
+        emit: Callable[[PipelineEvent], None],
+        use_questioner: bool = False,
+        synthesis: str = "llm",
+        generation: str = "split",
+        dedup: bool = False,
+        dedup_threshold: float = 0.6,
+        stream_items: bool = False,
+        speculate: bool = False,
+        store: SpeculationStore | None = None,
+        spec_key: str = "",
+        spec: Speculation | None = None,
+    ):
+        self.req = req
+        self.llm = llm
+        self.agents = agents
+        self.emit = emit
+        self.use_questioner = use_questioner
+        self.synthesis = synthesis
+        self.generation = generation
+        self.dedup = dedup
+        self.dedup_threshold = dedup_threshold
+        self.stream_items = stream_items
+        self.speculate = speculate
+        self.store = store
+        self.spec_key = spec_key
+        self.spec = spec
+
+    def item_callback(self, stage: str) -> ItemCallback | None:
+        if not self.stream_items:
+            return None
+        return lambda bucket, item: self.emit(ItemEvent(stage=stage, bucket=bucket, item=item))
+
+
+def _gen_items(name: str, out: Any) -> AgentOutputEvent:
+    return AgentOutputEvent(agent=name, items=getattr(out, name))
+
+
+def _pending_stub(req: DecisionRequest, brief: DecisionBrief, questions: List[ClarifyingQuestion]) -> FinalOutput:
+    stub = FinalOutput(
+        decision_title=req.title,
+        brief=brief,
+        alternatives=[],
+        preferences=[],
+        uncertainties=[],
+    )
+    stub.meta.used_questioner = True
+    stub.meta.pending_clarification = True
+    stub.meta.clarifying_questions = questions
+    return stub
+
+
+# --- speculative drafts (see speculation.py) ---
+
+_spec_pool: ThreadPoolExecutor | None = None
+_spec_pool_lock = threading.Lock()
+
+
+def _speculation_pool() -> ThreadPoolExecutor:
+    global _spec_pool
+    with _spec_pool_lock:
+        if _spec_pool is None:
+            _spec_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="adq-speculate")
+        return _spec_pool
+
+
+def _generator_agents(agents: Dict[str, Any], generation: str) -> Dict[str, Any]:
+    if generation == "fused":
+        return {"generators": agents["generators"]}
+    return {name: agents[name] for name in _GEN_LABELS}
+
+
+def _by_bucket(outs: Dict[str, Any]) -> Dict[str, Any]:
+    # a fused GeneratorsOutput carries all three buckets; consumers read getattr(out, name)
+    if "generators" in outs:
+        return {name: outs["generators"] for name in _GEN_LABELS}
+    return outs
+
+
+def _speculate(agents: Dict[str, Any], brief: DecisionBrief) -> Dict[str, Any]:
+    # untraced (the phase-1 trace is already closed) and yielding to interactive calls
+    with tracing(None), rate_context(priority="background"):
+        return _by_bucket(_fan_out({name: functools.partial(a.run, brief, iteration=0) for name, a in agents.items()}, 3))
+
+
+async def _aspeculate(agents: Dict[str, Any], brief: DecisionBrief) -> Dict[str, Any]:
+    with tracing(None), rate_context(priority="background"):
+        return _by_bucket(await _afan_out({name: a.arun(brief, iteration=0) for name, a in agents.items()}))
+
+
+def cached_drafts(
+    lookup: Callable[[str, str], tuple[bool, Any]],
+    brief: DecisionBrief,
+    salt: str,
+    generation: str,
+) -> Speculation | None:
+    """
+    Generator outputs stored for brief (lookup: graph.Memo.get) as a finished, seed-only
+    Speculation: the speculation node hands them to the critic as seeds, never reusing them
+    as-is. None unless every generator output is stored.
+    """
+    names = ("generators",) if generation == "fused" else tuple(_GEN_LABELS)
+    outs: Dict[str, Any] = {}
+    for name in names:
+        hit, value = lookup(name, memo_key(name, {"brief": brief}, salt))
+        if not hit or value is None:
+            return None
+        outs[name] = value
+    handle: Future = Future()
+    handle.set_result(_by_bucket(outs))
+    return Speculation(brief, handle, {}, seed_only=True)
+
+
+def _spec_result(spec: Speculation) -> Dict[str, Any] | None:
+    # drafts started by arun_mvp() live on an event loop this call cannot wait on
+    if isinstance(spec.handle, asyncio.Task):
+        spec.cancel()
+        return None
+    try:
+        return spec.handle.result()
+    except BaseException:
+        return None
+
+
+async def _aspec_result(spec: Speculation) -> Dict[str, Any] | None:
+    h = spec.handle
+    if isinstance(h, asyncio.Task):
+        if h.get_loop() is not asyncio.get_running_loop():
+            spec.cancel()
+            return None
+        fut: asyncio.Future = h
+    else:
+        fut = asyncio.wrap_future(h)
+    # wait() does not propagate the draft's own failure/cancellation, only ours
+    await asyncio.wait({fut})
+    if fut.cancelled() or fut.exception() is not None:
+        return None
+    return fut.result()
+
+
+def _spec_outcome(spec: Speculation, brief: DecisionBrief, outs: Dict[str, Any] | None, store: SpeculationStore) -> str | None:
+    """
+    "reused" if the clarified brief is materially unchanged, "seeded" if the drafts should go to
+    the critic as seeds, None if the speculation failed or was lost.
+    """
+    if outs is None:
+        store.record("discarded")
+        return None
+    reuse = not spec.seed_only and brief_similarity(spec.brief, brief) >= store.reuse_threshold
+    outcome = "reused" if reuse else "seeded"
+    store.record(outcome)
+    return outcome
+
+
+def _fan_out(
+    tasks: Dict[str, Callable[[], Any]],
+    max_workers: int,
+    on_done: Callable[[str, Any, int], None] | None = None,
+) -> Dict[str, Any]:
+    """
+    Run independent stage callables on a bounded thread pool.
+
+    on_done(name, result, n_finished) fires as each stage completes. The first failure is
+    re-raised once the pool has shut down: queued stages are cancelled and stages
+    already in flight are waited for, so no worker is left running in the background.
+    """
+    results: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="adq-stage") as pool:
+        # copy the caller's context so per-request tags (e.g. rate_context) follow each stage
+        futures = {pool.submit(contextvars.copy_context().run, fn): name for name, fn in tasks.items()}
+        try:
+            for fut in as_completed(futures):
+                name = futures[fut]
+                results[name] = fut.result()
+                if on_done is not None:
+                    on_done(name, results[name], len(results))
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
+    return results
+
+
+async def _afan_out(
+    tasks: Dict[str, Awaitable[Any]],
+    on_done: Callable[[str, Any, int], None] | None = None,
+) -> Dict[str, Any]:
+    """
+    asyncio counterpart of _fan_out(): schedule all stages on the running loop,
+    cancel the siblings and wait for them to unwind if one fails.
+    """
+    async def named(name: str, aw: Awaitable[Any]) -> tuple[str, Any]:
+        return name, await aw
+
+    running = [asyncio.ensure_future(named(name, aw)) for name, aw in tasks.items()]
+    results: Dict[str, Any] = {}
+    try:
+        for fut in asyncio.as_completed(running):
+            name, value = await fut
+            results[name] = value
+            if on_done is not None:
+                on_done(name, value, len(results))
+    except BaseException:
+        for t in running:
+            t.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        raise
+    return results
+
+
+# --- node bodies: fn(ctx, **inputs) and their coroutine twins ---
+
+def _streams_items(stage: str, agent: str = "") -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Run the node's LLM calls under jsonstream.item_stream() when the run has stream_items=True,
+    reporting completed items as ItemEvents tagged with `stage`.
+    """
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(ctx: RunContext, **inputs: Any) -> Any:
+                with item_stream(ctx.item_callback(stage), agent):
+                    return await fn(ctx, **inputs)
+
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(ctx: RunContext, **inputs: Any) -> Any:
+            with item_stream(ctx.item_callback(stage), agent):
+                return fn(ctx, **inputs)
+
+        return wrapper
+
+    return deco
+
+
+def _items(drafts: Dict[str, List[Any]], dedup: Dict[str, Any] | None) -> Dict[str, List[Any]]:
+    return dedup["kept"] if dedup is not None else drafts
+
+
+def _critic_or_drafts(critic: CriticOutput | None, items: Dict[str, List[Any]]) -> CriticOutput:
+    # graphs without a critic hand the (deduplicated) drafts straight to synthesis
+    return critic if critic is not None else CriticOutput(**items)
+
+
+def _questioner(ctx: RunContext, request: DecisionRequest) -> Any:
+    return QuestionerAgent(llm=ctx.llm).run(request, iteration=0)
+
+
+async def _aquestioner(ctx: RunContext, request: DecisionRequest) -> Any:
+    return await QuestionerAgent(llm=ctx.llm).arun(request, iteration=0)
+
+
+def _orchestrator(ctx: RunContext, request: DecisionRequest, answers: Any) -> DecisionBrief:
+    orch = ctx.agents["orchestrator"]
+    if answers is not None:
+        return orch.build_brief_with_clarification(request, answers)
+    return orch.build_brief(request)
+
+
+async def _aorchestrator(ctx: RunContext, request: DecisionRequest, answers: Any) -> DecisionBrief:
+    orch = ctx.agents["orchestrator"]
+    if answers is not None:
+        return await orch.abuild_brief_with_clarification(request, answers)
+    return await orch.abuild_brief(request)
+
+
+def _clarify(ctx: RunContext, request: DecisionRequest, questions: Any, brief: DecisionBrief) -> Halt | None:
+    if not (questions.ask and questions.questions):
+        return None
+    if ctx.speculate:
+        gens = _generator_agents(ctx.agents, ctx.generation)
+        handle = _speculation_pool().submit(contextvars.copy_context().run, _speculate, gens, brief)
+        ctx.store.put(ctx.spec_key, Speculation(brief, handle, gens))
+    return Halt(_pending_stub(request, brief, questions.questions))
+
+
+async def _aclarify(ctx: RunContext, request: DecisionRequest, questions: Any, brief: DecisionBrief) -> Halt | None:
+    if not (questions.ask and questions.questions):
+        return None
+    if ctx.speculate:
+        gens = _generator_agents(ctx.agents, ctx.generation)
+        handle = asyncio.ensure_future(_aspeculate(gens, brief))
+        ctx.store.put(ctx.spec_key, Speculation(brief, handle, gens))
+    return Halt(_pending_stub(request, brief, questions.questions))
+
+
+def _speculation(ctx: RunContext, brief: DecisionBrief) -> Dict[str, Any] | None:
+    outs = _spec_result(ctx.spec)
+    outcome = _spec_outcome(ctx.spec, brief, outs, ctx.store)
+    return {"outcome": outcome, "outs": outs} if outcome is not None else None
+
+
+async def _aspeculation(ctx: RunContext, brief: DecisionBrief) -> Dict[str, Any] | None:
+    outs = await _aspec_result(ctx.spec)
+    outcome = _spec_outcome(ctx.spec, brief, outs, ctx.store)
+    return {"outcome": outcome, "outs": outs} if outcome is not None else None
+
+
+def _generator(name: str) -> tuple[Callable[..., Any], Callable[..., Awaitable[Any]]]:
+    @_streams_items(name)
+    def fn(ctx: RunContext, brief: DecisionBrief) -> Any:
+        return ctx.agents[name].run(brief, iteration=0)
+
+    @_streams_items(name)
+    async def afn(ctx: RunContext, brief: DecisionBrief) -> Any:
+        return await ctx.agents[name].arun(brief, iteration=0)
+
+    return fn, afn
+
+
+_fused, _afused = _generator("generators")
+
+
+def _drafts(ctx: RunContext, speculation: Dict[str, Any] | None, generated: Any, **outs: Any) -> Dict[str, List[Any]]:
+    if speculation is not None:
+        outs = speculation["outs"]
+    elif generated is not None:
+        outs = _by_bucket({"generators": generated})
+    return {name: getattr(outs[name], name) if outs.get(name) is not None else [] for name in _GEN_LABELS}
+
+
+def _dedup(ctx: RunContext, drafts: Dict[str, List[Any]]) -> Dict[str, Any]:
+    kept, removed = dedupe_buckets(drafts, threshold=ctx.dedup_threshold)
+    return {"kept": kept, "removed": removed}
+
+
+@_streams_items("critic", "critic")
+def _critic(ctx: RunContext, brief: DecisionBrief, drafts: Dict[str, List[Any]], dedup: Dict[str, Any] | None,
+            speculation: Dict[str, Any] | None) -> CriticOutput:
+    seeded = speculation is not None and speculation["outcome"] == "seeded"
+    critic = ctx.agents["critic"]
+    review = critic.review_and_summarize if ctx.synthesis == "fused" else critic.review
+    return review(brief=brief, **_items(drafts, dedup), iteration=0, seeded=seeded)
+
+
+@_streams_items("critic", "critic")
+async def _acritic(ctx: RunContext, brief: DecisionBrief, drafts: Dict[str, List[Any]], dedup: Dict[str, Any] | None,
+                   speculation: Dict[str, Any] | None) -> CriticOutput:
+    seeded = speculation is not None and speculation["outcome"] == "seeded"
+    critic = ctx.agents["critic"]
+    review = critic.areview_and_summarize if ctx.synthesis == "fused" else critic.areview
+    return await review(brief=brief, **_items(drafts, dedup), iteration=0, seeded=seeded)
+
+
+@_streams_items("synthesizer", "synthesizer")
+def _synthesizer(ctx: RunContext, brief: DecisionBrief, critic: CriticOutput | None, drafts: Dict[str, List[Any]],
+                 dedup: Dict[str, Any] | None) -> Any:
+    synth = ctx.agents["synthesizer"]
+    critic_out = _critic_or_drafts(critic, _items(drafts, dedup))
+    if ctx.synthesis == "llm":
+        return synth.synthesize(brief=brief, critic_out=critic_out)
+    return synth.summarize(brief=brief, critic_out=critic_out)
+
+
+@_streams_items("synthesizer", "synthesizer")
+async def _asynthesizer(ctx: RunContext, brief: DecisionBrief, critic: CriticOutput | None, drafts: Dict[str, List[Any]],
+                        dedup: Dict[str, Any] | None) -> Any:
+    synth = ctx.agents["synthesizer"]
+    critic_out = _critic_or_drafts(critic, _items(drafts, dedup))
+    if ctx.synthesis == "llm":
+        return await synth.asynthesize(brief=brief, critic_out=critic_out)
+    return await synth.asummarize(brief=brief, critic_out=critic_out)
+
+
+def _assemble(ctx: RunContext, brief: DecisionBrief, critic: CriticOutput | None, drafts: Dict[str, List[Any]],
+              dedup: Dict[str, Any] | None, synthesizer: Any) -> FinalOutput:
+    if ctx.synthesis == "llm" and synthesizer is not None:
+        return synthesizer
+    summary = synthesizer if ctx.synthesis == "summary" else None
+    if ctx.synthesis == "fused":
+        # written by the critic in the same call (CriticSynthesisOutput)
+        summary = getattr(critic, "synthesis_summary", None)
+    critic_out = _critic_or_drafts(critic, _items(drafts, dedup))
+    return ctx.agents["synthesizer"].assemble(brief=brief, critic_out=critic_out, synthesis_summary=summary)
+
+
+# --- event hooks (run on the scheduler's thread, in completion order) ---
+
+def _on_brief(ctx: RunContext, brief: DecisionBrief) -> None:
+    ctx.emit(BriefEvent(brief=brief))
+
+
+def _on_generator(name: str) -> Callable[[RunContext, Any], None]:
+    return lambda ctx, out: ctx.emit(_gen_items(name, out))
+
+
+def _on_generated(ctx: RunContext, out: Any) -> None:
+    for name in _GEN_LABELS:
+        ctx.emit(_gen_items(name, out))
+
+
+def _on_speculation(ctx: RunContext, spec: Dict[str, Any] | None) -> None:
+    if spec is not None:
+        for name in _GEN_LABELS:
+            ctx.emit(_gen_items(name, spec["outs"][name]))
+
+
+def _on_critic(ctx: RunContext, critic: CriticOutput) -> None:
+    ctx.emit(CriticEvent(critic=critic))
+
+
+def _generator_node(name: str) -> Node:
+    fn, afn = _generator(name)
+    return Node(
+        name,
+        fn=fn,
+        afn=afn,
+        inputs=("brief",),
+        after=("speculation",),
+        when=lambda ctx, st: st["speculation"] is None and ctx.generation == "split",
+        label=f"Generating {name}...",
+        done_label=f"{_GEN_LABELS[name]} ready...",
+        weight=3.0,
+        cacheable=True,
+        lane="generators",
+        on_done=_on_generator(name),
+    )
+
+
+MVP_GRAPH = StageGraph(
+    [
+        Node(
+            "questioner",
+            fn=_questioner,
+            afn=_aquestioner,
+            inputs=("request",),
+            output="questions",
+            when=lambda ctx, st: ctx.use_questioner and st["answers"] is None,
+            label="Generating clarification questions...",
+            cacheable=True,
+        ),
+        Node(
+            "orchestrator",
+            fn=_orchestrator,
+            afn=_aorchestrator,
+            inputs=("request", "answers"),
+            output="brief",
+            label="Building decision brief...",
+            weight=2.0,
+            cacheable=True,
+            on_done=_on_brief,
+        ),
+        Node(
+            "clarify",
+            fn=_clarify,
+            afn=_aclarify,
+            inputs=("request", "questions", "brief"),
+            when=lambda ctx, st: st["questions"] is not None,
+            done_label="No clarification needed...",
+            weight=0.0,
+            traced=False,
+        ),
+        Node(
+            "speculation",
+            fn=_speculation,
+            afn=_aspeculation,
+            inputs=("brief",),
+            after=("clarify",),
+            when=lambda ctx, st: ctx.spec is not None,
+            label="Collecting drafts prepared while you answered...",
+            on_done=_on_speculation,
+        ),
+        _generator_node("alternatives"),
+        _generator_node("preferences"),
+        _generator_node("uncertainties"),
+        Node(
+            "generators",
+            fn=_fused,
+            afn=_afused,
+            inputs=("brief",),
+            after=("speculation",),
+            output="generated",
+            when=lambda ctx, st: st["speculation"] is None and ctx.generation == "fused",
+            label="Generating alternatives, preferences and uncertainties...",
+            done_label="Drafts ready...",
+            weight=9.0,
+            cacheable=True,
+            on_done=_on_generated,
+        ),
+        Node(
+            "drafts",
+            fn=_drafts,
+            inputs=("speculation", "generated", *_GEN_LABELS),
+            weight=0.0,
+            traced=False,
+        ),
+        Node(
+            "dedup",
+            fn=_dedup,
+            inputs=("drafts",),
+            when=lambda ctx, st: ctx.dedup,
+            label="Removing near-duplicates...",
+            weight=0.5,
+        ),
+        Node(
+            "critic",
+            fn=_critic,
+            afn=_acritic,
+            inputs=("brief", "drafts", "dedup", "speculation"),
+            label="Critic review...",
+            weight=3.0,
+            cacheable=True,
+            on_done=_on_critic,
+        ),
+        Node(
+            "synthesizer",
+            fn=_synthesizer,
+            afn=_asynthesizer,
+            inputs=("brief", "critic", "drafts", "dedup"),
+            when=lambda ctx, st: ctx.synthesis in ("llm", "summary"),
+            label="Synthesizing final output...",
+            weight=2.0,
+            cacheable=True,
+        ),
+        Node(
+            "assemble",
+            fn=_assemble,
+            inputs=("brief", "critic", "drafts", "dedup", "synthesizer"),
+            output="final",
+            weight=0.5,
+            traced=False,
+        ),
+    ],
+    inputs=("request", "answers"),
+)
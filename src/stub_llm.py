@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import json
+import math
+import time
+import types
+import random
+import asyncio
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, Literal, Sequence, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from repair import requested_fields
+from schemas import (
+    DecisionBrief,
+    QuestionerOutput,
+    AlternativesOutput,
+    PreferencesOutput,
+    UncertaintiesOutput,
+    GeneratorsOutput,
+    CriticOutput,
+    CriticSynthesisOutput,
+    SynthesizerOutput,
+    SynthesisSummary,
+)
+
+_WORDS = (
+    "budget timeline risk cost salary commute family growth savings location team remote office "
+    "mortgage rent lease offer contract health career school market rate return loan equity "
+    "travel schedule flexibility quality support network housing vendor platform migration hiring "
+    "deadline scope runway customer launch pricing partner quarter region license upgrade backup"
+).split()
+
+# (substring of the system prompt, schema) used by the JSON-mode path to pick a fixture.
+# Checked in order, so more specific prompts come first.
+DEFAULT_ROUTES: List[Tuple[str, Type[BaseModel]]] = [
+    ("sentence synthesis_summary", SynthesisSummary),
+    ("You are the Synthesizer", SynthesizerOutput),
+    ("OUTPUT_SCHEMA: CriticSynthesisOutput", CriticSynthesisOutput),
+    ("You are the Critic", CriticOutput),
+    ("You are the Questioner", QuestionerOutput),
+    ("You are the Orchestrator", DecisionBrief),
+    ("You are the Alternatives", AlternativesOutput),
+    ("You are the Preferences", PreferencesOutput),
+    ("You are the Uncertainties", UncertaintiesOutput),
+    ("You are the Generators", GeneratorsOutput),
+]
+
+
+class StubLLMError(RuntimeError):
+    pass
+
+
+class Latency:
+    """
+    Latency distribution parsed from a spec string (seconds):
+      "const:0.5", "uniform:0.2,1.0", "normal:0.8,0.2", "lognormal:0.8,0.5" (median, sigma), "exp:0.8" (mean)
+    Samples are clipped at 0.
+    """
+
+    def __init__(self, spec: str | float = 0.0):
+        if isinstance(spec, (int, float)):
+            spec = f"const:{spec}"
+        kind, _, args = spec.partition(":")
+        self.spec = spec
+        self.kind = kind.strip().lower()
+        self.args = [float(x) for x in args.split(",") if x.strip()]
+        n = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}.get(self.kind)
+        if n is None:
+            raise ValueError(f"Unknown latency distribution {kind!r}.")
+        if len(self.args) != n:
+            raise ValueError(f"Latency {self.kind!r} expects {n} argument(s), got {spec!r}.")
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.args
+        if self.kind == "const":
+            v = a[0]
+        elif self.kind == "uniform":
+            v = rng.uniform(a[0], a[1])
+        elif self.kind == "normal":
+            v = rng.gauss(a[0], a[1])
+        elif self.kind == "lognormal":
+            v = a[0] * math.exp(rng.gauss(0.0, a[1])) if a[0] > 0 else 0.0
+        else:
+            v = rng.expovariate(1.0 / a[0]) if a[0] > 0 else 0.0
+        return max(0.0, v)
+
+    def __repr__(self) -> str:
+        return f"Latency({self.spec!r})"
+
+
+def _phrase(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+
+def _sample_value(ann: Any, name: str, rng: random.Random, n_items: int) -> Any:
+    origin = get_origin(ann)
+    if origin is Union or origin is types.UnionType:
+        args = [a for a in get_args(ann) if a is not type(None)]
+        return _sample_value(args[0], name, rng, n_items) if args else None
+    if origin is Literal:
+        return get_args(ann)[0]
+    if origin in (list, List, Sequence, tuple):
+        (inner, *_) = get_args(ann) or (str,)
+        return [_sample_value(inner, name, rng, n_items) for _ in range(n_items)]
+    if isinstance(ann, type) and issubclass(ann, BaseModel):
+        return sample_payload(ann, rng, n_items)
+    if ann is bool:
+        return True
+    if ann is int:
+        return rng.randint(0, 5)
+    if ann is float:
+        return round(rng.random(), 3)
+    if name == "id":
+        return f"q{rng.randint(1, 99)}"
+    return f"{name.replace('_', ' ')}: {_phrase(rng, 8)}"
+
+
+def sample_payload(model_cls: Type[BaseModel], rng: random.Random, n_items: int = 5) -> Dict[str, Any]:
+    """
+    Schema-valid JSON payload for model_cls, generated from its fields (every field filled,
+    lists get n_items entries, Literals take their first value). Works for any schema, so new
+    agent outputs need no hand-written fixture.
+    """
+    out: Dict[str, Any] = {}
+    for name, field in model_cls.model_fields.items():
+        out[name] = _sample_value(field.annotation, name, rng, n_items)
+    return out
+
+
+class _StubCore:
+    def __init__(
+        self,
+        latency: str | float = "lognormal:0.8,0.5",
+        per_model_latency: Dict[str, str | float] | None = None,
+        failure_rate: float = 0.0,
+        invalid_json_rate: float = 0.0,
+        invalid_item_rate: float = 0.0,
+        n_items: int = 5,
+        seed: int | None = None,
+        routes: List[Tuple[str, Type[BaseModel]]] | None = None,
+        stream_chunk: int = 48,
+    ):
+        self.model = "stub"
+        self.latency = Latency(latency)
+        self.per_model_latency = {k: Latency(v) for k, v in (per_model_latency or {}).items()}
+        self.failure_rate = failure_rate
+        self.invalid_json_rate = invalid_json_rate
+        self.invalid_item_rate = invalid_item_rate
+        self.n_items = n_items
+        self.routes = routes if routes is not None else DEFAULT_ROUTES
+        self.stream_chunk = max(1, stream_chunk)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.failures = 0
+        self.invalid_json = 0
+        self.invalid_items = 0
+        self.simulated_s = 0.0
+        self.by_model: Dict[str, int] = {}
+
+    def _route(self, system: str) -> Type[BaseModel]:
+        for needle, cls in self.routes:
+            if needle in system:
+                return cls
+        raise StubLLMError(f"No stub route matches system prompt: {system[:80]!r}")
+
+    def _plan(self, model_name: str) -> Tuple[float, bool, str | None]:
+        """
+        Draw (delay, fail, invalid) for one call and update counters. invalid is None,
+        "json" (truncated output) or "item" (one list item fails validation).
+        """
+        with self._lock:
+            delay = self.per_model_latency.get(model_name, self.latency).sample(self._rng)
+            fail = self._rng.random() < self.failure_rate
+            invalid = None
+            if not fail and self._rng.random() < self.invalid_json_rate:
+                invalid = "json"
+            elif not fail and self.invalid_item_rate and self._rng.random() < self.invalid_item_rate:
+                invalid = "item"
+            self.calls += 1
+            self.failures += fail
+            self.invalid_json += invalid == "json"
+            self.invalid_items += invalid == "item"
+            self.simulated_s += delay
+            self.by_model[model_name] = self.by_model.get(model_name, 0) + 1
+        return delay, fail, invalid
+
+    def _payload(self, model_cls: Type[BaseModel], user: str) -> Dict[str, Any]:
+        # deterministic per prompt, so identical requests get identical answers (cache-friendly)
+        rng = random.Random(zlib.crc32(f"{model_cls.__name__}\n{user}".encode("utf-8")))
+        return sample_payload(model_cls, rng, self.n_items)
+
+    def _json(self, model_cls: Type[BaseModel], user: str, invalid: str | None) -> str:
+        payload = self._payload(model_cls, user)
+        fields = requested_fields(user)
+        if fields is not None:
+            # a compliant model answers a repair prompt with just the requested keys
+            payload = {k: v for k, v in payload.items() if k in fields}
+        if invalid == "item":
+            # too-short text on the first item of the first non-empty item list
+            for value in payload.values():
+                if isinstance(value, list) and value and isinstance(value[0], dict) and "text" in value[0]:
+                    value[0]["text"] = "?"
+                    break
+        raw = json.dumps(payload)
+        # truncated JSON, like a response cut off at max_tokens
+        return raw[: len(raw) // 2] if invalid == "json" else raw
+
+    def _chunks(self, text: str) -> List[str]:
+        # stream_chunk characters per delta, roughly a dozen tokens
+        return [text[i : i + self.stream_chunk] for i in range(0, len(text), self.stream_chunk)] or [""]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "invalid_json": self.invalid_json,
+                "invalid_items": self.invalid_items,
+                "simulated_s": round(self.simulated_s, 3),
+                "by_model": dict(self.by_model),
+            }
+
+
+class StubJSONLLM(_StubCore):
+    """
+    Offline LLM for benchmarks and demos that only implements complete() (JSON mode), so
+    complete_and_validate() takes its parse + validate + retry path. The schema is picked from
+    the system prompt via `routes`.
+    """
+
+    def __init__(self, *args: Any, sleep: Callable[[float], None] = time.sleep, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._sleep = sleep
+
+    def complete(self, system: str, user: str) -> str:
+        model_cls = self._route(system)
+        delay, fail, invalid = self._plan(model_cls.__name__)
+        self._sleep(delay)
+        if fail:
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        return self._json(model_cls, user, invalid)
+
+    def _stream(self, text: str, delay: float, on_delta: Callable[[str], None]) -> str:
+        chunks = self._chunks(text)
+        for c in chunks:
+            self._sleep(delay / len(chunks))
+            on_delta(c)
+        return text
+
+    def complete_stream(self, system: str, user: str, on_delta: Callable[[str], None]) -> str:
+        """
+        complete() delivered as text deltas spread over the simulated latency.
+        """
+        model_cls = self._route(system)
+        delay, fail, invalid = self._plan(model_cls.__name__)
+        if fail:
+            self._sleep(delay)
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        return self._stream(self._json(model_cls, user, invalid), delay, on_delta)
+
+
+class StubLLM(StubJSONLLM):
+    """
+    Offline LLM implementing both complete() and complete_structured().
+
+    Responses are schema-valid payloads generated from the requested model_cls, validated with
+    Pydantic on every call like a real Structured Outputs parse. Latency is drawn from `latency`
+    (or per_model_latency[model_cls.__name__]); failure_rate injects exceptions and
+    invalid_json_rate truncates complete() output, invalid_item_rate makes one item invalid.
+    """
+
+    def complete_structured(self, system: str, user: str, model_cls: Type[BaseModel]) -> BaseModel:
+        delay, fail, _ = self._plan(model_cls.__name__)
+        self._sleep(delay)
+        if fail:
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        return model_cls.model_validate(self._payload(model_cls, user))
+
+    def complete_structured_stream(
+        self, system: str, user: str, model_cls: Type[BaseModel], on_delta: Callable[[str], None]
+    ) -> BaseModel:
+        delay, fail, _ = self._plan(model_cls.__name__)
+        if fail:
+            self._sleep(delay)
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        payload = self._payload(model_cls, user)
+        self._stream(json.dumps(payload), delay, on_delta)
+        return model_cls.model_validate(payload)
+
+
+class AsyncStubJSONLLM(_StubCore):
+    """
+    AsyncLLM twin of StubJSONLLM: waits with asyncio.sleep so no thread is held.
+    """
+
+    async def complete(self, system: str, user: str) -> str:
+        model_cls = self._route(system)
+        delay, fail, invalid = self._plan(model_cls.__name__)
+        await asyncio.sleep(delay)
+        if fail:
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        return self._json(model_cls, user, invalid)
+
+    async def _stream(self, text: str, delay: float, on_delta: Callable[[str], None]) -> str:
+        chunks = self._chunks(text)
+        for c in chunks:
+            await asyncio.sleep(delay / len(chunks))
+            on_delta(c)
+        return text
+
+    async def complete_stream(self, system: str, user: str, on_delta: Callable[[str], None]) -> str:
+        model_cls = self._route(system)
+        delay, fail, invalid = self._plan(model_cls.__name__)
+        if fail:
+            await asyncio.sleep(delay)
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        return await self._stream(self._json(model_cls, user, invalid), delay, on_delta)
+
+
+class AsyncStubLLM(AsyncStubJSONLLM):
+    """
+    AsyncLLM twin of StubLLM.
+    """
+
+    async def complete_structured(self, system: str, user: str, model_cls: Type[BaseModel]) -> BaseModel:
+        delay, fail, _ = self._plan(model_cls.__name__)
+        await asyncio.sleep(delay)
+        if fail:
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        return model_cls.model_validate(self._payload(model_cls, user))
+
+    async def complete_structured_stream(
+        self, system: str, user: str, model_cls: Type[BaseModel], on_delta: Callable[[str], None]
+    ) -> BaseModel:
+        delay, fail, _ = self._plan(model_cls.__name__)
+        if fail:
+            await asyncio.sleep(delay)
+            raise StubLLMError(f"Injected failure ({model_cls.__name__}).")
+        payload = self._payload(model_cls, user)
+        await self._stream(json.dumps(payload), delay, on_delta)
+        return model_cls.model_validate(payload)
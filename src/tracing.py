@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, IO, Iterable, Iterator, List
+
+from schemas import TraceSpan
+
+_tracer_var: ContextVar["Tracer | None"] = ContextVar("adq_tracer", default=None)
+_span_var: ContextVar[TraceSpan | None] = ContextVar("adq_span", default=None)
+
+
+class Tracer:
+    """
+    Collects TraceSpans for one pipeline run. Spans nest through contextvars, so stages running
+    on worker threads (copied context) or asyncio tasks attach to the right parent.
+    """
+
+    def __init__(self) -> None:
+        self.t0 = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.spans: List[TraceSpan] = []
+
+    @contextmanager
+    def span(self, name: str, kind: str = "stage") -> Iterator[TraceSpan]:
+        parent = _span_var.get()
+        start = time.perf_counter()
+        sp = TraceSpan(
+            id=next(self._ids),
+            parent_id=parent.id if parent is not None else 0,
+            name=name,
+            kind=kind,
+            start_s=round(start - self.t0, 6),
+        )
+        token = _span_var.set(sp)
+        try:
+            yield sp
+        except BaseException as e:
+            sp.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            sp.wall_s = round(time.perf_counter() - start, 6)
+            _span_var.reset(token)
+            with self._lock:
+                self.spans.append(sp)
+
+    def snapshot(self) -> List[TraceSpan]:
+        """
+        Finished spans ordered by start time, preceded by a synthetic "run" span (id 0)
+        covering everything since the tracer was created.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: (s.start_s, s.id))
+        run = TraceSpan(id=0, name="run", kind="run", wall_s=round(time.perf_counter() - self.t0, 6))
+        for sp in spans:
+            # usage is recorded on the innermost LLM span only, so summing all of them is safe
+            if sp.kind == "llm":
+                run.queue_s += sp.queue_s
+                run.input_tokens += sp.input_tokens
+                run.output_tokens += sp.output_tokens
+                run.reasoning_tokens += sp.reasoning_tokens
+                run.cached_tokens += sp.cached_tokens
+                run.retries += sp.retries
+                run.validation_failures += sp.validation_failures
+        run.queue_s = round(run.queue_s, 6)
+        return [run, *spans]
+
+
+@contextmanager
+def tracing(tracer: Tracer | None) -> Iterator[Tracer | None]:
+    """
+    Make tracer current for the block (None turns tracing off inside it).
+    """
+    token = _tracer_var.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _tracer_var.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str = "stage") -> Iterator[TraceSpan | None]:
+    """
+    Open a span on the current tracer; a no-op yielding None when tracing is off.
+    """
+    tracer = _tracer_var.get()
+    if tracer is None:
+        yield None
+        return
+    with tracer.span(name, kind=kind) as sp:
+        yield sp
+
+
+def snapshot() -> List[TraceSpan]:
+    """
+    Spans recorded so far by the current tracer ([] when tracing is off).
+    """
+    tracer = _tracer_var.get()
+    return tracer.snapshot() if tracer is not None else []
+
+
+def current_span() -> TraceSpan | None:
+    return _span_var.get() if _tracer_var.get() is not None else None
+
+
+def record_queue(seconds: float) -> None:
+    sp = current_span()
+    if sp is not None:
+        sp.queue_s = round(sp.queue_s + seconds, 6)
+
+
+def record_usage(usage: Any) -> None:
+    """
+    Add an OpenAI Responses `usage` object to the current span (missing fields count as 0).
+    """
+    sp = current_span()
+    if sp is None or usage is None:
+        return
+    sp.input_tokens += getattr(usage, "input_tokens", 0) or 0
+    sp.output_tokens += getattr(usage, "output_tokens", 0) or 0
+    in_details = getattr(usage, "input_tokens_details", None)
+    out_details = getattr(usage, "output_tokens_details", None)
+    sp.cached_tokens += getattr(in_details, "cached_tokens", 0) or 0
+    sp.reasoning_tokens += getattr(out_details, "reasoning_tokens", 0) or 0
+
+
+def export_jsonl(spans: Iterable[TraceSpan], out: IO[str], **extra: Any) -> None:
+    """
+    Write one JSON object per span; extra fields (e.g. run_id) are added to every line.
+    """
+    for sp in spans:
+        out.write(json.dumps({**extra, **sp.model_dump()}, ensure_ascii=False) + "\n")
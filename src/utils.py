@@ -1,6 +1,13 @@
 import json
 import re
-from typing import Any, Dict, Type, TypeVar
+from typing import Any, Callable, Dict, Type, TypeVar
+
+from pydantic import ValidationError
+
+from tracing import span
+from cancel import check_cancelled
+from jsonstream import ItemSink, ItemStreamParser, current_item_sink
+from repair import Salvage, default_repair_stats, repair_prompt, salvage_json
 
 _JSON_RE = re.compile(r"(\{.*\}|\[.*\])", re.DOTALL)
 
@@ -24,10 +31,134 @@ def loads_json(text: str) -> Dict[str, Any] | Any:
     return json.loads(s)
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate (~4 chars per token for English/JSON). No tokenizer dependency.
+    """
+    return (len(text) + 3) // 4 if text else 0
+
+
 def normalize(s: str) -> str:
     return re.sub(r"\s+", " ", s.strip().lower())
 
 
+def _retry_prompt(user_json: str, err: Exception | None) -> str:
+    return (
+        user_json
+        + "\n\n"
+        + f"IMPORTANT: Your previous output was invalid. Error: {err}. "
+          "Return JSON ONLY that matches the required schema. No markdown, no commentary."
+    )
+
+
+def _feeder(sink: ItemSink) -> Callable[[str], None]:
+    # one parser per attempt: a retried response starts a new JSON document
+    parser = ItemStreamParser()
+    return lambda delta: sink.handle(parser.feed(delta))
+
+
+class _Repairer:
+    """
+    State of one JSON-mode complete_and_validate() call across attempts.
+
+    A failed output is salvaged (repair.Salvage); while anything valid survives, follow-ups ask
+    only for the missing/invalid pieces. Otherwise they resend the whole prompt with the error.
+    """
+
+    def __init__(self, model_cls: Type[T], user_json: str):
+        self.model_cls = model_cls
+        self.user_json = user_json
+        self.sv: Salvage | None = None
+        self.err: Exception | None = None
+        self.counts = {"calls": 1}
+        self.followups = 0
+
+    def _count(self, key: str, n: int = 1) -> None:
+        self.counts[key] = self.counts.get(key, 0) + n
+
+    def check(self, raw: str | None) -> T | None:
+        if self.sv is None:
+            if raw is None:
+                self.err = ValueError("LLM returned None. llm.complete() must return a JSON string.")
+            else:
+                try:
+                    out = self.model_cls.model_validate(loads_json(raw))
+                    self._count("recovered" if self.followups else "first_pass_ok")
+                    return out
+                except Exception as e:
+                    self.err = e
+            if not self.followups:
+                self._count("failed")
+            sv = Salvage(self.model_cls)
+            try:
+                sv.absorb(*salvage_json(raw))
+            except ValueError:
+                return None
+            if not sv.usable():
+                return None
+            self.sv = sv
+            self._count("items_kept", sv.items_kept)
+        else:
+            try:
+                self.sv.absorb(*salvage_json(raw))
+            except ValueError as e:
+                self.err = e
+                return None
+
+        if self.sv.pending():
+            return None
+        try:
+            out = self.sv.build()
+        except ValidationError as e:
+            self.err, self.sv = e, None
+            return None
+        self._count("recovered" if self.followups else "salvaged")
+        return out
+
+    def next_prompt(self) -> str:
+        self.followups += 1
+        if self.sv is not None:
+            self._count("repair_calls")
+            self._count("kept_tokens", estimate_tokens(self.sv.kept_json()))
+            return repair_prompt(self.user_json, self.sv)
+        self._count("full_retries")
+        return _retry_prompt(self.user_json, self.err)
+
+    def error(self) -> Exception:
+        self._count("exhausted")
+        if self.sv is not None:
+            return ValueError(f"{self.model_cls.__name__} still incomplete after repair: {self.sv.pending()}")
+        return self.err if self.err else RuntimeError("Unknown LLM validation error")
+
+
+def _structured_failed(counts: Dict[str, int], attempt: int, retries: int, sp: Any) -> None:
+    # Structured Outputs returned no raw text to salvage, so a retry regenerates everything
+    if sp is not None:
+        sp.validation_failures += 1
+    if not attempt:
+        counts["failed"] = 1
+    if attempt < retries:
+        counts["full_retries"] = counts.get("full_retries", 0) + 1
+    else:
+        counts["exhausted"] = 1
+
+
+def _cached_result(llm: Any, system: str, user_json: str, model_cls: Type[T], sink: Any) -> T | None:
+    # JSON-mode LLMs behind a cache (cache.CachedLLM): validated results of earlier calls
+    if not hasattr(llm, "lookup_validated"):
+        return None
+    hit = llm.lookup_validated(system, user_json, model_cls)
+    if hit is not None and sink is not None:
+        _feeder(sink)(hit.model_dump_json())
+    return hit
+
+
+def _store_result(llm: Any, system: str, user_json: str, model_cls: Type[T], out: T) -> None:
+    # keyed by the original request, whatever repair prompts it took to get there
+    if hasattr(llm, "store_validated"):
+        llm.store_validated(system, user_json, model_cls, out)
+
+
 def complete_and_validate(
     llm: Any,
     system: str,
@@ -38,38 +169,155 @@ def complete_and_validate(
     """
     Preferred path:
       - If llm implements complete_structured(system, user, model_cls) -> model instance,
-        use Structured Outputs (schema-guaranteed) and return the parsed model.
+        use Structured Outputs (schema-guaranteed) and return the parsed model. Outputs that
+        still fail validation (constraints the JSON schema can't express) are retried.
     Fallback path:
       - Otherwise use llm.complete(...) -> JSON string + parse + Pydantic model_validate.
+        A failed output is salvaged instead of discarded: JSON is recovered from fenced or
+        truncated text, item lists are validated item by item, and each retry asks only for
+        the missing/invalid pieces (see repair.py). Counters go to repair.default_repair_stats().
+
+    Inside jsonstream.item_stream(), LLMs with complete_structured_stream()/complete_stream()
+    are called in streaming mode and every Item is reported as soon as it is complete; the
+    returned model is still validated from the whole response.
+
+    A JSON-mode LLM with lookup_validated()/store_validated() (cache.CachedLLM) is asked for a
+    stored result first and given the result once it validated; raw text is never cached.
+
+    Inside cancel.cancel_scope(), a cancelled run raises cancel.Cancelled before the first call
+    and before every retry/repair call.
 
     No rule-based fallback in this function.
     """
-    # 1) Structured Outputs path (recommended for OpenAI)
-    if hasattr(llm, "complete_structured"):
-        # Expect llm.complete_structured to return a Pydantic model instance
-        return llm.complete_structured(system=system, user=user_json, model_cls=model_cls)
+    check_cancelled()
+    stats = default_repair_stats()
+    with span(f"llm:{model_cls.__name__}", kind="llm") as sp:
+        sink = current_item_sink()
+        # 1) Structured Outputs path (recommended for OpenAI)
+        if hasattr(llm, "complete_structured"):
+            counts = {"calls": 1}
+            cur_user = user_json
+            try:
+                for attempt in range(retries + 1):
+                    if attempt:
+                        check_cancelled()
+                        if sp is not None:
+                            sp.retries += 1
+                    try:
+                        if sink is not None and hasattr(llm, "complete_structured_stream"):
+                            out = llm.complete_structured_stream(
+                                system=system, user=cur_user, model_cls=model_cls, on_delta=_feeder(sink)
+                            )
+                        else:
+                            # Expect llm.complete_structured to return a Pydantic model instance
+                            out = llm.complete_structured(system=system, user=cur_user, model_cls=model_cls)
+                    except ValueError as e:
+                        _structured_failed(counts, attempt, retries, sp)
+                        cur_user = _retry_prompt(user_json, e)
+                        if attempt == retries:
+                            raise
+                        continue
+                    counts["recovered" if attempt else "first_pass_ok"] = 1
+                    return out
+            finally:
+                stats.record(model_cls.__name__, **counts)
 
-    # 2) JSON-mode path (valid JSON but not schema-guaranteed) + retries
-    last_err: Exception | None = None
-    cur_user = user_json
+        # 2) JSON-mode path (valid JSON but not schema-guaranteed) + targeted repair
+        hit = _cached_result(llm, system, user_json, model_cls, sink)
+        if hit is not None:
+            return hit
+        rep = _Repairer(model_cls, user_json)
+        cur_user = user_json
+        try:
+            for attempt in range(retries + 1):
+                if attempt:
+                    check_cancelled()
+                    if sp is not None:
+                        sp.retries += 1
+                if sink is not None and hasattr(llm, "complete_stream"):
+                    raw = llm.complete_stream(system=system, user=cur_user, on_delta=_feeder(sink))
+                else:
+                    raw = llm.complete(system=system, user=cur_user)
 
-    for _ in range(retries + 1):
-        raw = llm.complete(system=system, user=cur_user)
+                out = rep.check(raw)
+                if out is not None:
+                    _store_result(llm, system, user_json, model_cls, out)
+                    return out
+                if sp is not None:
+                    sp.validation_failures += 1
+                if attempt < retries:
+                    cur_user = rep.next_prompt()
+            raise rep.error()
+        finally:
+            stats.record(model_cls.__name__, **rep.counts)
 
-        if raw is None:
-            last_err = ValueError("LLM returned None. llm.complete() must return a JSON string.")
-        else:
+
+async def acomplete_and_validate(
+    llm: Any,
+    system: str,
+    user_json: str,
+    model_cls: Type[T],
+    retries: int = 2
+) -> T:
+    """
+    Async twin of complete_and_validate() for AsyncLLM implementations.
+    Same structured-first / JSON-mode-with-repair behavior.
+    """
+    check_cancelled()
+    stats = default_repair_stats()
+    with span(f"llm:{model_cls.__name__}", kind="llm") as sp:
+        sink = current_item_sink()
+        if hasattr(llm, "complete_structured"):
+            counts = {"calls": 1}
+            cur_user = user_json
             try:
-                data = loads_json(raw)
-                return model_cls.model_validate(data)
-            except Exception as e:
-                last_err = e
-
-        cur_user = (
-            user_json
-            + "\n\n"
-            + f"IMPORTANT: Your previous output was invalid. Error: {last_err}. "
-              "Return JSON ONLY that matches the required schema. No markdown, no commentary."
-        )
-
-    raise last_err if last_err else RuntimeError("Unknown LLM validation error")
+                for attempt in range(retries + 1):
+                    if attempt:
+                        check_cancelled()
+                        if sp is not None:
+                            sp.retries += 1
+                    try:
+                        if sink is not None and hasattr(llm, "complete_structured_stream"):
+                            out = await llm.complete_structured_stream(
+                                system=system, user=cur_user, model_cls=model_cls, on_delta=_feeder(sink)
+                            )
+                        else:
+                            out = await llm.complete_structured(system=system, user=cur_user, model_cls=model_cls)
+                    except ValueError as e:
+                        _structured_failed(counts, attempt, retries, sp)
+                        cur_user = _retry_prompt(user_json, e)
+                        if attempt == retries:
+                            raise
+                        continue
+                    counts["recovered" if attempt else "first_pass_ok"] = 1
+                    return out
+            finally:
+                stats.record(model_cls.__name__, **counts)
+
+        hit = _cached_result(llm, system, user_json, model_cls, sink)
+        if hit is not None:
+            return hit
+        rep = _Repairer(model_cls, user_json)
+        cur_user = user_json
+        try:
+            for attempt in range(retries + 1):
+                if attempt:
+                    check_cancelled()
+                    if sp is not None:
+                        sp.retries += 1
+                if sink is not None and hasattr(llm, "complete_stream"):
+                    raw = await llm.complete_stream(system=system, user=cur_user, on_delta=_feeder(sink))
+                else:
+                    raw = await llm.complete(system=system, user=cur_user)
+
+                out = rep.check(raw)
+                if out is not None:
+                    _store_result(llm, system, user_json, model_cls, out)
+                    return out
+                if sp is not None:
+                    sp.validation_failures += 1
+                if attempt < retries:
+                    cur_user = rep.next_prompt()
+            raise rep.error()
+        finally:
+            stats.record(model_cls.__name__, **rep.counts)
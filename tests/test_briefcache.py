@@ -0,0 +1,17 @@
+from briefcache import content_key
+from schemas import DecisionRequest
+
+
+def _key(narrative: str, title: str = "Move?") -> str:
+    return content_key(DecisionRequest(title=title, narrative=narrative))
+
+
+def test_content_key_keeps_word_order():
+    assert _key("Fly from Boston to Denver.") != _key("Fly from Denver to Boston.")
+    assert _key("Budget is 3.5k. Rent is 2k.") != _key("Budget is 2k. Rent is 3.5k.")
+
+
+def test_content_key_ignores_sentence_order_and_formatting():
+    a = _key("The offer pays 120k. My family lives in Boston!")
+    assert _key("my family lives   in Boston.\nThe offer pays 120k") == a
+    assert _key("The offer pays 120k. My family doesn't live in Boston!") != a
@@ -0,0 +1,33 @@
+import pytest
+
+from cache import ResponseCache, cached_llm
+from schemas import QuestionerOutput
+from stub_llm import StubJSONLLM
+from utils import complete_and_validate
+
+SYSTEM = "You are the Questioner."
+USER = '{"question": "Should I move to Denver?"}'
+
+
+def test_invalid_json_reply_is_not_cached():
+    inner = StubJSONLLM(latency=0.0, invalid_json_rate=1.0, seed=1)
+    cache = ResponseCache(path=None)
+    llm = cached_llm(inner, cache)
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            complete_and_validate(llm, SYSTEM, USER, QuestionerOutput, retries=0)
+    assert inner.calls == 2
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_valid_reply_is_served_from_cache():
+    inner = StubJSONLLM(latency=0.0, seed=1)
+    cache = ResponseCache(path=None)
+    llm = cached_llm(inner, cache)
+
+    first = complete_and_validate(llm, SYSTEM, USER, QuestionerOutput)
+    calls = inner.calls
+    second = complete_and_validate(llm, SYSTEM, USER, QuestionerOutput)
+    assert inner.calls == calls
+    assert second == first
@@ -0,0 +1,25 @@
+from coalesce import request_fingerprint
+from graph import DictMemo
+from schemas import DecisionRequest
+from stages import MVP_GRAPH
+
+REQ = DecisionRequest(title="Relocate?", narrative="Offer in Denver, family in Boston.")
+
+
+def _key(**mode):
+    return request_fingerprint(REQ, None, "stub", **mode)
+
+
+def test_fingerprint_depends_on_graph():
+    default = _key()
+    assert _key(graph=MVP_GRAPH) != default
+    assert _key(graph=MVP_GRAPH.without("critic")) != _key(graph=MVP_GRAPH)
+    assert _key(graph=MVP_GRAPH.configure("critic", timeout_s=60)) != _key(graph=MVP_GRAPH)
+    assert _key(graph=MVP_GRAPH.configure("critic", retries=1)) == _key(graph=MVP_GRAPH.configure("critic", retries=1))
+
+
+def test_fingerprint_depends_on_memo():
+    memo = DictMemo()
+    assert _key(memo=memo) == _key(memo=memo)
+    assert _key(memo=memo) != _key(memo=DictMemo())
+    assert _key(memo=memo) != _key()
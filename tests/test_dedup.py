@@ -0,0 +1,20 @@
+from dedup import dedupe_buckets
+from schemas import Item, Provenance
+
+
+def _item(text: str, rationale: str | None = None) -> Item:
+    return Item(type="alternative", text=text, rationale=rationale, provenance=Provenance(agent="generators"))
+
+
+def test_merged_rationale_does_not_touch_input_items():
+    first = _item("Rent an apartment near the office")
+    dup = _item("Rent an apartment near the office", rationale="shorter commute")
+    other = _item("Buy a house in the suburbs")
+    drafts = {"alternatives": [first, other], "preferences": [dup]}
+
+    kept, removed = dedupe_buckets(drafts)
+
+    assert first.rationale is None
+    assert kept["alternatives"][0].rationale == "shorter commute"
+    assert kept["alternatives"][1] is other
+    assert kept["preferences"] == [] and len(removed) == 1
@@ -0,0 +1,47 @@
+import asyncio
+import types
+
+import pytest
+
+from llm import AsyncOpenAILLM, OpenAILLM
+from ratelimit import RateLimiter
+
+TPM = 100_000
+
+
+class _Down(RuntimeError):
+    pass
+
+
+def _fail(*args, **kwargs):
+    raise _Down("connection reset")
+
+
+async def _afail(*args, **kwargs):
+    raise _Down("connection reset")
+
+
+def _client(fn):
+    return types.SimpleNamespace(responses=types.SimpleNamespace(create=fn, parse=fn, stream=fn))
+
+
+def _available(limiter: RateLimiter) -> float:
+    # TPM budget left in the bucket (not refilled here, so a missing refund shows)
+    return limiter._tok.tokens
+
+
+def test_failed_call_refunds_reserved_tokens():
+    limiter = RateLimiter(tpm=TPM)
+    llm = OpenAILLM(model="m", limiter=limiter, client=_client(_fail))
+    for call in (llm.complete, lambda s, u: llm.complete_stream(s, u, on_delta=print)):
+        with pytest.raises(_Down):
+            call("system " * 200, "user " * 200)
+        assert _available(limiter) == pytest.approx(TPM, abs=1)
+
+
+def test_failed_async_call_refunds_reserved_tokens():
+    limiter = RateLimiter(tpm=TPM)
+    llm = AsyncOpenAILLM(model="m", limiter=limiter, client=_client(_afail))
+    with pytest.raises(_Down):
+        asyncio.run(llm.complete("system " * 200, "user " * 200))
+    assert _available(limiter) == pytest.approx(TPM, abs=1)